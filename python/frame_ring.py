@@ -0,0 +1,180 @@
+import ctypes
+import threading
+import time
+import numpy as np
+
+
+class frame_ring(object):
+    """
+    Preallocated ring of uint16 frame slots shared by the libuvc callback and
+    the consumers. push_pointer() copies libuvc's buffer into the next slot with
+    one memmove, so nothing handed out by the ring is ever backed by memory
+    libuvc reuses. When the next()/drain() consumer falls behind the oldest
+    slot is overwritten and counted in `dropped`. `dropped` and `pending`
+    describe that consumer only, frame_cursor readers keep their own counts
+    and a ring read only through cursors never reports drops.
+    """
+
+    def __init__(self, capacity, height, width):
+        self.__capacity = capacity
+        self.__height = height
+        self.__width = width
+        self.__frame_bytes = 2 * height * width
+        self._allocate(capacity, height, width)
+        # sequence number of the next frame to be read by next()/drain()
+        self.__read_count = 0
+        self.__dropped = 0
+        # set by the first next()/drain(), until then nobody misses a frame
+        self.__reading = False
+        self.__cond = threading.Condition()
+
+    def _allocate(self, capacity, height, width):
+        self._frames = np.zeros((capacity, height, width), dtype=np.uint16)
+        self._sequence = np.zeros(capacity, dtype=np.int64)
+        self._timestamps = np.zeros(capacity, dtype=np.float64)
+        self._numbers = np.zeros(capacity, dtype=np.int64)
+        self._flags = np.zeros(capacity, dtype=np.int64)
+        # single element arrays so subclasses can place them in shared memory
+        self._write_count = np.zeros(1, dtype=np.int64)
+
+    @property
+    def capacity(self):
+        return self.__capacity
+
+    @property
+    def shape(self):
+        return (self.__height, self.__width)
+
+    @property
+    def frame_bytes(self):
+        return self.__frame_bytes
+
+    @property
+    def write_count(self):
+        return int(self._write_count[0])
+
+    @property
+    def dropped(self):
+        return self.__dropped
+
+    @property
+    def pending(self):
+        return self.write_count - self.__read_count
+
+    # producer side
+    def push_pointer(self, pointer, nbytes, timestamp=None, number=None,
+                     flags=0):
+        """
+        Copy a raw Y16 buffer (ctypes pointer or address) into the ring.
+        `number` is the frame number handed back to consumers, the ring's
+        own write count when omitted. `flags` are stored with the frame and
+        returned by drain().
+        """
+        if nbytes != self.__frame_bytes:
+            return False
+        with self.__cond:
+            slot = self._claim_slot()
+            ctypes.memmove(self._frames[slot].ctypes.data, pointer, nbytes)
+            self._publish(slot, timestamp, number, flags)
+        return True
+
+    def push(self, frame, timestamp=None, number=None, flags=0):
+        """Copy an ndarray frame into the ring."""
+        if frame.shape != self.shape:
+            return False
+        with self.__cond:
+            slot = self._claim_slot()
+            np.copyto(self._frames[slot], frame, casting='unsafe')
+            self._publish(slot, timestamp, number, flags)
+        return True
+
+    def _claim_slot(self):
+        count = self.write_count
+        if count - self.__read_count >= self.__capacity:
+            # the unread frame in this slot is about to be overwritten
+            self.__read_count += 1
+            if self.__reading:
+                self.__dropped += 1
+        slot = count % self.__capacity
+        # mark the slot as being written so cursor readers can detect it
+        self._sequence[slot] = -1
+        return slot
+
+    def _publish(self, slot, timestamp, number, flags):
+        count = self.write_count
+        self._timestamps[slot] = time.time() if timestamp is None else timestamp
+        self._numbers[slot] = count if number is None else number
+        self._flags[slot] = flags
+        self._sequence[slot] = count
+        self._write_count[0] = count + 1
+        self.__cond.notify_all()
+
+    # consumer side
+    def wait_for_write(self, count, timeout=None):
+        """Wait until frame number `count` has been written."""
+        with self.__cond:
+            return self.__cond.wait_for(
+                lambda: self.write_count > count, timeout)
+
+    def view(self, count):
+        """
+        Slot holding the `count`th frame written as (frame view, number,
+        timestamp). The view is only valid while is_current(count) is True.
+        """
+        slot = count % self.__capacity
+        return (self._frames[slot], int(self._numbers[slot]),
+                float(self._timestamps[slot]))
+
+    def is_current(self, count):
+        return self._sequence[count % self.__capacity] == count
+
+    def _copy_out(self, count, out):
+        slot = count % self.__capacity
+        if out is None:
+            out = self._frames[slot].copy()
+        else:
+            np.copyto(out, self._frames[slot])
+        return out, int(self._numbers[slot]), float(self._timestamps[slot])
+
+    def latest(self, out=None):
+        """
+        Newest frame as (frame, number, timestamp) without consuming it.
+        Returns None before the first frame arrives.
+        """
+        with self.__cond:
+            count = self.write_count
+            if count == 0:
+                return None
+            return self._copy_out(count - 1, out)
+
+    def next(self, timeout=None, out=None):
+        """
+        Oldest unread frame as (frame, number, timestamp), waiting up to
+        `timeout` seconds for one to arrive. Returns None on timeout.
+        """
+        with self.__cond:
+            self.__reading = True
+            if not self.__cond.wait_for(lambda: self.pending > 0, timeout):
+                return None
+            result = self._copy_out(self.__read_count, out)
+            self.__read_count += 1
+            return result
+
+    def drain(self):
+        """All unread frames as (frames, numbers, timestamps, flags) arrays."""
+        with self.__cond:
+            self.__reading = True
+            counts = np.arange(self.__read_count, self.write_count)
+            slots = counts % self.__capacity
+            self.__read_count = self.write_count
+            # fancy indexing copies, so the result survives later pushes
+            return (self._frames[slots], self._numbers[slots],
+                    self._timestamps[slots], self._flags[slots])
+
+
+def frame_timestamp(uvc_frame):
+    """Capture time of a libuvc frame in seconds since the epoch."""
+    stamp = uvc_frame.capture_time
+    if stamp.tv_sec == 0 and stamp.tv_usec == 0:
+        return time.time()
+    return stamp.tv_sec + stamp.tv_usec * 1e-6
@@ -0,0 +1,109 @@
+import cv2
+import numpy as np
+
+MODES = ('minmax', 'fixed', 'percentile', 'equalize')
+
+
+def stretch(frame, low, high, out=None, scratch=None):
+    """
+    Linearly map raw values low..high to 0..255 into single-channel uint8
+    `out`, as floor((v - low) * 65535 / 256 / (high - low)) for values
+    clipped to low..high, the levels of normalizing to 16 bits and keeping
+    the high byte. `frame` is never written to; `scratch` is an optional
+    float64 buffer of the same shape for the intermediate values.
+    """
+    if out is None:
+        out = np.empty(frame.shape, np.uint8)
+    if scratch is None:
+        scratch = np.empty(frame.shape, np.float64)
+    low = float(low)
+    high = max(float(high), low + 1.0)
+    np.clip(frame, low, high, out=scratch)
+    np.subtract(scratch, low, out=scratch)
+    np.multiply(scratch, 65535.0 / 256.0 / (high - low), out=scratch)
+    # floor explicitly, cv2's saturating casts round half to even
+    np.floor(scratch, out=scratch)
+    np.copyto(out, scratch, casting='unsafe')
+    return out
+
+
+class tone_mapper(object):
+    """
+    Converts raw radiometric frames to 8-bit for display and colour maps.
+    Output and scratch buffers are reused between frames. With smoothing
+    between 0 and 1 the display window follows the scene gradually instead of
+    jumping every frame.
+
+    minmax:     window is the frame's min and max
+    fixed:      window is `window_k` = (low, high) in Kelvin
+    percentile: window is the given lower and upper percentiles
+    equalize:   min/max window followed by histogram equalization
+    """
+
+    def __init__(self, mode='minmax', window_k=(273.15, 373.15),
+                 percentiles=(1.0, 99.0), smoothing=0.0):
+        self.mode = mode
+        self.window_k = window_k
+        self.percentiles = percentiles
+        self.smoothing = smoothing
+        self.__window = None
+        self.__shape = None
+        self.__out = None
+        self.__scratch = None
+        self.__flat = None
+
+    @property
+    def mode(self):
+        return self.__mode
+
+    @mode.setter
+    def mode(self, mode):
+        if mode not in MODES:
+            raise ValueError('Unknown tone mapping mode: ' + str(mode))
+        self.__mode = mode
+        self.__window = None
+
+    @property
+    def window(self):
+        """Current (low, high) display window in raw units."""
+        return self.__window
+
+    def reset(self):
+        self.__window = None
+
+    def _buffers(self, shape):
+        if self.__shape != shape:
+            self.__shape = shape
+            self.__out = np.empty(shape, np.uint8)
+            self.__scratch = np.empty(shape, np.float64)
+            self.__flat = np.empty(int(np.prod(shape)), np.uint16)
+
+    def _target_window(self, frame):
+        if self.__mode == 'fixed':
+            # raw values are in centikelvin
+            return self.window_k[0] * 100.0, self.window_k[1] * 100.0
+        if self.__mode == 'percentile':
+            flat = self.__flat
+            np.copyto(flat, frame.reshape(-1))
+            last = len(flat) - 1
+            lo = int(round(self.percentiles[0] / 100.0 * last))
+            hi = int(round(self.percentiles[1] / 100.0 * last))
+            flat.partition((lo, hi))
+            return float(flat[lo]), float(flat[hi])
+        low, high, _, _ = cv2.minMaxLoc(frame)
+        return low, high
+
+    def __call__(self, frame, out=None):
+        self._buffers(frame.shape)
+        if out is None:
+            out = self.__out
+        low, high = self._target_window(frame)
+        if self.__window is not None and self.smoothing > 0:
+            keep = self.smoothing
+            low = keep * self.__window[0] + (1.0 - keep) * low
+            high = keep * self.__window[1] + (1.0 - keep) * high
+        self.__window = (low, high)
+        stretch(frame, low, high, out, self.__scratch)
+        if self.__mode == 'equalize':
+            cv2.equalizeHist(out, out)
+        return out
@@ -5,35 +5,19 @@ from uvctypes import *
 import time
 import cv2
 import numpy as np
-try:
-  from queue import Queue
-except ImportError:
-  from Queue import Queue
 import platform
+from frame_ring import frame_ring, frame_timestamp
+import tone_map
 
-BUF_SIZE = 2
-q = Queue(BUF_SIZE)
+BUF_SIZE = 8
+ring = None
 
 def py_frame_callback(frame, userptr):
-
-  array_pointer = cast(frame.contents.data, POINTER(c_uint16 * (frame.contents.width * frame.contents.height)))
-  data = np.frombuffer(
-    array_pointer.contents, dtype=np.dtype(np.uint16)
-  ).reshape(
-    frame.contents.height, frame.contents.width
-  ) # no copy
-
-  # data = np.fromiter(
-  #   frame.contents.data, dtype=np.dtype(np.uint8), count=frame.contents.data_bytes
-  # ).reshape(
-  #   frame.contents.height, frame.contents.width, 2
-  # ) # copy
-
-  if frame.contents.data_bytes != (2 * frame.contents.width * frame.contents.height):
+  # libuvc reuses frame.data after we return, so copy it into a ring slot
+  if (frame.contents.height, frame.contents.width) != ring.shape:
     return
 
-  if not q.full():
-    q.put(data)
+  ring.push_pointer(frame.contents.data, frame.contents.data_bytes, frame_timestamp(frame.contents))
 
 PTR_PY_FRAME_CALLBACK = CFUNCTYPE(None, POINTER(uvc_frame), c_void_p)(py_frame_callback)
 
@@ -43,10 +27,11 @@ def ktof(val):
 def ktoc(val):
   return (val - 27315) / 100.0
 
-def raw_to_8bit(data):
-  cv2.normalize(data, data, 0, 65535, cv2.NORM_MINMAX)
-  np.right_shift(data, 8, data)
-  return cv2.cvtColor(np.uint8(data), cv2.COLOR_GRAY2RGB)
+def raw_to_8bit(data, out=None, scratch=None):
+  # min/max stretch into the caller's single-channel buffers, the raw values
+  # are left untouched for the temperature readout
+  minVal, maxVal, _, _ = cv2.minMaxLoc(data)
+  return tone_map.stretch(data, minVal, maxVal, out, scratch)
 
 def display_temperature(img, val_k, loc, color):
   val = ktof(val_k)
@@ -56,6 +41,7 @@ def display_temperature(img, val_k, loc, color):
   cv2.line(img, (x, y - 2), (x, y + 2), color, 1)
 
 def main():
+  global ring
   ctx = POINTER(uvc_context)()
   dev = POINTER(uvc_device)()
   devh = POINTER(uvc_device_handle)()
@@ -88,6 +74,8 @@ def main():
         print("device does not support Y16")
         exit(1)
 
+      ring = frame_ring(BUF_SIZE, frame_formats[0].wHeight, frame_formats[0].wWidth)
+
       libuvc.uvc_get_stream_ctrl_format_size(devh, byref(ctrl), UVC_FRAME_FORMAT_Y16,
         frame_formats[0].wWidth, frame_formats[0].wHeight, int(1e7 / frame_formats[0].dwDefaultFrameInterval)
       )
@@ -98,13 +86,19 @@ def main():
         exit(1)
 
       try:
+        buf = None
+        # display buffers, reused for every frame
+        data = np.empty((480, 640), np.uint16)
+        img = np.empty((480, 640), np.uint8)
+        scratch = np.empty((480, 640), np.float64)
         while True:
-          data = q.get(True, 500)
-          if data is None:
+          result = ring.next(500, buf)
+          if result is None:
             break
-          data = cv2.resize(data[:,:], (640, 480))
+          buf = result[0]
+          cv2.resize(buf, (640, 480), dst=data)
           minVal, maxVal, minLoc, maxLoc = cv2.minMaxLoc(data)
-          img = raw_to_8bit(data)
+          raw_to_8bit(data, img, scratch)
           display_temperature(img, minVal, minLoc, (255, 0, 0))
           display_temperature(img, maxVal, maxLoc, (0, 0, 255))
           cv2.imshow('Lepton Radiometry', img)
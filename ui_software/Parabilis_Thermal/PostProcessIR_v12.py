@@ -2,7 +2,11 @@
 # Author: Karl Parks, 2018
 # Python 3 and PyQt5 Implementation
 import colors
+import radiometry
 import save_as
+import recording_index
+import roi
+from playback import frame_prefetcher, playback_clock, SPEEDS
 from heat_data import heat_data
 import warnings
 import re
@@ -27,8 +31,8 @@ from PyQt5 import QtCore, QtGui, uic
 from PyQt5.QtGui import (QImage, QPixmap, QTextCursor, QIntValidator)
 from PyQt5.QtCore import (QCoreApplication, QThread,
                           QThreadPool, pyqtSignal, pyqtSlot, Qt, QTimer, QDateTime)
-from PyQt5.QtWidgets import (QWidget, QMainWindow, QApplication, QLabel, QPushButton, QVBoxLayout, QButtonGroup,
-                             QGridLayout, QSizePolicy, QMessageBox, QFileDialog, QSlider, QComboBox, QProgressDialog)
+from PyQt5.QtWidgets import (QWidget, QMainWindow, QApplication, QLabel, QPushButton, QVBoxLayout, QHBoxLayout, QButtonGroup,
+                             QGridLayout, QSizePolicy, QMessageBox, QFileDialog, QSlider, QComboBox, QProgressDialog, QProgressBar)
 import sys
 print(sys.version)
 
@@ -49,40 +53,63 @@ warnings.filterwarnings("ignore")
 toggleUnitState = 'C'
 
 current_frame = 1
-framerate = 1  # (1/9 frames per second), do not adjust
-timerHz = 115  # ms 1/8.7 = 0.1149 sec, decrease to increase speed
 usedOnce = True
 start_frame = 1
 stop_frame = 2
 last_frame = 3
 
 
-def cktof(val):
-    return round(((1.8 * cktoc(val) + 32.0)), 2)
-
+def get_temp_with_unit(val, unit):
+    return radiometry.format_temp(val, unit)
 
-def cktoc(val):
-    return round(((val - 27315) / 100.0), 2)
 
+class index_cancelled(Exception):
+    pass
 
-def cktok(val):
-    return round((val / 100.0), 2)
 
+class index_builder(QThread):
+    """
+    Loads the index of a recording, building it first if needed, off the GUI
+    thread: building reads every frame. Emits progress(done, total) while
+    building and then built(index, stored), stored False when the index
+    could only be kept in memory, or failed(message). requestInterruption()
+    cancels a build at the next batch.
+    """
+    progress = pyqtSignal(int, int)
+    built = pyqtSignal(object, bool)
+    failed = pyqtSignal(str)
 
-def get_temp_with_unit(val, unit):
-    result = str(calc_temp(val, unit))
-    return result + ' ' + unit
+    def __init__(self, path, frames, parent=None):
+        QThread.__init__(self, parent)
+        self.path = path
+        self.frames = frames
 
+    def report(self, done, total):
+        if self.isInterruptionRequested():
+            raise index_cancelled()
+        self.progress.emit(done, total)
 
-def calc_temp(val, unit):
-    if unit == 'K':
-        return (cktok(val))
-    elif unit == 'C':
-        return (cktoc(val))
-    elif unit == 'F':
-        return (cktof(val))
-    else:
-        return 0
+    def run(self):
+        try:
+            try:
+                index = recording_index.open_index(
+                    self.path, self.frames, progress=self.report)
+                stored = True
+            except OSError:
+                # e.g. a read-only directory
+                data = heat_data(self.path)
+                try:
+                    index = recording_index.frame_index(
+                        *recording_index.compute(data, progress=self.report))
+                finally:
+                    data.close()
+                stored = False
+        except index_cancelled:
+            return
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.built.emit(index, stored)
 
 
 class Window(QMainWindow, Ui_MainWindow):
@@ -90,6 +117,14 @@ class Window(QMainWindow, Ui_MainWindow):
         QMainWindow.__init__(self)
         Ui_MainWindow.__init__(self)
         self.h5data = ""
+        self.index = None
+        # index_builder threads still running, the last one is current
+        self.indexBuilders = []
+        self.rois = None
+        self.prefetcher = None
+        self.clock = None
+        # frames the clock advanced by on its last tick, for prefetching
+        self.playStep = 1
         self.setupUi(self)
         self.initUI()
 
@@ -102,6 +137,44 @@ class Window(QMainWindow, Ui_MainWindow):
 
         self.dispLayout.addWidget(self.toolbar)
         self.dispLayout.addWidget(self.canvas)
+        # the axes and image are created once, frames only swap the pixels
+        self.ax = self.figure.add_subplot(111)
+        self.imageArtist = None
+        self.canvas.mpl_connect('motion_notify_event', self.hover)
+
+        # TIMELINE - min/mean/max of the whole recording, click to jump
+        self.timelineFigure = Figure(figsize=(5, 1.5))
+        self.timelineCanvas = FigureCanvas(self.timelineFigure)
+        self.timelineCanvas.mpl_connect(
+            'button_press_event', self.timeline_click)
+        self.timelineCanvas.mpl_connect('draw_event', self.timeline_drawn)
+        self.timelineCursor = None
+        self.timelineBackground = None
+        self.dispLayout.addWidget(self.timelineCanvas)
+        jumpLayout = QHBoxLayout()
+        self.btnHottest = QPushButton('Hottest Frame')
+        self.btnColdest = QPushButton('Coldest Frame')
+        self.btnNextEvent = QPushButton('Next Event')
+        self.btnHottest.clicked.connect(self.to_hottest_frame)
+        self.btnColdest.clicked.connect(self.to_coldest_frame)
+        self.btnNextEvent.clicked.connect(self.to_next_event)
+        for button in (self.btnHottest, self.btnColdest, self.btnNextEvent):
+            jumpLayout.addWidget(button)
+        self.speedBox = QComboBox()
+        self.speedBox.addItems(['{0:g}x'.format(speed) for speed in SPEEDS])
+        self.speedBox.setCurrentIndex(SPEEDS.index(1.0))
+        self.speedBox.currentIndexChanged.connect(self.set_speed)
+        jumpLayout.addWidget(self.speedBox)
+        # shown while the index of a new recording is built
+        self.indexProgress = QProgressBar()
+        self.indexProgress.setFormat('Indexing %p%')
+        self.indexProgress.hide()
+        jumpLayout.addWidget(self.indexProgress)
+        self.dispLayout.addLayout(jumpLayout)
+        # statistics of the regions stored with the recording
+        self.roiLabel = QLabel('')
+        self.roiLabel.setWordWrap(True)
+        self.dispLayout.addWidget(self.roiLabel)
 
         # BUTTONS
         self.btnFileSelect.clicked.connect(self.dialog_file_select)
@@ -152,10 +225,11 @@ class Window(QMainWindow, Ui_MainWindow):
         # SLIDER
         self.sl.valueChanged.connect(self.slValueChange)
 
-        # TIMER - used when playing video
+        # TIMER - used when playing video, rearmed for every frame by the
+        # playback clock
         self.timer = QTimer(self)
-        self.timer.setInterval(timerHz)
-        self.timer.timeout.connect(self.playVid5)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.play_tick)
 
         if (len(sys.argv) > 1) and (usedOnce == True):
             self.command_line_file_select()
@@ -168,6 +242,10 @@ class Window(QMainWindow, Ui_MainWindow):
         self.btnPrevFrame.setEnabled(bl)
         self.btnPlay.setEnabled(bl)
         self.btnPause.setEnabled(bl)
+        self.btnHottest.setEnabled(bl)
+        self.btnColdest.setEnabled(bl)
+        self.btnNextEvent.setEnabled(bl)
+        self.speedBox.setEnabled(bl)
 
         # BUTTONS - saving files
         self.btnSaveCsvs.setEnabled(bl)
@@ -247,7 +325,8 @@ class Window(QMainWindow, Ui_MainWindow):
     def save_avi(self):
         savepath = self.dlg_save_multi('avi')
         save_as.to_avi(savepath, self.h5data,
-                       colorMapType, start_frame, stop_frame)
+                       colorMapType, start_frame, stop_frame,
+                       unit=toggleUnitState)
 
     # saving single frame
     def dlg_save_single(self, frame, ext: str):
@@ -264,35 +343,42 @@ class Window(QMainWindow, Ui_MainWindow):
 
     def save_csv(self):
         savepath = self.dlg_save_single(current_frame, 'csv')
-        saveframe = self.h5data.frame(current_frame, 640, 480)
+        # sensor resolution, as the frame is displayed
+        saveframe = self.h5data.frame(current_frame, 0, 0)
         save_as.to_csv(savepath, saveframe)
 
     def save_tiff(self):
         savepath = self.dlg_save_single(current_frame, 'tif')
-        saveframe = self.h5data.frame(current_frame, 640, 480)
+        saveframe = self.h5data.frame(current_frame, 0, 0)
         save_as.to_tiff(savepath, saveframe, colorMapType)
 
     def save_png(self):
         savepath = self.dlg_save_single(current_frame, 'png')
-        saveframe = self.h5data.frame(current_frame, 640, 480)
+        saveframe = self.h5data.frame(current_frame, 0, 0)
         save_as.to_png(savepath, saveframe, colorMapType)
 
     # color functions (on radiobutton click)
     def to_ironblack(self):
         global colorMapType
         colorMapType = 'ironblack'
+        if self.prefetcher is not None:
+            self.prefetcher.colormap = colorMapType
         self.renew_image()
         self.logger('Changed Color Map')
 
     def to_rainbow(self):
         global colorMapType
         colorMapType = 'rainbow'
+        if self.prefetcher is not None:
+            self.prefetcher.colormap = colorMapType
         self.renew_image()
         self.logger('Changed Color Map')
 
     def to_grayscale(self):
         global colorMapType
         colorMapType = 'grayscale'
+        if self.prefetcher is not None:
+            self.prefetcher.colormap = colorMapType
         self.renew_image()
         self.logger('Changed Color Map')
 
@@ -300,18 +386,21 @@ class Window(QMainWindow, Ui_MainWindow):
     def in_Celsius(self):
         global toggleUnitState
         toggleUnitState = 'C'
+        self.draw_timeline()
         self.renew_image()
         self.logger('Display ' + str(toggleUnitState))
 
     def in_fahrenheit(self):
         global toggleUnitState
         toggleUnitState = 'F'
+        self.draw_timeline()
         self.renew_image()
         self.logger('Display ' + str(toggleUnitState))
 
     def in_Kelvin(self):
         global toggleUnitState
         toggleUnitState = 'K'
+        self.draw_timeline()
         self.renew_image()
         self.logger('Display ' + str(toggleUnitState))
 
@@ -319,26 +408,107 @@ class Window(QMainWindow, Ui_MainWindow):
     def slValueChange(self):
         global current_frame
         current_frame = self.sl.value()
+        if self.clock is not None and self.clock.playing:
+            # dragging the slider while playing continues from there
+            self.clock.seek_frame(current_frame)
         self.renew_image()
-        self.canvas.draw()
 
     def setSlider(self):
         self.sl.setMinimum(1)
         self.sl.setMaximum(last_frame)
         self.sl.setValue(1)
         self.sl.setTickPosition(QSlider.TicksBelow)
-        self.sl.setTickInterval(9)
+        # one tick per second of recording
+        self.sl.setTickInterval(max(1, int(round(self.clock.fps))))
         self.slStartF.setText('First Frame: 1')
         self.slMidF.setText('Mid Frame: ' + str(round(last_frame/2)))
         self.slEndF.setText('Last Frame: ' + str(last_frame))
         self.slStartT.setText('0 Seconds')
-        self.slMidT.setText(str(round(last_frame/(2*9), 1)) + ' Seconds')
-        self.slEndT.setText(str(round(last_frame/9, 1)) + ' Seconds')
+        self.slMidT.setText(
+            str(round(self.clock.time_of(max(1, round(last_frame/2))), 1))
+            + ' Seconds')
+        self.slEndT.setText(str(round(self.clock.duration, 1)) + ' Seconds')
+
+    # timeline and jumping to frames of interest
+    def draw_timeline(self):
+        self.timelineFigure.clear()
+        self.timelineCursor = None
+        self.timelineBackground = None
+        if self.index is None:
+            self.timelineCanvas.draw_idle()
+            return
+        ax = self.timelineFigure.add_subplot(111)
+        times = self.timelineTimes = self.index.times()
+        for name in ('max', 'mean', 'min'):
+            ax.plot(times, radiometry.convert(self.index[name], toggleUnitState),
+                    linewidth=0.8, label=name)
+        for frame, kind in self.index.events():
+            ax.axvline(times[frame - 1], color='gray', linewidth=0.5)
+        ax.set_xlim(times[0], max(times[-1], times[0] + 1e-3))
+        ax.set_xlabel('Seconds')
+        ax.set_ylabel('[' + toggleUnitState + ']')
+        ax.legend(loc='upper right', fontsize='x-small')
+        # animated: left out of full draws and blitted on its own
+        self.timelineCursor = ax.axvline(times[current_frame - 1], color='red',
+                                         animated=True)
+        self.timelineFigure.tight_layout()
+        self.timelineCanvas.draw_idle()
+
+    def timeline_drawn(self, event):
+        # keep the plot without the cursor to blit the cursor over it
+        if self.timelineCursor is not None:
+            self.timelineBackground = self.timelineCanvas.copy_from_bbox(
+                self.timelineFigure.bbox)
+            self.timelineCursor.axes.draw_artist(self.timelineCursor)
+
+    def move_timeline_cursor(self, frame):
+        if self.timelineCursor is None or self.timelineBackground is None:
+            return
+        t = self.timelineTimes[frame - 1]
+        self.timelineCursor.set_xdata([t, t])
+        self.timelineCanvas.restore_region(self.timelineBackground)
+        self.timelineCursor.axes.draw_artist(self.timelineCursor)
+        self.timelineCanvas.blit(self.timelineFigure.bbox)
+
+    def jump_to(self, frame):
+        if self.h5data == "":
+            return
+        self.pauseVideo()
+        self.sl.setValue(int(frame))
+        self.logger('Jumped to Frame: ' + str(current_frame))
+
+    def timeline_click(self, event):
+        if self.index is None or event.xdata is None:
+            return
+        frame = np.searchsorted(self.timelineTimes, event.xdata) + 1
+        self.jump_to(min(max(frame, 1), last_frame))
+
+    def to_hottest_frame(self):
+        if self.index is not None:
+            self.jump_to(self.index.hottest()[0])
+
+    def to_coldest_frame(self):
+        if self.index is not None:
+            self.jump_to(self.index.coldest()[0])
+
+    def to_next_event(self):
+        if self.index is None:
+            return
+        later = [(frame, kind) for frame, kind in self.index.events()
+                 if frame > current_frame]
+        if later:
+            self.logger('Event: ' + later[0][1])
+            self.jump_to(later[0][0])
+        else:
+            self.logger('No more events')
 
     # on hovering on the picture
     def grabTempValue(self, xMouse, yMouse):
-        frame = self.h5data.frame(current_frame, 640, 480)
-        return frame[yMouse, xMouse]
+        # the image is shown at sensor resolution, so are the coordinates
+        frame = self.h5data.frame(current_frame, 0, 0)
+        height, width = frame.shape
+        return frame[min(max(yMouse, 0), height - 1),
+                     min(max(xMouse, 0), width - 1)]
 
     def hover(self, event):
         if event.xdata == None:
@@ -365,16 +535,46 @@ class Window(QMainWindow, Ui_MainWindow):
             return
 
         global current_frame
-        current_frame = start_frame
+        if not start_frame <= current_frame < stop_frame:
+            current_frame = start_frame
+            self.sl.setValue(current_frame)
+        self.clock.seek_frame(current_frame)
+        self.clock.dropped = 0
+        self.clock.play(stop_frame)
 
-        self.logger('Playing video from Frame: ' + str(start_frame))
-        self.timer.start()
+        self.logger('Playing video from Frame: ' + str(current_frame) +
+                    ' at ' + self.speedBox.currentText())
+        self.timer.start(0)
 
-    def playVid5(self):
-        self.move_frame(1)
+    def play_tick(self):
+        # show whichever frame the clock says is due, skipping frames the
+        # display could not keep up with
+        global current_frame
+        frame, skipped = self.clock.tick()
+        self.playStep = skipped + 1
+        if frame != current_frame:
+            current_frame = frame
+            # slValueChange would seek the clock to this frame and lose the
+            # time played past it, only the user's drags may re-anchor it
+            self.sl.blockSignals(True)
+            self.sl.setValue(frame)
+            self.sl.blockSignals(False)
+            self.renew_image()
+        if self.clock.playing:
+            self.timer.start(int(self.clock.next_due() * 1000))
+        else:
+            self.logger('Stopped at Frame: ' + str(frame) + ', skipped ' +
+                        str(self.clock.dropped) + ' frames')
+
+    def set_speed(self, index):
+        if self.clock is not None:
+            self.clock.speed = SPEEDS[index]
 
     def pauseVideo(self):
         self.timer.stop()
+        if self.clock is not None:
+            self.clock.pause()
+        self.playStep = 1
         self.logger('Paused Video')
 
     def move_frame(self, val):
@@ -383,8 +583,8 @@ class Window(QMainWindow, Ui_MainWindow):
         if ((val < 0 and current_frame > 1)
                 or(val > 0 and current_frame < frame_to_stop)):
             current_frame += val
+            # the slider's valueChanged redraws the frame
             self.sl.setValue(current_frame)
-            self.renew_image()
             if current_frame == frame_to_stop:
                 self.pauseVideo()
         else:
@@ -399,36 +599,66 @@ class Window(QMainWindow, Ui_MainWindow):
         self.logger('Next Frame: ' + str(current_frame))
 
     # drawing images
+    def show_image(self, rgbImage):
+        artist = self.imageArtist
+        if artist is None or artist.get_array().shape != rgbImage.shape:
+            # first frame of a file: build the image and draw everything
+            self.ax.clear()
+            self.imageArtist = self.ax.imshow(
+                rgbImage, interpolation='nearest')
+            self.figure.tight_layout()
+            self.canvas.draw()
+        else:
+            # later frames: redraw only the image and blit it to the screen
+            artist.set_data(rgbImage)
+            self.ax.draw_artist(artist)
+            self.canvas.blit(self.ax.bbox)
+
     def renew_image(self):
+        if self.prefetcher is None:
+            # no recording open yet
+            return
         try:
-            if current_frame == 1:
-                self.figure.tight_layout()
-
             self.currentFrameDisp.setText(
                 'Current Frame: ' + str(current_frame))
 
-            frame = self.h5data.frame(current_frame, 640, 480)
-            minVal, maxVal, minLoc, maxLoc = cv2.minMaxLoc(frame)
+            frame, rgbImage = self.prefetcher.get(current_frame, self.playStep)
+            if self.index is not None:
+                # precomputed at sensor resolution, locations in sensor pixels
+                minVal = self.index['min'][current_frame - 1]
+                maxVal = self.index['max'][current_frame - 1]
+                minLoc = tuple(self.index['min_loc'][current_frame - 1])
+                maxLoc = tuple(self.index['max_loc'][current_frame - 1])
+            else:
+                minVal, maxVal, minLoc, maxLoc = cv2.minMaxLoc(frame)
             self.maxTempLabel.setText(
                 'Current Max Temp: ' + get_temp_with_unit(maxVal, toggleUnitState))
             self.maxTempLocLabel.setText('Max Temp Loc: ' + str(maxLoc))
             self.minTempLabel.setText(
                 'Current Min Temp: ' + get_temp_with_unit(minVal, toggleUnitState))
             self.minTempLocLabel.setText('Min Temp Loc: ' + str(minLoc))
+            self.show_roi_stats(frame)
 
-            img = colors.colorize(frame, colorMapType)
-            rgbImage = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-
-            self.ax = self.figure.add_subplot(111)
-            self.ax.clear()
-            self.cax = self.ax.imshow(rgbImage)
+            self.show_image(rgbImage)
 
             self.sl.setValue(current_frame)
+            self.move_timeline_cursor(current_frame)
             self.currentTimeLabel.setText(
-                'Current Time: ' + str(round(((current_frame-1)/9.00), 2)))
-            cid = self.canvas.mpl_connect('motion_notify_event', self.hover)
-        except:
-            pass
+                'Current Time: ' + str(round(self.clock.time_of(current_frame), 2)))
+        except (IndexError, KeyError, OSError, ValueError, cv2.error) as e:
+            self.logger('Could not show Frame ' + str(current_frame) + ': ' +
+                        str(e))
+
+    def show_roi_stats(self, frame):
+        if self.rois is None:
+            self.roiLabel.setText('')
+            return
+        stats = roi.in_unit(self.rois.compute(frame), toggleUnitState)
+        self.roiLabel.setText('\n'.join(
+            '{0}: min {1:.1f}, max {2:.1f}, mean {3:.1f}, std {4:.2f} {5}'
+            .format(name, stats['min'][i], stats['max'][i], stats['mean'][i],
+                    stats['std'][i], toggleUnitState)
+            for i, name in enumerate(self.rois.names)))
 
     def maxtemp(self):
         return self.maxTempLabel.text()[18:]
@@ -473,7 +703,7 @@ class Window(QMainWindow, Ui_MainWindow):
         dlg = QFileDialog()
         dlg.setDefaultSuffix('.HDF5')
         path, filter = dlg.getOpenFileName(
-            self, 'Open File', "", 'HDF5 (*.HDF5);; All Files (*)')
+            self, 'Open File', "", 'Recordings (*.HDF5 *.ptraw *.ptdelta);; All Files (*)')
         print(path)
         self.dispSelectedFile.setText(path)
         self.open_file(path)
@@ -489,9 +719,20 @@ class Window(QMainWindow, Ui_MainWindow):
             try:
                 self.enable_buttons(True)
                 self.dispSelectedFile.setText(path)
+                if self.prefetcher is not None:
+                    self.prefetcher.close()
+                if self.h5data != "":
+                    self.h5data.close()
                 self.h5data = heat_data(path)
+                self.prefetcher = frame_prefetcher(self.h5data, colorMapType)
+                self.clock = playback_clock(
+                    self.h5data.timestamps, self.h5data.last_frame)
+                self.clock.speed = SPEEDS[self.speedBox.currentIndex()]
+                self.imageArtist = None
                 current_frame = 1
                 last_frame = self.h5data.last_frame
+                self.open_index(path)
+                self.open_rois(path)
                 stop_frame = last_frame
                 self.renew_image()
                 self.setSlider()
@@ -502,6 +743,72 @@ class Window(QMainWindow, Ui_MainWindow):
             except:
                 self.logger('Please select .HDF5 File')
 
+    def open_rois(self, path):
+        regions = roi.load(path)
+        self.rois = roi.roi_set(regions, self.h5data.shape) \
+            if regions else None
+        if regions:
+            self.logger('Loaded ' + str(len(regions)) + ' regions of interest')
+
+    def enable_index_buttons(self, bl):
+        self.btnHottest.setEnabled(bl)
+        self.btnColdest.setEnabled(bl)
+        self.btnNextEvent.setEnabled(bl)
+
+    def open_index(self, path):
+        # built once per recording and kept in a sidecar file next to it;
+        # building reads the whole recording, so it runs on its own thread
+        # and the timeline appears when it is done
+        for builder in self.indexBuilders:
+            builder.requestInterruption()
+        self.index = None
+        self.draw_timeline()
+        self.enable_index_buttons(False)
+        builder = index_builder(path, last_frame, self)
+        builder.progress.connect(self.index_progress)
+        builder.built.connect(self.index_built)
+        builder.failed.connect(self.index_failed)
+        builder.finished.connect(self.index_finished)
+        self.indexBuilders.append(builder)
+        builder.start()
+
+    def current_builder(self):
+        # signals of builders for a recording no longer open are ignored
+        return self.indexBuilders and self.sender() is self.indexBuilders[-1]
+
+    def index_progress(self, done, total):
+        if self.current_builder():
+            self.indexProgress.setMaximum(max(total, 1))
+            self.indexProgress.setValue(done)
+            self.indexProgress.show()
+
+    def index_built(self, index, stored):
+        if not self.current_builder():
+            return
+        if not stored:
+            self.logger('Could not store the index, keeping it in memory')
+        self.index = index
+        self.indexProgress.hide()
+        self.draw_timeline()
+        self.enable_index_buttons(True)
+
+    def index_failed(self, message):
+        if self.current_builder():
+            self.indexProgress.hide()
+            self.logger('Could not index the recording: ' + message)
+
+    def index_finished(self):
+        builder = self.sender()
+        self.indexBuilders.remove(builder)
+        builder.deleteLater()
+
+    def closeEvent(self, event):
+        for builder in self.indexBuilders:
+            builder.requestInterruption()
+        for builder in self.indexBuilders:
+            builder.wait()
+        event.accept()
+
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
@@ -2,14 +2,21 @@
 # Author: Karl Parks, 2018
 
 from subprocess import call
+import signal
 import threading
-from multiprocessing import Queue
 from uvctypesParabilis_v2 import *
-import psutil
+from frame_ring import frame_timestamp
+from shared_frames import shared_frame_ring, frame_cursor
+from recorder import hdf5_recorder, triggered_recorder, file_extension
+from recording_schema import FLAG_FFC
+from preview import preview_renderer
+from frame_probe import frame_probe
+import roi
+import alarms
+import storage
 import time
 import h5py
 import numpy as np
-from tifffile import imsave
 import cv2
 import os.path
 import sys
@@ -20,6 +27,8 @@ from PyQt5.QtCore import (QCoreApplication, QThread,
                           QThreadPool, pyqtSignal, pyqtSlot, Qt, QTimer, QDateTime)
 from PyQt5 import QtCore, QtGui, uic
 import colors
+import radiometry
+from tone_map import tone_mapper
 
 print('Successful import of uic')  # often reinstallation of PyQt5 is required
 print('Loaded Packages and Starting IR Data...')
@@ -29,20 +38,43 @@ postScriptFileName = "PostProcessIR_v11.py"
 qtCreatorFile = join(dirname(__file__), "ir_v11.ui")  # Enter file here.
 Ui_MainWindow, QtBaseClass = uic.loadUiType(qtCreatorFile)
 
-BUF_SIZE = 2
-q = Queue(BUF_SIZE)
+BUF_SIZE = 8  # frames, roughly one second of Lepton video
+DISPLAY_FPS = 9  # preview rate cap, lower it on slow machines
+# frames captured this long after an FFC command are flagged in recordings
+FFC_SECONDS = 1.0
+ring = None
+deviceInfo = {}
+gainMode = 'HIGH'
+lastFfcTime = 0.0
+renderer = None
+probe = None
 colorMapType = 'ironblack'
+# regions of interest, read from ROI_FILE when the stream starts; their
+# statistics are computed for every frame by roiMonitor and the regions
+# are stored with each recording
+ROI_FILE = join(dirname(__file__), 'rois.json')
+regions = []
+roiMonitor = None
+# alarm rules, read from ALARM_FILE when the stream starts and evaluated on
+# every frame; events are logged into the recording
+ALARM_FILE = join(dirname(__file__), 'alarms.json')
+# a raised alarm triggers a recording through the pre-trigger buffer below
+ALARM_STARTS_RECORDING = False
+alarmEngine = None
+# while streaming, the last PRE_TRIGGER_SECONDS of frames are kept in memory;
+# the Trigger Recording button, SIGUSR1 or an alarm saves them together with
+# the POST_TRIGGER_SECONDS that follow
+PRE_TRIGGER_SECONDS = 10.0
+POST_TRIGGER_SECONDS = 10.0
+triggered = None
 
 
 def py_frame_callback(frame, userptr):
-    array_pointer = cast(frame.contents.data, POINTER(
-        c_uint16 * (frame.contents.width * frame.contents.height)))
-    data = np.frombuffer(
-        array_pointer.contents, dtype=np.dtype(np.uint16)).reshape(frame.contents.height, frame.contents.width)
-    if frame.contents.data_bytes != (2 * frame.contents.width * frame.contents.height):
+    # libuvc reuses frame.data once we return, so copy it into the ring now
+    if (frame.contents.height, frame.contents.width) != ring.shape:
         return
-    if not q.full():
-        q.put(data)
+    ring.push_pointer(frame.contents.data, frame.contents.data_bytes,
+                      frame_timestamp(frame.contents), frame.contents.sequence)
 
 
 PTR_PY_FRAME_CALLBACK = CFUNCTYPE(
@@ -51,6 +83,15 @@ PTR_PY_FRAME_CALLBACK = CFUNCTYPE(
 
 def startStream():
     global devh
+    global ring
+    global renderer
+    global probe
+    global regions
+    global roiMonitor
+    global alarmEngine
+    global triggered
+    global deviceInfo
+    global lastFfcTime
     ctx = POINTER(uvc_context)()
     dev = POINTER(uvc_device)()
     devh = POINTER(uvc_device_handle)()
@@ -77,12 +118,50 @@ def startStream():
 
             print_device_info(devh)
             print_device_formats(devh)
+            deviceInfo = lepton_info(devh)
 
             frame_formats = uvc_get_frame_formats_by_guid(
                 devh, VS_FMT_GUID_Y16)
             if len(frame_formats) == 0:
                 print("device does not support Y16")
                 exit(1)
+            deviceInfo['fps'] = 1e7 / frame_formats[0].dwDefaultFrameInterval
+
+            ring = shared_frame_ring(
+                BUF_SIZE, frame_formats[0].wHeight, frame_formats[0].wWidth)
+            renderer = preview_renderer(
+                ring, colorMapType, displayMapper, DISPLAY_FPS)
+            probe = frame_probe(ring, renderer.size)
+            rois = None
+            if os.path.exists(ROI_FILE):
+                regions = roi.read_file(ROI_FILE)
+                rois = roi.roi_set(regions, ring.shape)
+                print('Monitoring ' + str(len(regions)) + ' regions')
+            if os.path.exists(ALARM_FILE):
+                alarmEngine = alarms.alarm_engine(
+                    alarms.read_file(ALARM_FILE), rois,
+                    fps=deviceInfo['fps'])
+                alarmEngine.add_listener(logAlarm)
+                print('Watching ' + str(len(alarmEngine.rules)) +
+                      ' alarm rules')
+            if rois is not None or alarmEngine is not None:
+                roiMonitor = roi.roi_monitor(ring, rois)
+                if alarmEngine is not None:
+                    roiMonitor.add_listener(alarmEngine.on_frame)
+                roiMonitor.start()
+            triggered = triggered_recorder(
+                lambda: recordingPath('_trigger'), ring.shape,
+                PRE_TRIGGER_SECONDS, POST_TRIGGER_SECONDS,
+                fps=deviceInfo['fps'], layout=recordLayout,
+                compression=recordCompression,
+                attrs=dict(deviceInfo, gain_mode=gainMode), rois=regions)
+            triggered.start()
+            threading.Thread(target=triggerFrames, args=(frame_cursor(ring),),
+                             daemon=True).start()
+            budget.watch('triggered', triggered,
+                         os.path.dirname(os.path.abspath(recordingPath())),
+                         expected_rate=0)
+            print('Sharing frames as ' + ring.name)
 
             libuvc.uvc_get_stream_ctrl_format_size(devh, byref(ctrl), UVC_FRAME_FORMAT_Y16,
                                                    frame_formats[0].wWidth, frame_formats[0].wHeight, int(
@@ -100,6 +179,7 @@ def startStream():
             print("resetting settings to default")
             set_auto_ffc(devh)
             set_gain_high(devh)
+            lastFfcTime = time.time()
             print("current settings")
             print_shutter_info(devh)
 
@@ -114,11 +194,11 @@ toggleUnitState = 'F'
 
 
 def ktof(val):
-    return round(((1.8 * ktoc(val) + 32.0)), 2)
+    return round(float(radiometry.convert(val, 'F')), 2)
 
 
 def ktoc(val):
-    return round(((val - 27315) / 100.0), 2)
+    return round(float(radiometry.convert(val, 'C')), 2)
 
 
 def display_temperatureK(img, val_k, loc, color):
@@ -140,6 +220,25 @@ def display_temperatureC(img, val_k, loc, color):
 
 
 camState = 'not_recording'
+recorder = None
+recordThread = None
+# the recorder recordFrames switches to, and the threads closing the ones
+# it switched away from
+nextRecorder = None
+rotatedThreads = []
+# forecasts the recording time left from how fast the recordings grow and
+# compresses, rotates or stops them when space runs low (see storage.py)
+budget = storage.storage_budget()
+# 'stacked', the legacy one-dataset-per-frame 'image' layout, 'raw'
+# memory-mapped frames (see raw_recording.py) or 'delta' losslessly
+# compressed frames in a standalone container (see delta_codec.py)
+recordLayout = 'stacked'
+# None, 'gzip', 'lzf' or 'delta', the lossless codec of delta_codec.py; it
+# fits about two and a half to three times more recording time on the card
+# (less for a noisy scene)
+recordCompression = None
+# smoothing keeps the display range from flickering between frames
+displayMapper = tone_mapper('minmax', smoothing=0.5)
 tiff_frame = 1
 maxVal = 0
 minVal = 0
@@ -166,61 +265,130 @@ def startRec():
         print('Did Not Begin Recording')
 
 
-def getFrame():
+def recordingPath(suffix=''):
+    dateAndTime = str(QDateTime.currentDateTime().toString())
+    dateAndTime = dateAndTime.replace(" ", "_")
+    dateAndTime = dateAndTime.replace(":", "-")
+    stem = str(fileNamingFull + suffix + '_' + dateAndTime)
+    path = stem + file_extension(recordLayout)
+    # a rotation within the same second
+    part = 1
+    while os.path.exists(path):
+        part += 1
+        path = stem + '_' + str(part) + file_extension(recordLayout)
+    return path
+
+
+def expectedRate():
+    # bytes per second of the selected layout and compression until a
+    # recording has been measured
+    if ring is None:
+        # the camera has not been started yet, assume a Lepton 3.5
+        return storage.expected_rate((120, 160), 8.7, recordLayout,
+                                     recordCompression)
+    return storage.expected_rate(ring.shape, deviceInfo['fps'], recordLayout,
+                                 recordCompression)
+
+
+def newRecorder(path):
+    fileRecorder = hdf5_recorder(
+        path, ring.shape, layout=recordLayout, compression=recordCompression,
+        attrs=dict(deviceInfo, gain_mode=gainMode), rois=regions)
+    fileRecorder.start()
+    budget.watch('camera', fileRecorder, expected_rate=expectedRate())
+    return fileRecorder
+
+
+def ffcFlags(timestamp):
+    return FLAG_FFC if 0 <= timestamp - lastFfcTime < FFC_SECONDS else 0
+
+
+def recordFrames(cursor):
+    # every frame goes to the recorder from its own cursor, independent of
+    # how often the preview is drawn
     global tiff_frame
-    global maxVal
-    global minVal
-    data = q.get(True, 500)
-    if data is None:
-        print('No Data')
-    if camState == 'recording':
-        startRec.hdf5_file.create_dataset(('image'+str(tiff_frame)), data=data)
+    global recorder
+    global nextRecorder
+    buffer = np.empty(ring.shape, np.uint16)
+    while camState == 'recording':
+        result = cursor.next(0.5, buffer)
+        if result is None:
+            continue
+        frame, number, timestamp = result
+        if nextRecorder is not None:
+            # switch files between two frames
+            finishing, recorder, nextRecorder = recorder, nextRecorder, None
+            thread = threading.Thread(target=finishing.stop, daemon=True)
+            thread.start()
+            rotatedThreads.append(thread)
+        # copies into the recorder's buffer, the disk write happens elsewhere
+        try:
+            recorder.submit(frame, number, timestamp, ffcFlags(timestamp))
+        except Exception as e:
+            # the writer failed, displayRecorderError stops the recording
+            print('Recording Failed: ' + str(e))
+            return
         tiff_frame += 1
-    minVal, maxVal, minLoc, maxLoc = cv2.minMaxLoc(data)
-    img = colors.colorize(data, colorMapType)
-    return img
 
 
-def get_temp_with_unit(val, unit):
-    result = str(calc_temp(val, unit))
-    return result + ' ' + unit
+def triggerFrames(cursor):
+    # feeds the pre-trigger buffer for as long as the stream runs
+    buffer = np.empty(ring.shape, np.uint16)
+    while triggered.running:
+        result = cursor.next(0.5, buffer)
+        if result is None:
+            continue
+        frame, number, timestamp = result
+        triggered.submit(frame, number, timestamp, ffcFlags(timestamp))
+
+
+def triggerRecording(source):
+    if triggered is not None:
+        triggered.trigger(
+            {'time': time.time(), 'kind': 'trigger', 'source': source})
 
 
-def calc_temp(val, unit):
-    if unit == 'K':
-        return (cktok(val))
-    elif unit == 'C':
-        return (cktoc(val))
-    elif unit == 'F':
-        return (cktof(val))
+def logAlarm(event):
+    # called on the ROI monitor thread for every raised or cleared alarm
+    if camState == 'recording':
+        recorder.log_event(event)
+    if triggered is None:
+        return
+    if ALARM_STARTS_RECORDING and event['state'] == 'raised':
+        triggered.trigger(event)
     else:
-        return 0
+        triggered.log_event(event)
+
+
+def getFrame():
+    global maxVal
+    global minVal
+    renderer.colormap = colorMapType
+    img = renderer.render(0.5)
+    if img is None:
+        return None
+    minVal, maxVal = renderer.min_max
+    return img
+
+
+def get_temp_with_unit(val, unit):
+    return radiometry.format_temp(val, unit)
 
 
 def readTemp(unit, state):
     if state == 'max':
-        if unit == 'F':
-            return (str(ktof(maxVal)) + ' ' + unit)
-        elif unit == 'C':
-            return (str(ktoc(maxVal)) + ' ' + unit)
-        else:
-            print('What are you asking for?')
+        val = maxVal
     elif state == 'min':
-        if unit == 'F':
-            return (str(ktof(minVal)) + ' ' + unit)
-        elif unit == 'C':
-            return (str(ktoc(minVal)) + ' ' + unit)
-        else:
-            print('What are you asking for?')
+        val = minVal
     elif state == 'none':
-        if unit == 'F':
-            return (str(ktof(cursorVal)) + ' ' + unit)
-        elif unit == 'C':
-            return (str(ktoc(cursorVal)) + ' ' + unit)
-        else:
-            print('What are you asking for?')
+        val = cursorVal
     else:
         print('What are you asking for?')
+        return
+    if unit not in radiometry.UNITS:
+        print('What are you asking for?')
+        return
+    return get_temp_with_unit(val, unit)
 
 
 def updateMaxTempLabel():
@@ -237,13 +405,15 @@ class MyThread(QThread):
 
     def run(self):
         print('Start Stream')
+        # one QImage over the renderer's RGB buffer, the GUI copies it into
+        # a pixmap and acknowledges before the buffer is drawn into again
+        width, height = renderer.size
+        image = QImage(renderer.rgb.data, width, height, 3 * width,
+                       QImage.Format_RGB888)
         while True:
-            frame = getFrame()
-            rgbImage = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            convertToQtFormat = QImage(
-                rgbImage.data, rgbImage.shape[1], rgbImage.shape[0], QImage.Format_RGB888)
-            p = convertToQtFormat.scaled(640, 480, Qt.KeepAspectRatio)
-            self.changePixmap.emit(p)
+            if getFrame() is None:
+                continue
+            self.changePixmap.emit(image)
 
 
 thread = "unactive"
@@ -263,6 +433,7 @@ class App(QMainWindow, Ui_MainWindow):
     @pyqtSlot(QImage)
     def setImage(self, image):
         self.displayFrame.setPixmap(QPixmap.fromImage(image))
+        renderer.acknowledge()
 
     def initUI(self):
         global fileNamingFull
@@ -285,6 +456,9 @@ class App(QMainWindow, Ui_MainWindow):
         self.timerFast.setInterval(10)
         self.timer.timeout.connect(self.displayTime)
         self.timer.timeout.connect(self.displayStorage)
+        self.timer.timeout.connect(self.displayRecorderError)
+        self.timer.timeout.connect(self.displayRois)
+        self.timer.timeout.connect(self.displayAlarms)
         self.timerFast.timeout.connect(self.displayTempValues)
         self.timer.start()
         self.timerFast.start()
@@ -302,6 +476,18 @@ class App(QMainWindow, Ui_MainWindow):
         self.cmRainBut.clicked.connect(self.cmRainFunc)
         self.printShutterBut.clicked.connect(self.printShutterInfoFunc)
 
+        # ROI statistics, one line per region
+        self.roiLabel = QLabel('')
+        self.roiLabel.setWordWrap(True)
+        self.verticalLayout.addWidget(self.roiLabel)
+
+        # saves the pre-trigger buffer and the frames that follow
+        self.triggerBut = QPushButton('Trigger Recording')
+        self.triggerBut.clicked.connect(lambda: triggerRecording('button'))
+        self.verticalLayout.addWidget(self.triggerBut)
+        self.triggeredSaved = 0
+        self.timer.timeout.connect(self.displayTriggered)
+
         #self.connect(self, SIGNAL('triggered()'), self.closeEvent)
     def printShutterInfoFunc(self):
         global devh
@@ -329,7 +515,12 @@ class App(QMainWindow, Ui_MainWindow):
     def gainFunction(self):
         global devh
         global thread
+        global gainMode
+        global lastFfcTime
         if thread == 'active':
+            # every gain change ends with an FFC
+            gainMode = self.comboGain.currentText()
+            lastFfcTime = time.time()
             if (self.comboGain.currentText() == 'LOW'):
                 set_gain_low(devh)
             elif (self.comboGain.currentText() == 'HIGH'):
@@ -355,8 +546,10 @@ class App(QMainWindow, Ui_MainWindow):
     def ffcFunction(self):
         global devh
         global thread
+        global lastFfcTime
         if thread == 'active':
             perform_manual_ffc(devh)
+            lastFfcTime = time.time()
 
     def start_stop(self):
         if camState == 'not_recording':
@@ -372,22 +565,23 @@ class App(QMainWindow, Ui_MainWindow):
         global camState
         global saveFilePath
         global fileNamingFull
+        global recorder
+        global recordThread
         if thread == 'active':
             if camState == 'recording':
                 print('Already Recording')
             else:
                 if fileNamingFull != "":
-                    dateAndTime = str(QDateTime.currentDateTime().toString())
-                    dateAndTime = dateAndTime.replace(" ", "_")
-                    dateAndTime = dateAndTime.replace(":", "-")
-                    filePathAndName = str(
-                        fileNamingFull + '_' + dateAndTime + '.HDF5')
+                    filePathAndName = recordingPath()
                     print(filePathAndName)
                     self.filePathDisp.setText(filePathAndName)
                     try:
-                        startRec.hdf5_file = h5py.File(
-                            filePathAndName, mode='w')
+                        recorder = newRecorder(filePathAndName)
                         camState = 'recording'
+                        recordThread = threading.Thread(
+                            target=recordFrames, args=(frame_cursor(ring),),
+                            daemon=True)
+                        recordThread.start()
                         print('Started Recording')
                         if saveFilePath == "":
                             self.history.insertPlainText(
@@ -413,12 +607,22 @@ class App(QMainWindow, Ui_MainWindow):
         global tiff_frame
         global camState
         global dataCollection
+        global nextRecorder
         if tiff_frame > 1:
             print('Ended Recording')
             camState = 'not_recording'
+            budget.unwatch('camera')
             try:
-                startRec.hdf5_file.close()
+                recordThread.join()
+                for thread in rotatedThreads:
+                    thread.join()
+                del rotatedThreads[:]
+                if nextRecorder is not None:
+                    nextRecorder.stop()
+                    nextRecorder = None
+                recorder.stop()
                 print('Saved Content to File Directory')
+                print('Recorder stats: ' + str(recorder.stats()))
                 #fileNum += 1
             except:
                 print('Save Failed')
@@ -503,6 +707,37 @@ class App(QMainWindow, Ui_MainWindow):
             'Current Min Temp: ' + readTemp(toggleUnitState, 'min'))
         #self.minTempLocLabel.setText('Min Temp Loc: ' + str(minLoc))
 
+    def displayRois(self):
+        latest = roiMonitor.latest if roiMonitor is not None else None
+        if latest is None or latest[2] is None:
+            return
+        stats = roi.in_unit(latest[2], toggleUnitState)
+        self.roiLabel.setText('\n'.join(
+            '{0}: min {1:.1f}, max {2:.1f}, mean {3:.1f} {4}'.format(
+                name, stats['min'][i], stats['max'][i], stats['mean'][i],
+                toggleUnitState)
+            for i, name in enumerate(roiMonitor.rois.names)))
+
+    def displayAlarms(self):
+        if alarmEngine is None:
+            return
+        for event in alarmEngine.pop_events():
+            self.history.insertPlainText(
+                'ALARM {0}: {1} ({2} = {3:.2f})\n'.format(
+                    event['state'], event['rule'], event['target'],
+                    event['value']))
+            self.history.moveCursor(QTextCursor.End)
+
+    def displayTriggered(self):
+        if triggered is None:
+            return
+        saved = triggered.saved
+        for path in saved[self.triggeredSaved:]:
+            self.history.insertPlainText('Saved triggered recording ' +
+                                         path + '\n')
+            self.history.moveCursor(QTextCursor.End)
+        self.triggeredSaved = len(saved)
+
     def displayTime(self):
         self.timeStatus.setText(QDateTime.currentDateTime().toString())
 
@@ -514,9 +749,9 @@ class App(QMainWindow, Ui_MainWindow):
         global yMouse
         global thread
         if thread == 'active':
-            data = q.get(True, 500)
-            data = cv2.resize(data[:, :], (640, 480))
-            return data[yMouse, xMouse]
+            # reads the newest frame at sensor resolution without taking it
+            # away from the display or the recording
+            return probe.point(*probe.to_sensor(xMouse, yMouse))
         else:
             self.history.insertPlainText(
                 'ERROR: Please Start IR Camera Feed First\n')
@@ -539,11 +774,83 @@ class App(QMainWindow, Ui_MainWindow):
             self.history.moveCursor(QTextCursor.End)
 
     def displayStorage(self):
-        usage = psutil.disk_usage('/')
-        oneMinVid = 20000000
-        timeAvail = usage.free/oneMinVid
+        for name, action in budget.update():
+            self.storageAction(name, action)
+        for forecast in budget.forecast().values():
+            for path in forecast['deleted']:
+                self.history.insertPlainText(
+                    'Storage Low: deleted ' + path + '\n')
+                self.history.moveCursor(QTextCursor.End)
+        forecast = budget.forecast('camera')
+        if forecast is not None:
+            timeAvail = forecast['seconds_left']
+        else:
+            # not recording: the camera's frames into the chosen directory
+            timeAvail = storage.seconds_left(
+                os.path.dirname(os.path.abspath(recordingPath())),
+                expectedRate())
         self.storageLabel.setText(
-            'Recording Time Left: ' + str(round(timeAvail, 2)) + ' Minutes')
+            'Recording Time Left: ' + str(round(timeAvail / 60, 2)) +
+            ' Minutes')
+
+    def displayRecorderError(self):
+        if camState != 'recording' or recorder is None:
+            return
+        error = recorder.error
+        if error is None and nextRecorder is not None:
+            error = nextRecorder.error
+        if error is None:
+            return
+        self.history.insertPlainText(
+            'Recording Failed: ' + str(error) + '\n')
+        self.history.moveCursor(QTextCursor.End)
+        self.stopRecAndSave()
+        self.displayNotRec()
+
+    def storageAction(self, name, action):
+        global recordLayout
+        global recordCompression
+        self.history.insertPlainText(
+            'Storage Low: ' + action + ' ' + name + ' recording\n')
+        self.history.moveCursor(QTextCursor.End)
+        if name == 'triggered':
+            if action == 'stop':
+                try:
+                    triggered.stop()
+                except Exception as e:
+                    # stop() re-raises the writer's error, storage is
+                    # released all the same
+                    print('Triggered Recording Failed: ' + str(e))
+                budget.unwatch(name)
+            return
+        if camState != 'recording':
+            return
+        if action == 'stop':
+            self.stopRecAndSave()
+            self.displayNotRec()
+            return
+        if action == 'compress':
+            compressed = storage.compressed_layout(recordLayout,
+                                                   recordCompression)
+            if compressed == (recordLayout, recordCompression):
+                return
+            recordLayout, recordCompression = compressed
+        self.rotateRecording()
+
+    def rotateRecording(self):
+        # the file recorded so far is closed, the budget deletes the oldest
+        # closed ones of the session to make room
+        global nextRecorder
+        filePathAndName = recordingPath()
+        try:
+            nextRecorder = newRecorder(filePathAndName)
+        except:
+            print('Could Not Rotate Recording')
+            return
+        self.filePathDisp.setText(filePathAndName)
+        self.history.insertPlainText(
+            'Continuing in ' + str(filePathAndName) + '\n')
+        self.history.moveCursor(QTextCursor.End)
 
     def displayRec(self):
         if camState == 'recording':
@@ -578,10 +885,34 @@ class App(QMainWindow, Ui_MainWindow):
         else:
             print('Exited Application')
             event.accept()
+        if event.isAccepted() and ring is not None:
+            print('Display stats: ' + str(renderer.stats()))
+            if roiMonitor is not None:
+                roiMonitor.stop()
+                print('ROI stats: ' + str(roiMonitor.stats()))
+            if triggered is not None:
+                # writes out a triggered recording still in progress
+                try:
+                    triggered.stop()
+                except Exception as e:
+                    # a failed writer must not keep the ring from unlinking
+                    print('Triggered Recording Failed: ' + str(e))
+                print('Triggered recording stats: ' + str(triggered.stats()))
+            ring.unlink()
 
 
 def main():
+    if hasattr(signal, 'SIGUSR1'):
+        # kill -USR1 <pid> triggers a recording from outside the GUI
+        signal.signal(signal.SIGUSR1,
+                      lambda signum, frame: triggerRecording('signal'))
     app = QApplication(sys.argv)
+    for name in ('SIGTERM', 'SIGHUP'):
+        if hasattr(signal, name):
+            # leave the event loop normally so the shared-memory ring is
+            # unlinked on exit instead of staying behind in /dev/shm
+            signal.signal(getattr(signal, name),
+                          lambda signum, frame: app.quit())
     window = App()
     window.show()
     sys.exit(app.exec_())
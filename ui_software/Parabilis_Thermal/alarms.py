@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+# Temperature alarms on the live stream. Rules are kept as JSON, e.g.
+#   [{"name": "hot spot", "kind": "threshold", "target": "frame:max",
+#     "limit": 60.0},
+#    {"name": "motor heating", "kind": "rate", "target": "roi:motor:mean",
+#     "limit": 0.5, "window": 10.0}]
+# List the events logged in a recording with
+#   python3 alarms.py events <recording>
+import argparse
+import json
+import math
+import threading
+import time
+from collections import deque
+import numpy as np
+import heat_data
+import radiometry
+
+RULE_KINDS = ('threshold', 'delta', 'rate')
+# 'roi:<name>:<stat>', 'pixel:<column>,<row>' or 'frame:<stat>'
+TARGET_KINDS = ('roi', 'pixel', 'frame')
+TARGET_STATS = ('min', 'max', 'mean', 'std')
+# samples kept for rate windows at least; at the Lepton rate about a
+# minute, longer rate windows get a longer history
+HISTORY = 512
+# Lepton frame rate, sizes the history when none is given
+DEFAULT_FPS = 8.7
+# room in the history for frames arriving faster than `fps`
+HISTORY_MARGIN = 1.25
+# events kept for pop_events()
+EVENT_BACKLOG = 256
+
+
+class rule(object):
+    """
+    One alarm condition, limits in degrees Celsius:
+
+    threshold: the target above (or below) `limit`
+    delta:     the target moved `limit` away from its baseline, the mean
+               over the first `window` seconds after start or reset()
+    rate:      the target rising (or falling) faster than `limit` C/s,
+               least squares slope over the last `window` seconds
+
+    An alarm is raised once the condition held for `debounce` seconds and
+    cleared once the value is `hysteresis` back on the safe side of the
+    limit for `debounce` seconds.
+    """
+
+    def __init__(self, name, kind, target, limit, above=True, hysteresis=0.5,
+                 debounce=0.0, window=10.0):
+        if kind not in RULE_KINDS:
+            raise ValueError('Unknown rule kind: ' + str(kind))
+        parse_target(target)
+        self.name = name
+        self.kind = kind
+        self.target = target
+        self.limit = float(limit)
+        self.above = bool(above)
+        self.hysteresis = float(hysteresis)
+        self.debounce = float(debounce)
+        self.window = float(window)
+
+    def to_dict(self):
+        return {'name': self.name, 'kind': self.kind, 'target': self.target,
+                'limit': self.limit, 'above': self.above,
+                'hysteresis': self.hysteresis, 'debounce': self.debounce,
+                'window': self.window}
+
+    @classmethod
+    def from_dict(cls, values):
+        return cls(**values)
+
+
+def parse_target(target):
+    """('roi', name, stat), ('pixel', column, row) or ('frame', stat)."""
+    kind, _, rest = target.partition(':')
+    if kind == 'roi':
+        name, _, stat = rest.rpartition(':')
+        if name and stat in TARGET_STATS:
+            return kind, name, stat
+    elif kind == 'pixel':
+        col, _, row = rest.partition(',')
+        if col.strip().isdigit() and row.strip().isdigit():
+            return kind, int(col), int(row)
+    elif kind == 'frame' and rest in TARGET_STATS:
+        return kind, rest
+    raise ValueError('Unknown alarm target: ' + str(target))
+
+
+def read_file(path):
+    with open(path) as f:
+        return [rule.from_dict(values) for values in json.load(f)]
+
+
+def write_file(path, rules):
+    with open(path, 'w') as f:
+        json.dump([item.to_dict() for item in rules], f, indent=2)
+
+
+class alarm_engine(object):
+    """
+    Evaluates all rules on every frame with array operations over the rules,
+    so a hundred rules cost about as much as one. Rate windows use prefix
+    sums kept in a history of `history` samples (written twice, so the
+    newest `history` samples are always one contiguous slice): a window sum
+    is the difference of two prefix values, whatever the window length.
+    Prefix sums are rebuilt relative to the oldest sample once per
+    `history` samples to keep their magnitude, and the rounding, bounded.
+    By default the history holds the longest rate window at `fps`; a
+    `history` too short for a window raises ValueError, as such a rule
+    would never fire.
+
+    update() takes the raw frame and the roi_set statistics of the frame
+    (as from a roi.roi_monitor listener) and returns the events of the
+    frame; listeners are called with each event as well.
+    """
+
+    def __init__(self, rules, rois=None, history=None, fps=DEFAULT_FPS):
+        self.__rules = list(rules)
+        # a rate window spans window * fps samples, plus the one before it
+        needed = {item.name: int(math.ceil(item.window * fps)) + 2
+                  for item in self.__rules if item.kind == 'rate'}
+        if history is None:
+            history = max([HISTORY] + [int(math.ceil(n * HISTORY_MARGIN))
+                                       for n in needed.values()])
+        for name, samples in needed.items():
+            if samples > history:
+                raise ValueError(
+                    'The rate window of {0} needs {1} samples at {2:g} fps, '
+                    'the history holds {3}'.format(name, samples, fps,
+                                                   history))
+        names = rois.names if rois is not None else []
+        # each distinct target is read once per frame
+        targets = sorted(set(item.target for item in self.__rules))
+        column = {target: i for i, target in enumerate(targets)}
+        self.__roi_targets = {stat: ([], []) for stat in TARGET_STATS}
+        self.__frame_targets = []
+        pixels = ([], [], [])
+        for i, target in enumerate(targets):
+            parsed = parse_target(target)
+            if parsed[0] == 'roi':
+                if parsed[1] not in names:
+                    raise ValueError('No region named ' + parsed[1])
+                columns, regions = self.__roi_targets[parsed[2]]
+                columns.append(i)
+                regions.append(names.index(parsed[1]))
+            elif parsed[0] == 'pixel':
+                pixels[0].append(i)
+                pixels[1].append(parsed[2])
+                pixels[2].append(parsed[1])
+            else:
+                self.__frame_targets.append((i, parsed[1]))
+        self.__pixel_targets = tuple(np.array(p, np.intp) for p in pixels)
+        self.__targets = targets
+        self.__values = np.zeros(len(targets))
+        # centikelvin to Celsius; a std is a spread, only the scale applies
+        self.__offset = np.array(
+            [0.0 if target.endswith(':std') else radiometry.KELVIN_OFFSET
+             for target in targets])
+
+        rules = self.__rules
+        self.__column = np.array([column[r.target] for r in rules], np.intp)
+        self.__kind = np.array([RULE_KINDS.index(r.kind) for r in rules],
+                               np.intp)
+        self.__limit = np.array([r.limit for r in rules])
+        # conditions are evaluated as "value above limit", rules that watch
+        # for low values are mirrored
+        self.__sign = np.array([1.0 if r.above else -1.0 for r in rules])
+        self.__hysteresis = np.array([r.hysteresis for r in rules])
+        self.__debounce = np.array([r.debounce for r in rules])
+        self.__window = np.array([r.window for r in rules])
+        self.__is_delta = self.__kind == RULE_KINDS.index('delta')
+        self.__is_rate = self.__kind == RULE_KINDS.index('rate')
+
+        self.__history = history
+        count = len(targets)
+        self.__times = np.full(2 * history, -np.inf)
+        self.__raw = np.zeros((2 * history, count))
+        self.__sum_t = np.zeros(2 * history)
+        self.__sum_tt = np.zeros(2 * history)
+        self.__sum_v = np.zeros((2 * history, count))
+        self.__sum_tv = np.zeros((2 * history, count))
+        self.__listeners = []
+        self.__events = deque(maxlen=EVENT_BACKLOG)
+        self.__lock = threading.Lock()
+        self.__frames = 0
+        self.__seconds = 0.0
+        self.reset()
+
+    @property
+    def rules(self):
+        return list(self.__rules)
+
+    @property
+    def active(self):
+        """Names of the rules currently in alarm."""
+        return [self.__rules[i].name for i in np.flatnonzero(self.__state)]
+
+    def add_listener(self, callback):
+        self.__listeners.append(callback)
+
+    def remove_listener(self, callback):
+        self.__listeners.remove(callback)
+
+    def reset(self):
+        """Clear all alarms and history, baselines are taken again."""
+        rules = len(self.__rules)
+        self.__count = 0
+        self.__origin = 0.0
+        self.__started = None
+        self.__times[:] = -np.inf
+        for sums in (self.__sum_t, self.__sum_tt, self.__sum_v,
+                     self.__sum_tv):
+            sums[:] = 0.0
+        self.__state = np.zeros(rules, bool)
+        self.__pending = np.full(rules, np.nan)
+        self.__baseline_sum = np.zeros(rules)
+        self.__baseline_count = np.zeros(rules)
+        self.__metric = np.full(rules, np.nan)
+
+    def stats(self):
+        return {
+            'frames': self.__frames,
+            'rules': len(self.__rules),
+            'active': int(self.__state.sum()),
+            'frame_ms': (self.__seconds * 1000.0 / self.__frames
+                         if self.__frames else 0.0),
+        }
+
+    def pop_events(self):
+        """Events since the last call, oldest first, for a GUI to poll."""
+        with self.__lock:
+            events = list(self.__events)
+            self.__events.clear()
+        return events
+
+    def _read_targets(self, frame, stats):
+        values = self.__values
+        for stat, (columns, regions) in self.__roi_targets.items():
+            if columns:
+                values[columns] = stats[stat][regions]
+        columns, rows, cols = self.__pixel_targets
+        if len(columns):
+            values[columns] = frame[rows, cols]
+        for i, stat in self.__frame_targets:
+            values[i] = getattr(np, stat)(frame)
+        return values * 0.01 - self.__offset
+
+    def _add_sample(self, timestamp, values):
+        history = self.__history
+        count = self.__count
+        slot = count % history
+        previous = (count - 1) % history
+        u = timestamp - self.__origin
+        for position in (slot, slot + history):
+            self.__times[position] = timestamp
+            self.__raw[position] = values
+            self.__sum_t[position] = self.__sum_t[previous] + u
+            self.__sum_tt[position] = self.__sum_tt[previous] + u * u
+            self.__sum_v[position] = self.__sum_v[previous] + values
+            self.__sum_tv[position] = self.__sum_tv[previous] + u * values
+        self.__count = count + 1
+        if self.__count % history == 0:
+            self._rebase()
+
+    def _rebase(self):
+        # prefix sums of the stored samples only, from the oldest one
+        start = self.__count % self.__history
+        view = slice(start, start + self.__history)
+        times = self.__times[view]
+        self.__origin = times[0]
+        u = times - self.__origin
+        raw = self.__raw[view]
+        sums = (np.cumsum(u), np.cumsum(u * u), np.cumsum(raw, axis=0),
+                np.cumsum(u[:, None] * raw, axis=0))
+        # the view starts at slot 0 here, so both halves are the same
+        for target, values in zip((self.__sum_t, self.__sum_tt,
+                                   self.__sum_v, self.__sum_tv), sums):
+            target[:self.__history] = values
+            target[self.__history:] = values
+
+    def _slopes(self, timestamp):
+        # window of every rule as a slice of the contiguous newest samples
+        history = self.__history
+        start = self.__count % history
+        times = self.__times[start:start + history]
+        first = np.searchsorted(times, timestamp - self.__window)
+        # the sample just before the window must still be stored
+        ready = (first >= 1) & np.isfinite(times[np.maximum(first - 1, 0)])
+        before = start + np.maximum(first - 1, 0)
+        last = start + history - 1
+        columns = self.__column
+        n = (history - np.maximum(first, 1)).astype(np.float64)
+        s_t = self.__sum_t[last] - self.__sum_t[before]
+        s_tt = self.__sum_tt[last] - self.__sum_tt[before]
+        s_v = self.__sum_v[last, columns] - self.__sum_v[before, columns]
+        s_tv = self.__sum_tv[last, columns] - self.__sum_tv[before, columns]
+        denominator = n * s_tt - s_t * s_t
+        ready &= (n >= 2) & (denominator > 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = (n * s_tv - s_t * s_v) / denominator
+        return np.where(ready, slope, np.nan)
+
+    def update(self, frame, timestamp, stats=None, number=None):
+        started = time.perf_counter()
+        values = self._read_targets(frame, stats)
+        self._add_sample(timestamp, values)
+        if self.__started is None:
+            self.__started = timestamp
+        current = values[self.__column]
+
+        # baselines: mean over the first `window` seconds
+        elapsed = timestamp - self.__started
+        collecting = self.__is_delta & (elapsed <= self.__window)
+        self.__baseline_sum[collecting] += current[collecting]
+        self.__baseline_count[collecting] += 1
+        with np.errstate(invalid='ignore'):
+            baseline = self.__baseline_sum / self.__baseline_count
+        baseline[collecting] = np.nan
+
+        metric = current.copy()
+        metric[self.__is_delta] = (current - baseline)[self.__is_delta]
+        if self.__is_rate.any():
+            metric[self.__is_rate] = self._slopes(timestamp)[self.__is_rate]
+        self.__metric = metric
+
+        signed = metric * self.__sign
+        limit = self.__limit * self.__sign
+        with np.errstate(invalid='ignore'):
+            # nan (no baseline or full window yet) never raises or clears
+            raise_now = signed > limit
+            clear_now = signed < limit - self.__hysteresis
+        wanted = np.where(self.__state, ~clear_now, raise_now)
+        changing = wanted != self.__state
+        self.__pending[~changing] = np.nan
+        starting = changing & np.isnan(self.__pending)
+        self.__pending[starting] = timestamp
+        with np.errstate(invalid='ignore'):
+            flip = changing & (timestamp - self.__pending >= self.__debounce)
+        self.__pending[flip] = np.nan
+        self.__state[flip] = ~self.__state[flip]
+
+        events = [self._event(i, timestamp, number)
+                  for i in np.flatnonzero(flip)]
+        self.__frames += 1
+        self.__seconds += time.perf_counter() - started
+        if events:
+            with self.__lock:
+                self.__events.extend(events)
+            for event in events:
+                for callback in list(self.__listeners):
+                    callback(event)
+        return events
+
+    def _event(self, i, timestamp, number):
+        item = self.__rules[i]
+        return {
+            'time': float(timestamp),
+            'frame': None if number is None else int(number),
+            'rule': item.name,
+            'kind': item.kind,
+            'target': item.target,
+            'state': 'raised' if self.__state[i] else 'cleared',
+            'value': float(self.__metric[i]),
+            'limit': item.limit,
+        }
+
+    def on_frame(self, number, timestamp, frame, stats):
+        """roi.roi_monitor listener."""
+        self.update(frame, timestamp, stats, number)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='List the alarm and trigger events logged in a recording.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    events = commands.add_parser('events', help='print the logged events')
+    events.add_argument('path')
+    args = parser.parse_args()
+
+    data = heat_data.heat_data(args.path)
+    try:
+        for event in data.events:
+            stamp = time.strftime('%Y-%m-%d %H:%M:%S',
+                                  time.localtime(event['time']))
+            if 'rule' not in event:
+                # e.g. a manual trigger of a triggered recording
+                print('{0}  {1:>8}  {2}'.format(
+                    stamp, event.get('kind', 'event'), ', '.join(
+                        '{0}={1}'.format(key, value)
+                        for key, value in event.items()
+                        if key not in ('time', 'kind'))))
+                continue
+            print('{0}  {1:>8}  {2}: {3} = {4:.2f} (limit {5:g})'.format(
+                stamp, event['state'], event['rule'], event['target'],
+                event['value'], event['limit']))
+    finally:
+        data.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+# Throughput and latency of the capture, display, recording, playback and
+# export code on synthetic Lepton frames, written as JSON. Run as
+#   python3 benchmark.py --out baseline.json
+#   python3 benchmark.py --out new.json --compare baseline.json
+# Every result is the median of --repeat runs of the whole suite. With
+# --compare the exit status is 1 when a result got worse than the baseline
+# by more than --tolerance.
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import cv2
+import h5py
+import numpy as np
+import colors
+import heat_data
+import save_as
+import tone_map
+from preview import preview_renderer
+from recorder import hdf5_recorder
+from shared_frames import shared_frame_ring, frame_cursor
+from simulated_uvc import synthetic_frames, LEPTON_FPS
+
+RESULTS_VERSION = 1
+# (layout, compression) of the recordings written and read back
+WRITE_CASES = (
+    ('stacked', None),
+    ('stacked', 'lzf'),
+    ('stacked', 'gzip'),
+    ('stacked', 'delta'),
+    ('image', None),
+    ('raw', None),
+    ('delta', None),
+)
+EXPORT_FORMATS = ('csv', 'csv_table', 'tiff', 'avi', 'png', 'jpg')
+# metric name suffixes, and whether a larger value is better
+HIGHER_IS_BETTER = '_per_second'
+LOWER_IS_BETTER = '_ms'
+# back-to-back runs on one machine commonly differ by 10 to 20 % (disk
+# cache, frequency scaling), even as medians of three, and timings of a
+# fraction of a second now and then by more; smaller changes are not
+# reported as regressions by default
+DEFAULT_REPEATS = 3
+DEFAULT_TOLERANCE = 0.25
+# rates and per-frame times measured over less than this many seconds are
+# mostly timer and scheduler noise and are not compared
+MIN_COMPARED_SECONDS = 0.1
+
+
+def parse_shape(text):
+    """'160x120' (width x height, as Lepton sizes are quoted) -> (120, 160)."""
+    width, height = text.lower().split('x')
+    return int(height), int(width)
+
+
+def shape_name(shape):
+    return '{1}x{0}'.format(*shape)
+
+
+def synthetic_stack(shape, count, seed=0):
+    source = synthetic_frames(shape, seed=seed)
+    frames = np.empty((count,) + tuple(shape), np.uint16)
+    for frame in frames:
+        source.next(frame)
+    return frames
+
+
+def _rate(count, seconds):
+    return count / seconds if seconds > 0 else 0.0
+
+
+def _timing(count, seconds):
+    return {
+        'frames': count,
+        'seconds': seconds,
+        'frames_per_second': _rate(count, seconds),
+        'frame_ms': seconds * 1000.0 / count if count else 0.0,
+    }
+
+
+def _latency(seconds):
+    if len(seconds) == 0:
+        return {}
+    p50, p95, p99 = np.percentile(seconds, (50, 95, 99)) * 1000.0
+    return {
+        'latency_p50_ms': float(p50),
+        'latency_p95_ms': float(p95),
+        'latency_p99_ms': float(p99),
+        'latency_max_ms': float(np.max(seconds) * 1000.0),
+    }
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'numpy': np.__version__,
+        'h5py': h5py.__version__,
+        'hdf5': h5py.version.hdf5_version,
+        'opencv': cv2.__version__,
+    }
+
+
+def bench_latency(shape, fps, seconds, layout, directory):
+    """
+    Frames pushed into a shared frame ring at `fps` the way the libuvc
+    callback does, pumped into an hdf5_recorder by a record thread as in
+    RecordIR; latency runs from the push to the batch being in the file.
+    """
+    height, width = shape
+    ring = shared_frame_ring(8, height, width)
+    latencies = []
+
+    def written(sequence, timestamps):
+        latencies.append(time.time() - timestamps)
+
+    path = os.path.join(directory, 'latency_' + layout)
+    recorder = hdf5_recorder(path, shape, layout=layout, on_write=written)
+    recorder.start()
+    running = [True]
+    cursor = frame_cursor(ring)
+
+    def record():
+        buffer = np.empty(shape, np.uint16)
+        while running[0] or cursor.pending:
+            result = cursor.next(0.1, buffer)
+            if result is not None:
+                frame, number, timestamp = result
+                recorder.submit(frame, number, timestamp)
+
+    thread = threading.Thread(target=record, daemon=True)
+    thread.start()
+    frames = synthetic_stack(shape, 16)
+    interval = 1.0 / fps
+    started = time.monotonic()
+    deadline = started
+    pushed = 0
+    while time.monotonic() - started < seconds:
+        frame = frames[pushed % len(frames)]
+        ring.push_pointer(frame.ctypes.data, frame.nbytes, time.time(),
+                          pushed)
+        pushed += 1
+        deadline += interval
+        time.sleep(max(0.0, deadline - time.monotonic()))
+    running[0] = False
+    thread.join()
+    recorder.stop()
+    stats = recorder.stats()
+    ring.close()
+    ring.unlink()
+    result = {
+        'fps': fps,
+        'pushed': pushed,
+        'written': stats['written'],
+        'ring_dropped': cursor.dropped,
+        'recorder_dropped': stats['dropped'],
+    }
+    result.update(_latency(np.concatenate(latencies or [np.empty(0)])))
+    return result
+
+
+def bench_colorize(frames):
+    """Colour map lookups per tone mapping mode, and the whole preview."""
+    results = {}
+    out = np.empty(frames.shape[1:] + (3,), np.uint8)
+    for mode in tone_map.MODES:
+        mapper = tone_map.tone_mapper(mode)
+        started = time.perf_counter()
+        for frame in frames:
+            colors.colorize_into(out, frame, 'ironblack', mapper)
+        results[mode] = _timing(len(frames),
+                                time.perf_counter() - started)
+    # minMaxLoc, colorize, scaling to 640x480 and BGR -> RGB, as displayed
+    height, width = frames.shape[1:]
+    ring = shared_frame_ring(8, height, width)
+    renderer = preview_renderer(ring, max_fps=0)
+    started = time.perf_counter()
+    for i, frame in enumerate(frames):
+        ring.push(frame, 0.0, i)
+        renderer.render(0)
+        renderer.acknowledge()
+    results['preview'] = _timing(len(frames), time.perf_counter() - started)
+    ring.close()
+    ring.unlink()
+    return results
+
+
+def bench_write(frames, layout, compression, path):
+    """
+    Frames submitted as fast as possible; the time runs until stop() has
+    written all of them, so it is the sustained rate of the writer.
+    """
+    recorder = hdf5_recorder(path, frames.shape[1:], layout=layout,
+                             compression=compression,
+                             max_pending=len(frames))
+    started = time.perf_counter()
+    recorder.start()
+    for i, frame in enumerate(frames):
+        # timestamps at the Lepton rate, the exports derive the video rate
+        # from them
+        recorder.submit(frame, i, i / LEPTON_FPS)
+    recorder.stop()
+    seconds = time.perf_counter() - started
+    stats = recorder.stats()
+    size = os.path.getsize(path)
+    result = _timing(stats['written'], seconds)
+    result.update({
+        'dropped': stats['dropped'],
+        'megabytes_per_second': _rate(frames.nbytes / 1e6, seconds),
+        'file_bytes': size,
+        'compression_ratio': frames.nbytes / float(size),
+    })
+    return result
+
+
+def bench_read(path, seed=0):
+    """heat_data.frame() in order and in random order, and frames() batches."""
+    results = {}
+    data = heat_data.heat_data(path)
+    count = data.last_frame
+    height, width = data.shape
+    data.close()
+    orders = {
+        'sequential': np.arange(1, count + 1),
+        'random': np.random.default_rng(seed).permutation(count) + 1,
+    }
+    for name, order in orders.items():
+        # a fresh handle each time, so no run profits from a warm frame cache
+        data = heat_data.heat_data(path)
+        started = time.perf_counter()
+        for number in order:
+            data.frame(int(number), width, height)
+        results[name] = _timing(count, time.perf_counter() - started)
+        data.close()
+    data = heat_data.heat_data(path)
+    started = time.perf_counter()
+    for first in range(1, count + 1, save_as.EXPORT_BATCH):
+        batch = data.frames(first, min(first + save_as.EXPORT_BATCH,
+                                       count + 1))
+        # raw recordings return views into the file, make them read it
+        batch.max()
+    results['batched'] = _timing(count, time.perf_counter() - started)
+    data.close()
+    return results
+
+
+def bench_export(path, directory, count, processes=None):
+    results = {}
+    data = heat_data.heat_data(path)
+    end = min(count, data.last_frame) + 1
+    stem = os.path.join(directory, 'export')
+    exports = {
+        'csv': lambda: save_as.to_csvs(stem, data, 1, end,
+                                       processes=processes),
+        'csv_table': lambda: save_as.to_csv_table(stem + '.csv', data, 1,
+                                                  end),
+        'tiff': lambda: save_as.to_tiffs(stem + '.tiff', data, 'ironblack',
+                                         1, end),
+        'avi': lambda: save_as.to_avi(stem + '.avi', data, 'ironblack', 1,
+                                      end),
+        'png': lambda: save_as.to_images(stem, data, 'ironblack', 1, end,
+                                         'png', processes=processes),
+        'jpg': lambda: save_as.to_images(stem, data, 'ironblack', 1, end,
+                                         'jpg', processes=processes),
+    }
+    try:
+        for name in EXPORT_FORMATS:
+            summary = exports[name]()
+            results[name] = _timing(summary['frames'], summary['seconds'])
+            results[name]['errors'] = len(summary['errors'])
+    finally:
+        data.close()
+    return results
+
+
+def run(shapes, fps_list, latency_seconds, frames, export_frames, directory,
+        processes=None, log=print):
+    results = {}
+    for shape in shapes:
+        name = shape_name(shape)
+        stack = synthetic_stack(shape, frames)
+        entry = results[name] = {'latency': {}, 'write': {}, 'read': {}}
+        for fps in fps_list:
+            for layout in ('stacked', 'raw'):
+                log('{0}: latency {1} at {2} fps'.format(name, layout, fps))
+                entry['latency']['{0}@{1}fps'.format(layout, fps)] = \
+                    bench_latency(shape, fps, latency_seconds, layout,
+                                  directory)
+        log(name + ': colorize')
+        entry['colorize'] = bench_colorize(stack)
+        recordings = {}
+        for layout, compression in WRITE_CASES:
+            case = layout if compression is None else \
+                layout + '_' + compression
+            path = os.path.join(directory, name + '_' + case)
+            log('{0}: write and read {1}'.format(name, case))
+            entry['write'][case] = bench_write(stack, layout, compression,
+                                               path)
+            entry['read'][case] = bench_read(path)
+            recordings[case] = path
+        log(name + ': export')
+        entry['export'] = bench_export(recordings['stacked'], directory,
+                                       export_frames, processes)
+    return results
+
+
+def median_results(runs):
+    """Median of every number over several run() results, key by key."""
+    merged = {}
+    for key, value in runs[0].items():
+        values = [result[key] for result in runs if key in result]
+        if isinstance(value, dict):
+            merged[key] = median_results(values)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            median = float(np.median(values))
+            merged[key] = int(round(median)) if isinstance(value, int) \
+                else median
+        else:
+            merged[key] = value
+    return merged
+
+
+def flatten(results, prefix=''):
+    """{'160x120/write/raw/frames_per_second': value, ...}"""
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, prefix + key + '/'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix + key] = value
+    return flat
+
+
+def compare(baseline, current, tolerance=DEFAULT_TOLERANCE):
+    """
+    [(metric, baseline value, current value, relative change)] of every
+    rate or time in both results that got worse by more than `tolerance`,
+    leaving out those timed over less than MIN_COMPARED_SECONDS.
+    """
+    old = flatten(baseline['results'])
+    new = flatten(current['results'])
+    regressions = []
+    for name in sorted(set(old) & set(new)):
+        before, after = old[name], new[name]
+        if before <= 0:
+            continue
+        timed = name.rsplit('/', 1)[0] + '/seconds'
+        if min(old.get(timed, np.inf),
+               new.get(timed, np.inf)) < MIN_COMPARED_SECONDS:
+            continue
+        change = (after - before) / float(before)
+        if name.endswith(HIGHER_IS_BETTER):
+            worse = change < -tolerance
+        elif name.endswith(LOWER_IS_BETTER):
+            worse = change > tolerance
+        else:
+            continue
+        if worse:
+            regressions.append((name, before, after, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark recording, display, playback and export on '
+        'synthetic frames.')
+    parser.add_argument('--out', default='benchmark.json',
+                        help='JSON file for the results')
+    parser.add_argument('--shapes', nargs='+', default=['160x120', '80x60'],
+                        help='frame sizes, width x height')
+    parser.add_argument('--fps', nargs='+', type=float, default=[LEPTON_FPS],
+                        help='frame rates for the latency runs')
+    parser.add_argument('--latency-seconds', type=float, default=5.0)
+    parser.add_argument('--frames', type=int, default=1000,
+                        help='frames written and read per layout')
+    parser.add_argument('--export-frames', type=int, default=100)
+    parser.add_argument('--processes', type=int, default=None,
+                        help='worker processes for the exports')
+    parser.add_argument('--dir', default=None,
+                        help='scratch directory, a temporary one by default')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEATS,
+                        help='runs of the suite, each result is their median')
+    parser.add_argument('--compare', default=None, metavar='BASELINE',
+                        help='results to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='allowed relative slowdown, 0.25 = 25 %%')
+    args = parser.parse_args()
+
+    directory = args.dir or tempfile.mkdtemp(prefix='thermal_benchmark_')
+    try:
+        runs = []
+        for i in range(max(1, args.repeat)):
+            if args.repeat > 1:
+                print('Run {0} of {1}'.format(i + 1, args.repeat))
+            runs.append(run([parse_shape(s) for s in args.shapes], args.fps,
+                            args.latency_seconds, args.frames,
+                            args.export_frames, directory, args.processes))
+        results = median_results(runs)
+    finally:
+        if args.dir is None:
+            shutil.rmtree(directory, ignore_errors=True)
+    output = {
+        'results_version': RESULTS_VERSION,
+        'created': time.time(),
+        'environment': environment(),
+        'settings': vars(args),
+        'results': results,
+    }
+    with open(args.out, 'w') as f:
+        json.dump(output, f, indent=2, sort_keys=True)
+    print('Wrote ' + args.out)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, output, args.tolerance)
+        for name, before, after, change in regressions:
+            print('{0}: {1:.4g} -> {2:.4g} ({3:+.0%})'.format(
+                name, before, after, change))
+        print('{0} regressions against {1}'.format(len(regressions),
+                                                   args.compare))
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
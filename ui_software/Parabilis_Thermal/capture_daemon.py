@@ -0,0 +1,526 @@
+#!/usr/bin/env python3
+# Headless capture of every attached PureThermal board, one recording per
+# board. Run with --simulate N to try it without hardware. With
+# --pre-trigger SECONDS frames are only buffered, and `kill -USR1 <pid>`
+# saves the buffer plus --post-trigger seconds into a new file per board.
+import argparse
+import math
+import os
+import signal
+import threading
+import time
+from frame_ring import frame_ring, frame_timestamp
+from recorder import (hdf5_recorder, triggered_recorder, file_extension,
+                      LAYOUTS)
+from simulated_uvc import simulated_backend
+import storage
+
+RING_SECONDS = 2
+
+
+class libuvc_device(object):
+    def __init__(self, serial, dev, devh, ctrl, shape, fps):
+        self.serial = serial
+        self.dev = dev
+        self.devh = devh
+        self.ctrl = ctrl
+        self.shape = shape
+        self.fps = fps
+        self.key = None
+
+
+class libuvc_backend(object):
+    """Streams PureThermal boards through libuvc, opened by serial number."""
+
+    def __init__(self):
+        # imported here so the simulated backend works without libuvc
+        import uvctypesParabilis_v2 as uvc
+        self.__uvc = uvc
+        self.__ctx = uvc.POINTER(uvc.uvc_context)()
+        if uvc.libuvc.uvc_init(uvc.byref(self.__ctx), 0) < 0:
+            raise IOError('uvc_init error')
+        self.__rings = {}
+        self.__next_key = 1
+        # one C callback for every device, userptr says which ring it feeds
+        self.__callback = uvc.CFUNCTYPE(
+            None, uvc.POINTER(uvc.uvc_frame), uvc.c_void_p)(self._on_frame)
+
+    def _on_frame(self, frame, userptr):
+        ring = self.__rings.get(userptr)
+        if ring is None:
+            return
+        if (frame.contents.height, frame.contents.width) != ring.shape:
+            return
+        ring.push_pointer(frame.contents.data, frame.contents.data_bytes,
+                          frame_timestamp(frame.contents),
+                          frame.contents.sequence)
+
+    def enumerate(self):
+        return self.__uvc.uvc_list_serial_numbers(self.__ctx)
+
+    def open(self, serial):
+        uvc = self.__uvc
+        dev = uvc.POINTER(uvc.uvc_device)()
+        devh = uvc.POINTER(uvc.uvc_device_handle)()
+        ctrl = uvc.uvc_stream_ctrl()
+        res = uvc.libuvc.uvc_find_device(
+            self.__ctx, uvc.byref(dev), uvc.PT_USB_VID, uvc.PT_USB_PID,
+            serial.encode())
+        if res < 0:
+            raise IOError('uvc_find_device error for ' + serial)
+        if uvc.libuvc.uvc_open(dev, uvc.byref(devh)) < 0:
+            uvc.libuvc.uvc_unref_device(dev)
+            raise IOError('uvc_open error for ' + serial)
+        frame_formats = uvc.uvc_get_frame_formats_by_guid(
+            devh, uvc.VS_FMT_GUID_Y16)
+        if len(frame_formats) == 0:
+            uvc.libuvc.uvc_close(devh)
+            uvc.libuvc.uvc_unref_device(dev)
+            raise IOError(serial + ' does not support Y16')
+        fmt = frame_formats[0]
+        # 8.7 for a Lepton, kept as a float for the file attributes and
+        # the ring sizes; libuvc takes a whole number of frames per second
+        fps = 1e7 / fmt.dwDefaultFrameInterval
+        uvc.libuvc.uvc_get_stream_ctrl_format_size(
+            devh, uvc.byref(ctrl), uvc.UVC_FRAME_FORMAT_Y16,
+            fmt.wWidth, fmt.wHeight, int(fps))
+        return libuvc_device(serial, dev, devh, ctrl,
+                             (fmt.wHeight, fmt.wWidth), fps)
+
+    def info(self, device):
+        info = self.__uvc.lepton_info(device.devh)
+        info['lepton_serial'] = info['serial']
+        # sessions are keyed by the board's USB serial
+        info['serial'] = device.serial
+        return info
+
+    def start(self, device, ring):
+        uvc = self.__uvc
+        device.key = self.__next_key
+        self.__next_key += 1
+        self.__rings[device.key] = ring
+        res = uvc.libuvc.uvc_start_streaming(
+            device.devh, uvc.byref(device.ctrl), self.__callback,
+            uvc.c_void_p(device.key), 0)
+        if res < 0:
+            del self.__rings[device.key]
+            raise IOError('uvc_start_streaming failed: {0}'.format(res))
+
+    def close(self, device):
+        uvc = self.__uvc
+        uvc.libuvc.uvc_stop_streaming(device.devh)
+        self.__rings.pop(device.key, None)
+        uvc.libuvc.uvc_close(device.devh)
+        uvc.libuvc.uvc_unref_device(device.dev)
+
+    def exit(self):
+        self.__uvc.libuvc.uvc_exit(self.__ctx)
+
+
+class capture_session(object):
+    """
+    One connected board: its frame ring, the thread pumping frames from the
+    ring into the recorder, and its counters. With `trigger_seconds`, a
+    (pre, post) pair, the recorder is a triggered_recorder writing to a new
+    make_path() on every trigger, otherwise one file at make_path() until
+    rotate() switches to the next one.
+    """
+
+    def __init__(self, serial, backend, device, make_path, recorder_options,
+                 trigger_seconds=None):
+        self.serial = serial
+        self.backend = backend
+        self.device = device
+        self.ring = frame_ring(
+            max(2, int(math.ceil(RING_SECONDS * device.fps))), *device.shape)
+        attrs = dict(backend.info(device), fps=device.fps)
+        self.__attrs = attrs
+        self.__options = dict(recorder_options)
+        self.__next = None
+        self.__finishing = []
+        if trigger_seconds is None:
+            self.recorder = hdf5_recorder(make_path(), device.shape,
+                                          attrs=attrs, **recorder_options)
+        else:
+            pre, post = trigger_seconds
+            self.recorder = triggered_recorder(
+                make_path, device.shape, pre, post, fps=device.fps,
+                attrs=attrs, **recorder_options)
+        self.frames = 0
+        self.started = time.monotonic()
+        self.last_frame = self.started
+        # exception that stopped the recording, the daemon closes the board
+        self.error = None
+        self.__running = False
+        self.__thread = None
+
+    def start(self):
+        self.recorder.start()
+        self.__running = True
+        self.__thread = threading.Thread(target=self._pump, daemon=True)
+        self.__thread.start()
+        self.backend.start(self.device, self.ring)
+
+    def _pump(self):
+        buffer = None
+        while self.__running:
+            result = self.ring.next(0.5, buffer)
+            if result is None:
+                continue
+            buffer, number, timestamp = result
+            if self.__next is not None:
+                # switch files between two frames, the old one is closed
+                # without holding up the ring
+                finishing, self.recorder = self.recorder, self.__next
+                self.__next = None
+                thread = threading.Thread(target=finishing.stop, daemon=True)
+                thread.start()
+                self.__finishing.append(thread)
+            try:
+                self.recorder.submit(buffer, number, timestamp)
+            except Exception as e:
+                self.error = e
+                return
+            self.frames += 1
+            self.last_frame = time.monotonic()
+
+    def trigger(self, event=None):
+        if isinstance(self.recorder, triggered_recorder):
+            self.recorder.trigger(event)
+
+    @property
+    def options(self):
+        return dict(self.__options)
+
+    def rotate(self, path, **options):
+        """
+        Continue in a new file at `path`, with `options` replacing recorder
+        options, from the next frame on. Returns the new recorder, or None
+        for triggered sessions, which start a file per trigger anyway.
+        """
+        if isinstance(self.recorder, triggered_recorder):
+            return None
+        self.__options.update(options)
+        recorder = hdf5_recorder(path, self.device.shape, attrs=self.__attrs,
+                                 **self.__options)
+        recorder.start()
+        self.__next = recorder
+        return recorder
+
+    def stalled(self, timeout):
+        return time.monotonic() - self.last_frame > timeout
+
+    def stop(self):
+        try:
+            self.backend.close(self.device)
+        finally:
+            self.__running = False
+            if self.__thread is not None:
+                self.__thread.join()
+            for thread in self.__finishing:
+                thread.join()
+            if self.__next is not None:
+                self.__next.stop()
+            self.recorder.stop()
+
+    def stats(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        recorder = self.recorder.stats()
+        return {
+            'path': self.recorder.path,
+            'frames': self.frames,
+            'fps': self.frames / elapsed,
+            'ring_dropped': self.ring.dropped,
+            'recorder_dropped': recorder['dropped'],
+            'written': recorder['written'],
+            'pending': recorder['pending'],
+        }
+
+
+class capture_daemon(object):
+    """
+    Keeps one capture_session per attached board. Every `rescan_interval`
+    seconds the device list is compared with the open sessions: new boards are
+    opened, and boards that disappeared or stopped delivering frames for
+    `stall_timeout` seconds are closed and reopened into a new file when they
+    come back. With `pre_trigger` seconds, boards are only buffered until
+    trigger() is called. A storage.storage_budget, if given, forecasts the
+    recording time left per board; when it runs low a board is switched to
+    delta compression, then rotated into a new file while the oldest of its
+    files are deleted, and finally stopped.
+    """
+
+    def __init__(self, backend, out_dir, rescan_interval=2.0,
+                 stall_timeout=5.0, pre_trigger=None, post_trigger=10.0,
+                 budget=None, **recorder_options):
+        self.__backend = backend
+        self.__out_dir = out_dir
+        self.__rescan_interval = rescan_interval
+        self.__stall_timeout = stall_timeout
+        self.__trigger_seconds = None if pre_trigger is None else \
+            (pre_trigger, post_trigger)
+        self.__recorder_options = recorder_options
+        self.__budget = budget
+        # boards stopped because the disk is full, not reopened
+        self.__full = set()
+        self.__sessions = {}
+        self.__reconnects = {}
+        self.__totals = {}
+        self.__running = False
+
+    @property
+    def sessions(self):
+        return dict(self.__sessions)
+
+    def _path(self, serial, suffix='', layout=None):
+        stamp = time.strftime('%Y-%m-%d_%H-%M-%S')
+        extension = file_extension(
+            layout or self.__recorder_options.get('layout'))
+        stem = os.path.join(self.__out_dir, serial + suffix + '_' + stamp)
+        path = stem + extension
+        # a rotation or reconnect within the same second
+        part = 1
+        while os.path.exists(path):
+            part += 1
+            path = stem + '_' + str(part) + extension
+        return path
+
+    def _open(self, serial):
+        try:
+            device = self.__backend.open(serial)
+        except IOError as e:
+            print('Could not open ' + serial + ': ' + str(e))
+            return
+        suffix = '' if self.__trigger_seconds is None else '_trigger'
+        session = capture_session(serial, self.__backend, device,
+                                  lambda: self._path(serial, suffix),
+                                  self.__recorder_options,
+                                  self.__trigger_seconds)
+        try:
+            session.start()
+        except Exception as e:
+            print('Could not start ' + serial + ': ' + str(e))
+            session.stop()
+            return
+        if serial in self.__totals:
+            self.__reconnects[serial] = self.__reconnects.get(serial, 0) + 1
+        self.__totals.setdefault(serial, 0)
+        self.__sessions[serial] = session
+        if self.__trigger_seconds is None:
+            print('Recording ' + serial + ' to ' + session.recorder.path)
+        else:
+            print('Buffering ' + serial + ' until triggered')
+        if self.__budget is not None:
+            options = session.options
+            self.__budget.watch(
+                serial, session.recorder, self.__out_dir,
+                expected_rate=storage.expected_rate(
+                    device.shape, device.fps,
+                    options.get('layout', 'stacked'),
+                    options.get('compression')))
+
+    def _close(self, serial):
+        session = self.__sessions.pop(serial)
+        if self.__budget is not None:
+            self.__budget.unwatch(serial)
+        try:
+            session.stop()
+        except Exception as e:
+            print('Error closing ' + serial + ': ' + str(e))
+        self.__totals[serial] += session.frames
+        print('Closed ' + serial + ' after ' + str(session.frames) + ' frames')
+
+    def rescan(self):
+        attached = set(self.__backend.enumerate())
+        for serial in list(self.__sessions):
+            session = self.__sessions[serial]
+            if session.error is not None:
+                # reopened below, into a new file
+                print('Recording ' + serial + ' failed: ' + str(session.error))
+                self._close(serial)
+            elif (serial not in attached
+                    or session.stalled(self.__stall_timeout)):
+                self._close(serial)
+        for serial in sorted(attached - set(self.__sessions) - self.__full):
+            self._open(serial)
+
+    def check_storage(self):
+        """Act on the storage budget's forecast."""
+        if self.__budget is None:
+            return
+        actions = self.__budget.update()
+        for serial, forecast in sorted(self.__budget.forecast().items()):
+            for path in forecast['deleted']:
+                print('{0}: deleted {1} to make room'.format(serial, path))
+        for serial, action in actions:
+            session = self.__sessions.get(serial)
+            if session is None:
+                continue
+            left = self.__budget.forecast(serial)['seconds_left']
+            print('{0}: {1:.1f} minutes of storage left, {2}'.format(
+                serial, left / 60.0, action))
+            if action == 'stop':
+                self._close(serial)
+                self.__full.add(serial)
+                continue
+            options = session.options
+            layout = options.get('layout', 'stacked')
+            compression = options.get('compression')
+            if action == 'compress':
+                if storage.compressed_layout(layout, compression) == \
+                        (layout, compression):
+                    continue
+                layout, compression = storage.compressed_layout(
+                    layout, compression)
+            # the budget deletes the oldest closed files once this one is
+            # closed, so the board keeps recording into a ring of files
+            try:
+                recorder = session.rotate(
+                    self._path(serial, layout=layout), layout=layout,
+                    compression=compression)
+            except Exception as e:
+                print('Could not rotate ' + serial + ': ' + str(e))
+                continue
+            if recorder is not None:
+                self.__budget.watch(serial, recorder, self.__out_dir)
+                print('Recording ' + serial + ' to ' + recorder.path)
+
+    def trigger(self, event=None):
+        """Start (or extend) a triggered recording on every board."""
+        if event is None:
+            event = {'time': time.time(), 'kind': 'trigger'}
+        for session in list(self.__sessions.values()):
+            session.trigger(event)
+
+    def stats(self):
+        result = {}
+        for serial in self.__totals:
+            entry = {'connected': serial in self.__sessions,
+                     'reconnects': self.__reconnects.get(serial, 0),
+                     'total_frames': self.__totals[serial]}
+            if serial in self.__sessions:
+                session_stats = self.__sessions[serial].stats()
+                entry.update(session_stats)
+                entry['total_frames'] += session_stats['frames']
+            forecast = self.__budget.forecast(serial) \
+                if self.__budget is not None else None
+            if forecast is not None:
+                entry['seconds_left'] = forecast['seconds_left']
+            entry['disk_full'] = serial in self.__full
+            result[serial] = entry
+        return result
+
+    def run(self, duration=None, stats_interval=10.0):
+        self.__running = True
+        start = time.monotonic()
+        last_stats = start
+        try:
+            while self.__running:
+                self.rescan()
+                self.check_storage()
+                now = time.monotonic()
+                if duration is not None and now - start >= duration:
+                    break
+                if stats_interval and now - last_stats >= stats_interval:
+                    last_stats = now
+                    print_stats(self.stats())
+                time.sleep(self.__rescan_interval)
+        finally:
+            self.close()
+
+    def stop(self):
+        self.__running = False
+
+    def close(self):
+        for serial in list(self.__sessions):
+            self._close(serial)
+
+
+def print_stats(stats):
+    for serial, entry in sorted(stats.items()):
+        if entry['connected']:
+            print('{0}: {1} frames, {2:.2f} fps, dropped {3}/{4}, '
+                  'pending {5}, reconnects {6}{7}'.format(
+                      serial, entry['total_frames'], entry['fps'],
+                      entry['ring_dropped'], entry['recorder_dropped'],
+                      entry['pending'], entry['reconnects'],
+                      _time_left(entry)))
+        else:
+            print('{0}: {1}, {2} frames, reconnects {3}'.format(
+                serial, 'disk full' if entry['disk_full'] else 'disconnected',
+                entry['total_frames'], entry['reconnects']))
+
+
+def _time_left(entry):
+    if 'seconds_left' not in entry:
+        return ''
+    return ', {0:.1f} hours of storage left'.format(
+        entry['seconds_left'] / 3600.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Record every attached PureThermal board without a GUI.')
+    parser.add_argument('--out', default='.',
+                        help='directory for the recordings')
+    parser.add_argument('--layout', default='stacked',
+                        choices=LAYOUTS)
+    parser.add_argument('--compression', default=None,
+                        choices=('gzip', 'lzf', 'delta'))
+    parser.add_argument('--duration', type=float, default=None,
+                        help='stop after this many seconds')
+    parser.add_argument('--rescan', type=float, default=2.0,
+                        help='seconds between device scans')
+    parser.add_argument('--stats', type=float, default=10.0,
+                        help='seconds between statistics printouts')
+    parser.add_argument('--simulate', type=int, default=0, metavar='N',
+                        help='use N simulated cameras instead of libuvc')
+    parser.add_argument('--pre-trigger', type=float, default=None,
+                        metavar='SECONDS',
+                        help='only record when triggered by SIGUSR1, '
+                             'starting this many seconds earlier')
+    parser.add_argument('--post-trigger', type=float, default=10.0,
+                        metavar='SECONDS',
+                        help='keep recording this long after a trigger')
+    parser.add_argument('--compress-below', type=float,
+                        default=storage.COMPRESS_SECONDS, metavar='SECONDS',
+                        help='switch to delta compression when less '
+                             'recording time than this is left, 0 never')
+    parser.add_argument('--rotate-below', type=float,
+                        default=storage.ROTATE_SECONDS, metavar='SECONDS',
+                        help='continue in a new file and delete the oldest '
+                             'ones of the board when less time is left, '
+                             '0 never')
+    parser.add_argument('--stop-below', type=float,
+                        default=storage.STOP_SECONDS, metavar='SECONDS',
+                        help='stop recording when less time is left, '
+                             '0 never')
+    args = parser.parse_args()
+
+    if args.simulate > 0:
+        backend = simulated_backend(
+            ['SIM{0:05d}'.format(i + 1) for i in range(args.simulate)])
+    else:
+        backend = libuvc_backend()
+    budget = storage.storage_budget(compress_seconds=args.compress_below,
+                                    rotate_seconds=args.rotate_below,
+                                    stop_seconds=args.stop_below)
+    daemon = capture_daemon(backend, args.out, rescan_interval=args.rescan,
+                            pre_trigger=args.pre_trigger,
+                            post_trigger=args.post_trigger, budget=budget,
+                            layout=args.layout, compression=args.compression)
+    if args.pre_trigger is not None and hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: daemon.trigger(
+            {'time': time.time(), 'kind': 'trigger', 'source': 'signal'}))
+    try:
+        daemon.run(args.duration, args.stats)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print_stats(daemon.stats())
+        if hasattr(backend, 'exit'):
+            backend.exit()
+
+
+if __name__ == '__main__':
+    main()
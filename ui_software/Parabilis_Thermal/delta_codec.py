@@ -0,0 +1,567 @@
+#!/usr/bin/env python3
+# Lossless compression of Y16 thermal video: every frame is predicted from
+# the previous one (keyframes from their left and upper neighbours), the
+# residuals are zig-zag coded and Rice coded in groups of GROUP pixels.
+# Recordings are written either as stacked HDF5 with compression='delta'
+# or as a standalone container. Run as
+#   python3 delta_codec.py info <file.ptdelta>
+#   python3 delta_codec.py pack <recording> <file.ptdelta or file.HDF5>
+#   python3 delta_codec.py unpack <recording> <file.HDF5>
+import argparse
+import json
+import os
+import threading
+import time
+import h5py
+import numpy as np
+
+CODEC_VERSION = 1
+# pixels sharing one Rice parameter; their low bits are stored as 32-bit
+# bit planes
+GROUP = 32
+# zig-zag coded differences of two uint16 values need at most 17 bits
+PLANES = 17
+# a keyframe every this many frames bounds the decoding for a random seek
+KEYFRAME_INTERVAL = 16
+KEYFRAME = 1
+INTERFRAME = 0
+
+# standalone container: a header page, then one record per frame (RECORD
+# followed by its payload) and, once the file is closed, an INDEX of the
+# records so a reader need not walk them
+MAGIC = b'PTDELTA\x01'
+VERSION = 1
+EXTENSION = '.ptdelta'
+HEADER_SIZE = 4096
+HEADER = np.dtype([
+    ('magic', 'S8'),
+    ('version', '<u4'),
+    ('height', '<u4'),
+    ('width', '<u4'),
+    ('complete', '<u4'),
+    ('count', '<u8'),
+    ('created', '<f8'),
+    ('keyframe_interval', '<u4'),
+    ('attrs_size', '<u4'),
+    ('index_offset', '<u8'),
+    ('data_end', '<u8'),
+])
+RECORD = np.dtype([
+    ('timestamp', '<f8'),
+    ('sequence', '<i8'),
+    ('flags', '<u4'),
+    ('size', '<u4'),
+])
+INDEX = np.dtype([
+    ('offset', '<u8'),
+    ('timestamp', '<f8'),
+    ('sequence', '<i8'),
+    ('flags', '<u4'),
+    ('size', '<u4'),
+])
+
+# delta compressed stacked HDF5 recordings keep the payloads of all frames
+# back to back in DATA and where each one ends in OFFSETS, instead of the
+# recording_schema 'frames' dataset
+DATA = 'delta_data'
+OFFSETS = 'delta_offsets'
+
+_PLANE_SHIFTS = np.arange(PLANES, dtype=np.uint32)
+
+
+def _groups(shape):
+    return -(-shape[0] * shape[1] // GROUP)
+
+
+def encode(frame, previous=None):
+    """
+    Payload of one frame: a kind byte, the Rice parameter k of every group,
+    the k low bit planes of every group, 4 bytes each, and the remaining
+    high bits of every value in unary. Without `previous` the frame is a
+    keyframe.
+    """
+    current = frame.astype(np.int32)
+    if previous is None:
+        kind = KEYFRAME
+        residual = current.copy()
+        residual[:, 1:] -= current[:, :-1]
+        residual[1:, 0] -= current[:-1, 0]
+    else:
+        kind = INTERFRAME
+        residual = current - previous
+    residual = residual.ravel()
+    padded = np.zeros(_groups(frame.shape) * GROUP, np.uint32)
+    padded[:residual.size] = (residual << 1) ^ (residual >> 31)
+    values = padded.reshape(-1, GROUP)
+    # the k with the fewest bits: k planes plus the unary high parts
+    high = values[:, None, :] >> _PLANE_SHIFTS[:, None]
+    cost = high.sum(axis=2, dtype=np.int64) + GROUP * _PLANE_SHIFTS
+    ks = cost.argmin(axis=1).astype(np.uint8)
+    planes = int(ks.max())
+    bits = ((values[:, None, :] >> _PLANE_SHIFTS[:planes, None])
+            & 1).astype(np.uint8)
+    words = np.packbits(bits, axis=-1, bitorder='little')
+    words = words[_PLANE_SHIFTS[:planes] < ks[:, None]]
+    # every value is a run of zeros ended by a one
+    quotients = high[np.arange(len(ks)), ks].ravel()
+    unary = np.zeros(int(quotients.sum()) + quotients.size, np.uint8)
+    unary[np.cumsum(quotients + 1) - 1] = 1
+    return (bytes((kind,)) + ks.tobytes() + words.tobytes()
+            + np.packbits(unary, bitorder='little').tobytes())
+
+
+def decode(payload, shape, previous=None):
+    """Frame encoded in `payload`; interframes need the previous frame."""
+    payload = np.frombuffer(payload, np.uint8)
+    groups = _groups(shape)
+    kind = payload[0]
+    ks = payload[1:1 + groups]
+    planes = int(ks.max()) if groups else 0
+    used = _PLANE_SHIFTS[:planes] < ks[:, None]
+    start = 1 + groups
+    end = start + 4 * int(ks.sum(dtype=np.int64))
+    words = np.zeros((groups, planes, 4), np.uint8)
+    words[used] = payload[start:end].reshape(-1, 4)
+    bits = np.unpackbits(words, axis=-1, bitorder='little')
+    values = np.zeros((groups, GROUP), np.uint32)
+    for plane in range(planes):
+        values |= bits[:, plane].astype(np.uint32) << plane
+    ones = np.flatnonzero(
+        np.unpackbits(payload[end:], bitorder='little'))[:groups * GROUP]
+    quotients = np.diff(ones, prepend=-1) - 1
+    values |= quotients.reshape(groups, GROUP).astype(np.uint32) \
+        << ks[:, None].astype(np.uint32)
+    values = values.ravel()[:shape[0] * shape[1]]
+    residual = ((values >> 1).astype(np.int32)
+                ^ -(values & 1).astype(np.int32)).reshape(shape)
+    if kind == KEYFRAME:
+        residual[:, 0] = np.cumsum(residual[:, 0])
+        current = np.cumsum(residual, axis=1)
+    elif previous is None:
+        raise ValueError('An interframe needs the previous frame')
+    else:
+        current = residual + previous
+    return current.astype(np.uint16)
+
+
+class delta_encoder(object):
+    """Encodes consecutive frames, with a keyframe every keyframe_interval."""
+
+    def __init__(self, keyframe_interval=KEYFRAME_INTERVAL):
+        self.__keyframe_interval = keyframe_interval
+        self.__previous = None
+        self.__count = 0
+
+    @property
+    def keyframe_interval(self):
+        return self.__keyframe_interval
+
+    def encode(self, frame):
+        previous = None if self.__count % self.__keyframe_interval == 0 \
+            else self.__previous
+        payload = encode(frame, previous)
+        self.__previous = frame.astype(np.int32)
+        self.__count += 1
+        return payload
+
+
+class delta_frames(object):
+    """
+    Read-only (N, H, W) view of delta coded frames, indexed like the
+    'frames' dataset of a stacked recording. `payload(i)` returns the bytes
+    of frame i. The last decoded frame is kept, so reading in order
+    decodes every frame once; a seek decodes from the keyframe before it.
+    """
+
+    def __init__(self, payload, count, shape,
+                 keyframe_interval=KEYFRAME_INTERVAL):
+        self.__payload = payload
+        self.__count = count
+        self.__frame_shape = tuple(shape)
+        self.__keyframe_interval = keyframe_interval
+        self.__last = None
+        self.__lock = threading.Lock()
+
+    @property
+    def shape(self):
+        return (self.__count,) + self.__frame_shape
+
+    @property
+    def dtype(self):
+        return np.dtype(np.uint16)
+
+    def __len__(self):
+        return self.__count
+
+    def _get(self, index):
+        # called with the lock held
+        keyframe = index - index % self.__keyframe_interval
+        if (self.__last is not None
+                and keyframe <= self.__last[0] <= index):
+            first, frame = self.__last[0] + 1, self.__last[1]
+        else:
+            first, frame = keyframe, None
+        for i in range(first, index + 1):
+            frame = decode(self.__payload(i), self.__frame_shape, frame)
+        self.__last = (index, frame)
+        return frame
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            numbers = range(*key.indices(self.__count))
+            result = np.empty((len(numbers),) + self.__frame_shape,
+                              np.uint16)
+            with self.__lock:
+                for i, index in enumerate(numbers):
+                    result[i] = self._get(index)
+            return result
+        index = int(key)
+        if index < 0:
+            index += self.__count
+        if not 0 <= index < self.__count:
+            raise IndexError('Frame ' + str(key) + ' is out of range')
+        with self.__lock:
+            return self._get(index).copy()
+
+
+# stacked HDF5 recordings
+
+def create_hdf5(h5file, shape, keyframe_interval=KEYFRAME_INTERVAL):
+    """
+    Create the DATA and OFFSETS datasets in `h5file` and return the
+    hdf5_frame_writer that fills them.
+    """
+    data = h5file.create_dataset(DATA, shape=(0,), maxshape=(None,),
+                                 dtype=np.uint8, chunks=(1 << 16,))
+    h5file.create_dataset(OFFSETS, shape=(0,), maxshape=(None,),
+                          dtype=np.uint64, chunks=(1024,))
+    data.attrs['codec_version'] = CODEC_VERSION
+    data.attrs['keyframe_interval'] = keyframe_interval
+    data.attrs['frame_shape'] = tuple(shape)
+    return hdf5_frame_writer(h5file)
+
+
+def is_hdf5_delta(h5file):
+    return DATA in h5file and OFFSETS in h5file
+
+
+class hdf5_frame_writer(object):
+    """Appends frames to the delta datasets of an open HDF5 file."""
+
+    def __init__(self, h5file):
+        self.__data = h5file[DATA]
+        self.__offsets = h5file[OFFSETS]
+        self.__encoder = delta_encoder(
+            int(self.__data.attrs['keyframe_interval']))
+
+    def append(self, frames):
+        payloads = [self.__encoder.encode(frame) for frame in frames]
+        sizes = np.fromiter((len(p) for p in payloads), np.uint64,
+                            len(payloads))
+        start = self.__data.shape[0]
+        count = self.__offsets.shape[0]
+        self.__data.resize(start + int(sizes.sum()), axis=0)
+        self.__data[start:] = np.frombuffer(b''.join(payloads), np.uint8)
+        self.__offsets.resize(count + len(payloads), axis=0)
+        self.__offsets[count:] = start + np.cumsum(sizes)
+
+
+def hdf5_frames(h5file):
+    """delta_frames over the delta datasets of an open HDF5 file."""
+    data = h5file[DATA]
+    ends = h5file[OFFSETS][:].astype(np.int64)
+    starts = np.concatenate(([0], ends[:-1]))
+    return delta_frames(lambda i: data[starts[i]:ends[i]].tobytes(),
+                        len(ends),
+                        tuple(int(n) for n in data.attrs['frame_shape']),
+                        int(data.attrs['keyframe_interval']))
+
+
+# standalone container
+
+def is_delta(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+class delta_writer(object):
+    """
+    Writes a container record by record. `count` and the end of the data
+    in the header are updated after every append, so a reader or a crash
+    only ever sees complete frames; close() adds the index.
+    """
+
+    def __init__(self, path, shape, attrs=None,
+                 keyframe_interval=KEYFRAME_INTERVAL):
+        height, width = shape
+        self.__path = path
+        self.__encoder = delta_encoder(keyframe_interval)
+        self.__index = []
+        attrs_json = json.dumps(attrs or {}, default=str).encode()
+        if HEADER.itemsize + len(attrs_json) > HEADER_SIZE:
+            raise ValueError('Recording attributes do not fit the header')
+        self.__header = np.zeros(1, HEADER)
+        self.__header[0] = (MAGIC, VERSION, height, width, 0, 0, time.time(),
+                            keyframe_interval, len(attrs_json), 0,
+                            HEADER_SIZE)
+        self.__file = open(path, 'w+b')
+        self.__file.write(self.__header.tobytes())
+        self.__file.write(attrs_json)
+        self.__file.truncate(HEADER_SIZE)
+        self.__file.seek(HEADER_SIZE)
+
+    @property
+    def path(self):
+        return self.__path
+
+    @property
+    def count(self):
+        return len(self.__index)
+
+    def append(self, frames, sequence, timestamps, flags=0):
+        sequence = np.broadcast_to(sequence, len(frames))
+        timestamps = np.broadcast_to(timestamps, len(frames))
+        flags = np.broadcast_to(flags, len(frames))
+        offset = self.__file.tell()
+        parts = []
+        for i, frame in enumerate(frames):
+            payload = self.__encoder.encode(frame)
+            record = np.array([(timestamps[i], sequence[i], flags[i],
+                                len(payload))], RECORD)
+            self.__index.append((offset, timestamps[i], sequence[i],
+                                 flags[i], len(payload)))
+            offset += RECORD.itemsize + len(payload)
+            parts += [record.tobytes(), payload]
+        self.__file.write(b''.join(parts))
+        self.__file.flush()
+        self.__header['count'] = len(self.__index)
+        self.__header['data_end'] = offset
+        self._write_header()
+
+    def _write_header(self):
+        end = self.__file.tell()
+        self.__file.seek(0)
+        self.__file.write(self.__header.tobytes())
+        self.__file.flush()
+        self.__file.seek(end)
+
+    def flush(self):
+        self.__file.flush()
+
+    def close(self):
+        if self.__file.closed:
+            return
+        self.__header['index_offset'] = self.__file.tell()
+        self.__file.write(np.array(self.__index, INDEX).tobytes())
+        self.__header['complete'] = 1
+        self._write_header()
+        self.__file.close()
+
+
+def _read_header(path):
+    with open(path, 'rb') as f:
+        raw = f.read(HEADER_SIZE)
+    header = np.frombuffer(raw, HEADER, count=1)[0]
+    if header['magic'] != MAGIC:
+        raise ValueError(path + ' is not a delta recording')
+    if header['version'] > VERSION:
+        raise ValueError(path + ' has unsupported version ' +
+                         str(header['version']))
+    start = HEADER.itemsize
+    attrs = json.loads(raw[start:start + header['attrs_size']] or b'{}')
+    return header, attrs
+
+
+class delta_reader(object):
+    """
+    Reads a container through a read-only memory map. `frames` decodes on
+    indexing; the per-frame data comes from the index, or from walking
+    the records of a file that was not closed.
+    """
+
+    def __init__(self, path):
+        self.__path = path
+        self.__header, self.__attrs = _read_header(path)
+        self.__map = np.memmap(path, np.uint8, 'r')
+        if self.__header['complete']:
+            start = int(self.__header['index_offset'])
+            count = int(self.__header['count'])
+            self.__index = np.frombuffer(
+                self.__map[start:start + count * INDEX.itemsize], INDEX)
+        else:
+            self.__index = self._walk()
+        shape = (int(self.__header['height']), int(self.__header['width']))
+        payload = self.__index['offset'] + RECORD.itemsize
+        size = self.__index['size']
+        self.__frames = delta_frames(
+            lambda i: self.__map[payload[i]:payload[i] + size[i]],
+            len(self.__index), shape,
+            int(self.__header['keyframe_interval']))
+
+    def _walk(self):
+        # only frames counted in the header are known to be complete
+        records = []
+        offset = HEADER_SIZE
+        end = min(int(self.__header['data_end']), len(self.__map))
+        for _ in range(int(self.__header['count'])):
+            if offset + RECORD.itemsize > end:
+                break
+            record = np.frombuffer(
+                self.__map[offset:offset + RECORD.itemsize], RECORD)[0]
+            if offset + RECORD.itemsize + record['size'] > end:
+                break
+            records.append((offset, record['timestamp'], record['sequence'],
+                            record['flags'], record['size']))
+            offset += RECORD.itemsize + int(record['size'])
+        return np.array(records, INDEX)
+
+    @property
+    def path(self):
+        return self.__path
+
+    @property
+    def attrs(self):
+        return dict(self.__attrs)
+
+    @property
+    def complete(self):
+        """False while the file is being written or if writing was cut off."""
+        return bool(self.__header['complete'])
+
+    @property
+    def frames(self):
+        return self.__frames
+
+    def per_frame(self, name):
+        """'timestamps', 'sequence' or 'flags' as an array, else None."""
+        field = {'timestamps': 'timestamp', 'sequence': 'sequence',
+                 'flags': 'flags'}.get(name)
+        if field is None:
+            return None
+        return np.array(self.__index[field])
+
+    def summary(self):
+        count = len(self.__index)
+        height, width = self.__frames.shape[1:]
+        stored = int(self.__index['size'].sum()) + count * RECORD.itemsize
+        result = {
+            'format': 'delta',
+            'version': int(self.__header['version']),
+            'frames': count,
+            'shape': (height, width),
+            'complete': self.complete,
+            'created': float(self.__header['created']),
+            'keyframe_interval': int(self.__header['keyframe_interval']),
+            'compression_ratio': (count * height * width * 2.0 / stored
+                                  if stored else 0.0),
+        }
+        result.update(self.__attrs)
+        if count:
+            timestamps = self.__index['timestamp']
+            result['start'] = float(timestamps[0])
+            result['duration'] = float(timestamps[-1] - timestamps[0])
+        return result
+
+    def close(self):
+        self.__frames = None
+        self.__index = None
+        self.__map = None
+
+
+def convert(source, destination, compression='delta', batch=256):
+    """
+    Copy any recording heat_data reads, with its events and regions, into
+    a container (destination ending in EXTENSION) or a stacked HDF5 file
+    with `compression`. Returns the number of frames copied.
+    """
+    # imported here, all of them read delta recordings through this module
+    import heat_data
+    import raw_recording
+    import recording_schema
+    import roi
+    data = heat_data.heat_data(source)
+    try:
+        metadata = data.metadata
+        attrs = {key: metadata[key] for key in recording_schema.ATTRIBUTES
+                 if key in metadata}
+        attrs['converted_from'] = source
+        count = data.last_frame
+        columns = [data.per_frame(name)
+                   for name in ('sequence', 'timestamps', 'flags')]
+        defaults = [np.arange(count),
+                    np.arange(count) / float(attrs.get('fps', 8.7)),
+                    np.zeros(count, np.uint8)]
+        sequence, timestamps, flags = [
+            default if column is None else column
+            for column, default in zip(columns, defaults)]
+        if destination.endswith(EXTENSION):
+            writer = delta_writer(destination, data.shape, attrs)
+            for first in range(0, count, batch):
+                part = slice(first, first + batch)
+                writer.append(data.frames(first + 1, first + batch + 1),
+                              sequence[part], timestamps[part], flags[part])
+            writer.close()
+            # events go next to the container, as for raw recordings
+            if data.events:
+                raw_recording.append_events(destination, data.events)
+            regions = roi.load(source)
+            if regions:
+                roi.save(destination, regions)
+            return count
+        with h5py.File(destination, 'w') as f:
+            frame_writer = recording_schema.create(
+                f, data.shape, compression=compression, attrs=attrs)
+            for first in range(0, count, batch):
+                part = slice(first, first + batch)
+                recording_schema.append(
+                    f, first, data.frames(first + 1, first + batch + 1),
+                    sequence[part], timestamps[part], flags[part],
+                    frame_writer)
+            if data.events:
+                recording_schema.append_events(f, data.events)
+            regions = roi.load(source)
+            if regions:
+                roi.store(f, regions)
+        return count
+    finally:
+        data.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Inspect, write or expand delta compressed recordings.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    info = commands.add_parser('info', help='print a container summary')
+    info.add_argument('path')
+    pack = commands.add_parser(
+        'pack', help='delta compress a recording into a container (' +
+        EXTENSION + ') or an HDF5 file')
+    pack.add_argument('source')
+    pack.add_argument('destination')
+    unpack = commands.add_parser(
+        'unpack', help='rewrite as an uncompressed stacked HDF5 file')
+    unpack.add_argument('source')
+    unpack.add_argument('destination')
+    unpack.add_argument('--compression', default=None,
+                        choices=('gzip', 'lzf'))
+    args = parser.parse_args()
+
+    if args.command == 'info':
+        reader = delta_reader(args.path)
+        for key, value in reader.summary().items():
+            print('{0}: {1}'.format(key, value))
+        reader.close()
+        return
+    compression = 'delta' if args.command == 'pack' else args.compression
+    started = time.perf_counter()
+    count = convert(args.source, args.destination, compression)
+    seconds = time.perf_counter() - started
+    print('Wrote {0} frames to {1} in {2:.1f} s, {3:.1f} KB per frame'.format(
+        count, args.destination, seconds,
+        os.path.getsize(args.destination) / 1e3 / max(count, 1)))
+
+if __name__ == '__main__':
+    main()
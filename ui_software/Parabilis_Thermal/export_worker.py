@@ -0,0 +1,41 @@
+# Worker side of the process pools save_as exports with. Workers only need
+# this module, heat_data and the export functions, never the GUI that
+# started the export.
+import multiprocessing
+import sys
+import types
+import heat_data
+
+# workers are spawned, not forked: the GUI calling the exports has prefetch
+# threads and open HDF5 handles, and a forked child can inherit a lock one
+# of them held and deadlock
+_pool_context = multiprocessing.get_context('spawn')
+# the recording, opened once per worker
+_worker_data = None
+
+
+def _open(fullpath):
+    global _worker_data
+    _worker_data = heat_data.heat_data(fullpath)
+
+
+def pool(fullpath, processes):
+    """
+    Pool of `processes` workers, each with the recording at `fullpath`.
+    Spawned workers import the parent's __main__ before anything else, for
+    PostProcessIR that is PyQt5, matplotlib and the .ui file, so it is
+    hidden from them while they start. A worker replacing one that died
+    later does import it, which only costs time.
+    """
+    main = sys.modules['__main__']
+    sys.modules['__main__'] = types.ModuleType('__main__')
+    try:
+        return _pool_context.Pool(processes, _open, (fullpath,))
+    finally:
+        sys.modules['__main__'] = main
+
+
+def run(job):
+    """Run a (task, first, stop, args) job on the worker's recording."""
+    task, first, stop, args = job
+    return task(_worker_data, first, stop, *args)
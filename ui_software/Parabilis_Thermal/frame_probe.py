@@ -0,0 +1,86 @@
+import threading
+import numpy as np
+import radiometry
+
+
+class frame_probe(object):
+    """
+    Temperature queries against the newest frame of a frame ring. Every
+    query copies the latest frame at native resolution (ring.latest() does
+    not consume it, so the display and recorder see every frame as before)
+    and reads from that copy. Coordinates are sensor pixels; to_sensor()
+    maps positions in a display of `display_size` (width, height) onto them.
+    Values are raw centikelvin unless a unit ('K', 'C', 'F') is given.
+    """
+
+    def __init__(self, ring, display_size=(640, 480)):
+        self.__ring = ring
+        self.__height, self.__width = ring.shape
+        self.display_size = display_size
+        self.__frame = np.empty(ring.shape, np.uint16)
+        self.__lock = threading.Lock()
+
+    def to_sensor(self, x, y):
+        """Sensor (column, row) under display position (x, y), clamped."""
+        display_width, display_height = self.display_size
+        col = int(x * self.__width / float(display_width))
+        row = int(y * self.__height / float(display_height))
+        return (min(max(col, 0), self.__width - 1),
+                min(max(row, 0), self.__height - 1))
+
+    def _snapshot(self):
+        if self.__ring.latest(self.__frame) is None:
+            raise LookupError('No frame received yet')
+        return self.__frame
+
+    def _values(self, raw, unit):
+        if unit is None:
+            return raw
+        values = radiometry.convert(raw, unit)
+        return float(values) if np.ndim(values) == 0 else values
+
+    def point(self, col, row, unit=None):
+        with self.__lock:
+            return self._values(int(self._snapshot()[row, col]), unit)
+
+    def profile(self, start, end, unit=None):
+        """
+        Values along the line from sensor point `start` to `end`, one
+        sample per pixel step, as a 1-D array.
+        """
+        (col0, row0), (col1, row1) = start, end
+        samples = max(abs(col1 - col0), abs(row1 - row0)) + 1
+        cols = np.rint(np.linspace(col0, col1, samples)).astype(np.intp)
+        rows = np.rint(np.linspace(row0, row1, samples)).astype(np.intp)
+        np.clip(cols, 0, self.__width - 1, out=cols)
+        np.clip(rows, 0, self.__height - 1, out=rows)
+        with self.__lock:
+            values = self._snapshot()[rows, cols]
+        return self._values(values, unit)
+
+    def region(self, col, row, width, height, unit=None):
+        """
+        min, max, mean and std of a rectangle plus where its min and max
+        are, as (column, row) sensor coordinates.
+        """
+        col0, row0 = max(col, 0), max(row, 0)
+        col1 = min(col + width, self.__width)
+        row1 = min(row + height, self.__height)
+        if col1 <= col0 or row1 <= row0:
+            raise ValueError('Region lies outside the frame')
+        with self.__lock:
+            roi = self._snapshot()[row0:row1, col0:col1].copy()
+        low = np.unravel_index(roi.argmin(), roi.shape)
+        high = np.unravel_index(roi.argmax(), roi.shape)
+        spread = float(roi.std())
+        if unit is not None:
+            # a spread is a difference, so only the scale applies
+            spread *= 0.018 if unit == 'F' else 0.01
+        return {
+            'min': self._values(int(roi[low]), unit),
+            'max': self._values(int(roi[high]), unit),
+            'mean': self._values(float(roi.mean()), unit),
+            'std': spread,
+            'min_loc': (col0 + int(low[1]), row0 + int(low[0])),
+            'max_loc': (col0 + int(high[1]), row0 + int(high[0])),
+        }
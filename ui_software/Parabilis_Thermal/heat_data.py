@@ -1,12 +1,53 @@
+from collections import OrderedDict
 import h5py
 import cv2
+import numpy as np
+import recording_schema
+import raw_recording
+import delta_codec
+
+# size of the HDF5 chunk cache, large enough for a few chunks of frames
+CHUNK_CACHE_BYTES = 16 * 1024 * 1024
 
 
 class heat_data(object):
-    def __init__(self, fullpath):
+    def __init__(self, fullpath, cache_size=32):
         self.__fullpath = fullpath
-        self.__raw_data = h5py.File(fullpath, 'r')
-        self.__last_frame = len(self.__raw_data)
+        self.__cache = OrderedDict()
+        self.__cache_size = cache_size
+        self.__stack = None
+        self.__index = None
+        self.__raw_file = None
+        self.__layout = None
+        if raw_recording.is_raw(fullpath) or delta_codec.is_delta(fullpath):
+            # memory-mapped, frames are read straight from the page cache
+            # (and decoded on the way, for delta containers)
+            if raw_recording.is_raw(fullpath):
+                self.__layout = 'raw'
+                self.__raw_file = raw_recording.raw_reader(fullpath)
+            else:
+                self.__layout = 'delta'
+                self.__raw_file = delta_codec.delta_reader(fullpath)
+            self.__raw_data = None
+            self.__version = None
+            self.__stack = self.__raw_file.frames
+            self.__last_frame = self.__stack.shape[0]
+            return
+        self.__raw_data = h5py.File(
+            fullpath, 'r', rdcc_nbytes=CHUNK_CACHE_BYTES)
+        self.__version = recording_schema.version(self.__raw_data)
+        if self.__version is not None:
+            # an h5py dataset, or a decoding view of delta coded frames
+            self.__stack = recording_schema.frames(self.__raw_data)
+            self.__last_frame = self.__stack.shape[0]
+        else:
+            # legacy file: look every "imageN" dataset up once instead of by
+            # name on each frame(). Frames are numbered 1 to last_frame in
+            # the order of N, so a gap in the numbering (a frame that was
+            # never written) is skipped as convert_legacy does
+            numbered = recording_schema.legacy_frames(self.__raw_data)
+            self.__last_frame = len(numbered)
+            self.__index = [None] + [numbered[i] for i in sorted(numbered)]
 
     @property
     def fullpath(self):
@@ -20,9 +61,108 @@ class heat_data(object):
     def last_frame(self):
         return self.__last_frame
 
+    @property
+    def layout(self):
+        if self.__raw_file is not None:
+            return self.__layout
+        return 'stacked' if self.__stack is not None else 'image'
+
+    @property
+    def shape(self):
+        if self.__stack is not None:
+            return self.__stack.shape[1:]
+        if self.__last_frame == 0:
+            return (0, 0)
+        return self.__index[1].shape
+
+    @property
+    def schema_version(self):
+        """recording_schema version, None for legacy recordings."""
+        return self.__version
+
+    @property
+    def metadata(self):
+        """Device attributes, frame count and time span of the recording."""
+        if self.__raw_file is not None:
+            return self.__raw_file.summary()
+        if self.__stack is None:
+            return {'schema_version': None, 'frames': self.__last_frame,
+                    'shape': self.shape}
+        return recording_schema.summary(self.__raw_data)
+
+    def per_frame(self, name):
+        """
+        A whole per-frame dataset ('timestamps', 'sequence', 'flags',
+        'frame_min', 'frame_max', 'frame_mean') as an array, None when the
+        recording does not have it.
+        """
+        if self.__raw_file is not None:
+            return self.__raw_file.per_frame(name)
+        if self.__stack is None or name not in self.__raw_data:
+            return None
+        return self.__raw_data[name][:]
+
+    @property
+    def timestamps(self):
+        # only stacked recordings store capture times
+        return self.per_frame('timestamps')
+
+    @property
+    def events(self):
+        """Events (alarms) logged during the recording, as dicts."""
+        if self.__raw_file is not None:
+            return raw_recording.read_events(self.__fullpath)
+        return recording_schema.read_events(self.__raw_data)
+
+    def _read(self, num):
+        if not 1 <= num <= self.__last_frame:
+            raise IndexError('Frame ' + str(num) + ' is out of range')
+        if self.__stack is not None:
+            # a copy, so raw recordings do not pin the memory map
+            return np.array(self.__stack[num - 1])
+        return self.__index[num][:]
+
     def frame(self, num, width, height):
-        # images are labeld from "image1" to "image" + len(self.__raw_data)
-        raw_frame = self.raw_data[('image' + str(num))][:]
-        if(width == 0 or height == 0):
-            return raw_frame
-        return cv2.resize(raw_frame, (width, height))
+        # frames are numbered from 1 to last_frame. The result is cached and
+        # read-only, copy it before modifying it.
+        key = (num, width, height)
+        cached = self.__cache.get(key)
+        if cached is not None:
+            self.__cache.move_to_end(key)
+            return cached
+        if width == 0 or height == 0:
+            result = self._read(num)
+        else:
+            result = cv2.resize(self.frame(num, 0, 0), (width, height))
+        result.flags.writeable = False
+        self.__cache[key] = result
+        if len(self.__cache) > self.__cache_size:
+            self.__cache.popitem(last=False)
+        return result
+
+    def frames(self, start, stop, step=1, width=0, height=0):
+        """
+        Frames start, start + step, ... before stop as one (N, H, W) array,
+        read in a single slice for stacked recordings.
+        """
+        numbers = range(max(start, 1), min(stop, self.__last_frame + 1), step)
+        if self.__stack is not None and len(numbers) > 0:
+            raw = self.__stack[numbers.start - 1:numbers.stop - 1:step]
+        else:
+            raw = np.empty((len(numbers),) + tuple(self.shape), np.uint16)
+            for i, num in enumerate(numbers):
+                self.__index[num].read_direct(raw[i])
+        if width == 0 or height == 0:
+            return raw
+        resized = np.empty((len(raw), height, width), np.uint16)
+        for i in range(len(raw)):
+            cv2.resize(raw[i], (width, height), dst=resized[i])
+        return resized
+
+    def close(self):
+        self.__cache.clear()
+        if self.__raw_file is not None:
+            self.__stack = None
+            self.__raw_file.close()
+        else:
+            self.__raw_data.close()
@@ -0,0 +1,232 @@
+import threading
+import time
+from collections import OrderedDict
+import cv2
+import numpy as np
+import colors
+
+SPEEDS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0)
+# Lepton frame rate, used when a recording has no usable timestamps
+DEFAULT_FPS = 8.7
+
+
+def render_rgb(frame, colormap):
+    """Colorized RGB image of a raw frame at sensor resolution."""
+    return cv2.cvtColor(colors.colorize(frame, colormap), cv2.COLOR_BGR2RGB)
+
+
+class frame_prefetcher(object):
+    """
+    Reads and colorizes the frames after the current playback position on a
+    background thread, so the viewer only has to hand a finished image to
+    the display. get() returns (raw frame, RGB image) and moves the position;
+    frames not prefetched yet are read on the spot. Changing the colour map
+    drops everything prefetched.
+    """
+
+    def __init__(self, data, colormap='ironblack', ahead=32, batch=8):
+        self.__data = data
+        self.__colormap = colormap
+        self.__ahead = ahead
+        self.__batch = batch
+        self.__frames = OrderedDict()
+        self.__position = 1
+        self.__step = 1
+        # bumped whenever prefetched images become stale
+        self.__generation = 0
+        self.__running = True
+        self.__cond = threading.Condition()
+        self.hits = 0
+        self.misses = 0
+        self.__thread = threading.Thread(target=self._run, daemon=True)
+        self.__thread.start()
+
+    @property
+    def colormap(self):
+        return self.__colormap
+
+    @colormap.setter
+    def colormap(self, colormap):
+        with self.__cond:
+            if colormap != self.__colormap:
+                self.__colormap = colormap
+                self.__frames.clear()
+                self.__generation += 1
+
+    def _wanted(self):
+        # playback order from the current position, at most `ahead` frames
+        stop = self.__data.last_frame + 1
+        return range(self.__position,
+                     min(stop, self.__position + self.__ahead * self.__step),
+                     self.__step)
+
+    def _missing(self):
+        for number in self._wanted():
+            if number not in self.__frames:
+                return number
+        return None
+
+    def get(self, number, step=1):
+        """(raw, rgb) of frame `number`; playback continues in `step`s."""
+        with self.__cond:
+            self.__position = number
+            self.__step = max(1, step)
+            item = self.__frames.get(number)
+            colormap = self.__colormap
+            self.__cond.notify_all()
+        if item is not None:
+            self.hits += 1
+            return item
+        self.misses += 1
+        raw = self.__data.frames(number, number + 1)[0]
+        return raw, render_rgb(raw, colormap)
+
+    def _run(self):
+        while True:
+            with self.__cond:
+                self.__cond.wait_for(
+                    lambda: not self.__running or self._missing() is not None)
+                if not self.__running:
+                    return
+                first = self._missing()
+                step = self.__step
+                stop = min(first + self.__batch * step,
+                           self.__data.last_frame + 1)
+                generation = self.__generation
+                colormap = self.__colormap
+            raw = self.__data.frames(first, stop, step)
+            images = [render_rgb(frame, colormap) for frame in raw]
+            with self.__cond:
+                if generation != self.__generation:
+                    continue
+                for i, frame in enumerate(raw):
+                    self.__frames[first + i * step] = (frame, images[i])
+                # drop frames playback has moved past, oldest first, keeping
+                # a small reserve for stepping back
+                wanted = set(self._wanted())
+                for number in list(self.__frames):
+                    if (number not in wanted and len(self.__frames)
+                            > self.__ahead + self.__batch):
+                        del self.__frames[number]
+
+    def close(self):
+        with self.__cond:
+            self.__running = False
+            self.__cond.notify_all()
+        self.__thread.join()
+
+
+class playback_clock(object):
+    """
+    Media clock for playing a recording back in real time or at `speed`
+    times real time. Frame times come from the recorded timestamps, or are
+    spaced 1 / fps apart when there are none. tick() says which frame is due
+    now, so frames are skipped instead of played late when the display
+    cannot keep up. Frames are numbered from 1, like heat_data.
+    """
+
+    def __init__(self, timestamps=None, frames=0, fps=DEFAULT_FPS):
+        if (timestamps is not None and len(timestamps) == frames > 0
+                and np.all(np.isfinite(timestamps))):
+            # a clock adjusted during recording must not run backwards
+            times = np.maximum.accumulate(timestamps - timestamps[0])
+        else:
+            times = np.arange(frames, dtype=np.float64) / fps
+        self.__times = times
+        self.__speed = 1.0
+        self.__playing = False
+        # media time at wall clock time __started while playing
+        self.__origin = 0.0
+        self.__started = 0.0
+        self.__last_frame = 1
+        self.__stop_frame = max(frames, 1)
+        self.dropped = 0
+
+    @property
+    def frames(self):
+        return len(self.__times)
+
+    @property
+    def duration(self):
+        return float(self.__times[-1]) if len(self.__times) else 0.0
+
+    @property
+    def fps(self):
+        """Average frame rate of the recording."""
+        if self.duration <= 0:
+            return DEFAULT_FPS
+        return (len(self.__times) - 1) / self.duration
+
+    @property
+    def speed(self):
+        return self.__speed
+
+    @speed.setter
+    def speed(self, speed):
+        if not SPEEDS[0] <= speed <= SPEEDS[-1]:
+            raise ValueError('Speed must be between {0}x and {1}x'.format(
+                SPEEDS[0], SPEEDS[-1]))
+        # restart from the current position so the change takes effect now
+        self.seek(self.position)
+        self.__speed = speed
+
+    @property
+    def playing(self):
+        return self.__playing
+
+    @property
+    def position(self):
+        """Current media time in seconds from the first frame."""
+        if not self.__playing:
+            return self.__origin
+        return (self.__origin
+                + (time.monotonic() - self.__started) * self.__speed)
+
+    def time_of(self, frame):
+        return float(self.__times[frame - 1])
+
+    def frame_at(self, seconds):
+        """Frame showing at media time `seconds`."""
+        index = np.searchsorted(self.__times, seconds, side='right')
+        return int(min(max(index, 1), len(self.__times)))
+
+    def seek(self, seconds):
+        self.__origin = min(max(float(seconds), 0.0), self.duration)
+        self.__started = time.monotonic()
+        self.__last_frame = self.frame_at(self.__origin)
+
+    def seek_frame(self, frame):
+        self.seek(self.time_of(frame))
+
+    def play(self, stop_frame=None):
+        """Play from the current position until `stop_frame` (inclusive)."""
+        self.__stop_frame = len(self.__times) if stop_frame is None else \
+            min(stop_frame, len(self.__times))
+        self.seek(self.__origin)
+        self.__playing = True
+
+    def pause(self):
+        self.__origin = self.position
+        self.__playing = False
+
+    def tick(self):
+        """
+        (frame due now, frames skipped since the last tick). Pauses at the
+        stop frame.
+        """
+        frame = min(self.frame_at(self.position), self.__stop_frame)
+        skipped = max(0, frame - self.__last_frame - 1)
+        self.dropped += skipped
+        self.__last_frame = frame
+        if frame >= self.__stop_frame:
+            self.pause()
+            self.__origin = self.time_of(frame)
+        return frame, skipped
+
+    def next_due(self):
+        """Seconds of wall clock time until the next frame is due."""
+        frame = self.__last_frame
+        if not self.__playing or frame >= len(self.__times):
+            return 0.0
+        wait = (self.__times[frame] - self.position) / self.__speed
+        return max(0.0, float(wait))
@@ -0,0 +1,100 @@
+import threading
+import time
+import cv2
+import numpy as np
+import colors
+from shared_frames import frame_cursor
+
+
+class preview_renderer(object):
+    """
+    Renders the newest frame of a frame ring into one reused RGB buffer for
+    the live preview. At most `max_fps` frames are rendered a second, and a
+    new one only after the GUI called acknowledge() for the previous one, so
+    images never pile up behind a slow display. Frames arriving in between
+    are skipped, never waited for: the renderer reads through its own
+    frame_cursor, so capture and recording are not held up by it.
+    """
+
+    def __init__(self, ring, colormap='ironblack', mapper=None, max_fps=9.0,
+                 size=(640, 480)):
+        self.colormap = colormap
+        self.mapper = mapper
+        self.max_fps = max_fps
+        height, width = ring.shape
+        # fit the sensor aspect ratio into the display size
+        scale = min(size[0] / float(width), size[1] / float(height))
+        self.__size = (int(width * scale), int(height * scale))
+        self.__ring = ring
+        self.__cursor = frame_cursor(ring)
+        self.__started = ring.write_count
+        self.__raw = np.empty(ring.shape, np.uint16)
+        self.__bgr = np.empty(ring.shape + (3,), np.uint8)
+        self.__scratch = np.empty(ring.shape, np.float64)
+        self.__scaled = np.empty((self.__size[1], self.__size[0], 3),
+                                 np.uint8)
+        self.__rgb = np.empty_like(self.__scaled)
+        self.__painted = threading.Event()
+        self.__painted.set()
+        self.__next_due = 0.0
+        self.__rendered = 0
+        self.min_max = (0, 0)
+        self.min_max_loc = ((0, 0), (0, 0))
+
+    @property
+    def size(self):
+        """(width, height) of the rendered image."""
+        return self.__size
+
+    @property
+    def rgb(self):
+        """The reused (height, width, 3) RGB buffer render() draws into."""
+        return self.__rgb
+
+    @property
+    def frame(self):
+        """Raw frame shown last, overwritten by the next render()."""
+        return self.__raw
+
+    def acknowledge(self):
+        """Called by the GUI once it has taken the last image."""
+        self.__painted.set()
+
+    def render(self, timeout=0.5):
+        """
+        Render the newest frame into `rgb` and return it, or None when no
+        new frame arrived or the GUI still holds the last image after
+        `timeout` seconds.
+        """
+        delay = self.__next_due - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        if not self.__painted.wait(timeout):
+            return None
+        result = self.__cursor.latest(self.__raw)
+        if result is None:
+            result = self.__cursor.next(timeout, self.__raw)
+            if result is None:
+                return None
+        low, high, low_loc, high_loc = cv2.minMaxLoc(self.__raw)
+        self.min_max = (low, high)
+        self.min_max_loc = (low_loc, high_loc)
+        colors.colorize_into(self.__bgr, self.__raw, self.colormap,
+                             self.mapper, self.__scratch)
+        cv2.resize(self.__bgr, self.__size, self.__scaled,
+                   interpolation=cv2.INTER_NEAREST)
+        cv2.cvtColor(self.__scaled, cv2.COLOR_BGR2RGB, self.__rgb)
+        self.__painted.clear()
+        self.__rendered += 1
+        if self.max_fps:
+            self.__next_due = time.monotonic() + 1.0 / self.max_fps
+        return self.__rgb
+
+    def stats(self):
+        captured = self.__ring.write_count - self.__started
+        return {
+            'captured': captured,
+            'rendered': self.__rendered,
+            'skipped': self.__cursor.dropped,
+            'pending': self.__cursor.pending,
+        }
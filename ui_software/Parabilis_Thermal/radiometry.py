@@ -0,0 +1,121 @@
+import numpy as np
+
+# Lepton radiometric (TLinear) frames are uint16 centikelvin
+UNITS = ('K', 'C', 'F')
+KELVIN_OFFSET = 273.15
+
+
+def to_kelvin(raw):
+    return np.multiply(raw, 0.01, dtype=np.float32)
+
+
+def kelvin_to(kelvin, unit):
+    if unit == 'K':
+        return kelvin
+    if unit == 'C':
+        return np.subtract(kelvin, KELVIN_OFFSET, dtype=np.float32)
+    if unit == 'F':
+        celsius = np.subtract(kelvin, KELVIN_OFFSET, dtype=np.float32)
+        return celsius * np.float32(1.8) + np.float32(32.0)
+    raise ValueError('Unknown temperature unit: ' + str(unit))
+
+
+def kelvin_from(value, unit):
+    if unit == 'K':
+        return np.asarray(value, dtype=np.float32)
+    if unit == 'C':
+        return np.add(value, KELVIN_OFFSET, dtype=np.float32)
+    if unit == 'F':
+        return np.add((np.asarray(value, np.float32) - 32.0) / 1.8,
+                      KELVIN_OFFSET, dtype=np.float32)
+    raise ValueError('Unknown temperature unit: ' + str(unit))
+
+
+class calibration(object):
+    """
+    Per-camera radiometric correction. The camera sees
+        tau * eps * T_obj^4 + tau * (1 - eps) * T_refl^4 + (1 - tau) * T_win^4
+    (emissivity eps, reflected apparent temperature T_refl, window
+    transmission tau at window temperature T_win), which is solved for T_obj.
+    `offset_k` is added afterwards, e.g. from a blackbody reference.
+    """
+
+    def __init__(self, emissivity=1.0, reflected_k=295.15,
+                 window_transmission=1.0, window_k=295.15, offset_k=0.0):
+        if not 0.0 < emissivity <= 1.0:
+            raise ValueError('Emissivity must be in (0, 1]')
+        if not 0.0 < window_transmission <= 1.0:
+            raise ValueError('Window transmission must be in (0, 1]')
+        self.emissivity = emissivity
+        self.reflected_k = reflected_k
+        self.window_transmission = window_transmission
+        self.window_k = window_k
+        self.offset_k = offset_k
+
+    def key(self):
+        return (self.emissivity, self.reflected_k, self.window_transmission,
+                self.window_k, self.offset_k)
+
+    def is_identity(self):
+        return (self.emissivity == 1.0 and self.window_transmission == 1.0
+                and self.offset_k == 0.0)
+
+    def apply(self, kelvin):
+        """Object temperature in Kelvin from apparent temperature in Kelvin."""
+        if self.is_identity():
+            return kelvin
+        eps = self.emissivity
+        tau = self.window_transmission
+        background = (tau * (1.0 - eps) * self.reflected_k ** 4
+                      + (1.0 - tau) * self.window_k ** 4)
+        measured = np.power(kelvin, 4, dtype=np.float64) - background
+        result = np.power(np.maximum(measured, 0.0) / (tau * eps), 0.25)
+        return (result + self.offset_k).astype(np.float32)
+
+
+# (unit, calibration key) -> read-only float32 table indexed by raw value
+_luts = {}
+_MAX_LUTS = 16
+
+
+def temperature_lut(unit='C', cal=None):
+    """65536 entry uint16 -> float32 temperature table, built once."""
+    key = (unit, None if cal is None else cal.key())
+    lut = _luts.get(key)
+    if lut is None:
+        kelvin = to_kelvin(np.arange(65536, dtype=np.uint16))
+        if cal is not None:
+            kelvin = cal.apply(kelvin)
+        lut = np.ascontiguousarray(kelvin_to(kelvin, unit), dtype=np.float32)
+        lut.flags.writeable = False
+        if len(_luts) >= _MAX_LUTS:
+            _luts.pop(next(iter(_luts)))
+        _luts[key] = lut
+    return lut
+
+
+def temperatures(raw, unit='C', cal=None, out=None):
+    """
+    Temperature of every raw value in a frame or ROI array as float32, one
+    table lookup per pixel.
+    """
+    raw = np.asarray(raw)
+    lut = temperature_lut(unit, cal)
+    if out is None:
+        out = np.empty(raw.shape, np.float32)
+    # uint16 indices are always in range, 'clip' avoids a buffered copy
+    return np.take(lut, raw, out=out, mode='clip')
+
+
+def convert(raw, unit, cal=None):
+    """Scalar or array of raw centikelvin values in `unit`."""
+    if cal is None:
+        return kelvin_to(to_kelvin(raw), unit)
+    return kelvin_to(cal.apply(to_kelvin(raw)), unit)
+
+
+def format_temp(raw, unit, cal=None, digits=2):
+    """Raw value as text, e.g. '21.85 C'."""
+    if unit not in UNITS:
+        return '0 ' + str(unit)
+    return str(round(float(convert(raw, unit, cal)), digits)) + ' ' + unit
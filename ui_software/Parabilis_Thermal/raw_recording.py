@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# Memory-mapped raw recordings: a header followed by fixed-size frame
+# records, written with plain memory copies. Run as
+#   python3 raw_recording.py info <file>
+#   python3 raw_recording.py convert <file.ptraw> <file.HDF5>
+import argparse
+import json
+import os
+import time
+import h5py
+import numpy as np
+import recording_schema
+
+MAGIC = b'PTRAW\x00\x00\x01'
+VERSION = 1
+EXTENSION = '.ptraw'
+# the header fills one page; frame records start after it
+HEADER_SIZE = 4096
+HEADER = np.dtype([
+    ('magic', 'S8'),
+    ('version', '<u4'),
+    ('height', '<u4'),
+    ('width', '<u4'),
+    ('complete', '<u4'),
+    ('count', '<u8'),
+    ('created', '<f8'),
+    ('attrs_size', '<u4'),
+    ('reserved', '<u4'),
+])
+# frames are preallocated this many at a time
+GROW_FRAMES = 1024
+# the header's frame count is brought up to date this often (seconds)
+FLUSH_SECONDS = 1.0
+# events (alarms) go to a JSON lines file next to the recording
+EVENTS_SUFFIX = '.events.jsonl'
+
+
+def record_dtype(height, width):
+    # 24 bytes of per-frame data keep the frame 8-byte aligned
+    return np.dtype([
+        ('timestamp', '<f8'),
+        ('sequence', '<i8'),
+        ('flags', '<u4'),
+        ('reserved', '<u4'),
+        ('frame', '<u2', (height, width)),
+    ])
+
+
+def is_raw(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def _read_header(path):
+    with open(path, 'rb') as f:
+        raw = f.read(HEADER_SIZE)
+    header = np.frombuffer(raw, HEADER, count=1)[0]
+    if header['magic'] != MAGIC:
+        raise ValueError(path + ' is not a raw recording')
+    if header['version'] > VERSION:
+        raise ValueError(path + ' has unsupported version ' +
+                         str(header['version']))
+    start = HEADER.itemsize
+    attrs = json.loads(raw[start:start + header['attrs_size']] or b'{}')
+    return header, attrs
+
+
+def events_path(path):
+    return path + EVENTS_SUFFIX
+
+
+def append_events(path, events):
+    with open(events_path(path), 'a') as f:
+        for event in events:
+            f.write(json.dumps(event) + '\n')
+
+
+def read_events(path):
+    if not os.path.exists(events_path(path)):
+        return []
+    with open(events_path(path)) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class raw_writer(object):
+    """
+    Appends frames to a preallocated file through a memory map. The file
+    grows GROW_FRAMES records at a time. Every `flush_seconds` the records
+    are flushed to disk and only then `count` in the header is raised and
+    flushed, so readers, a crash or a power loss only ever see complete
+    frames; up to `flush_seconds` of the newest frames are not counted yet.
+    close() trims the unused preallocation.
+    """
+
+    def __init__(self, path, shape, attrs=None, grow_frames=GROW_FRAMES,
+                 flush_seconds=FLUSH_SECONDS):
+        height, width = shape
+        self.__path = path
+        self.__record = record_dtype(height, width)
+        self.__grow_frames = grow_frames
+        self.__flush_seconds = flush_seconds
+        self.__count = 0
+        attrs_json = json.dumps(attrs or {}, default=str).encode()
+        if HEADER.itemsize + len(attrs_json) > HEADER_SIZE:
+            raise ValueError('Recording attributes do not fit the header')
+        self.__file = open(path, 'w+b')
+        self.__file.truncate(HEADER_SIZE)
+        self.__header = np.memmap(self.__file, HEADER, 'r+', 0, (1,))
+        self.__header[0] = (MAGIC, VERSION, height, width, 0, 0, time.time(),
+                            len(attrs_json), 0)
+        self.__file.seek(HEADER.itemsize)
+        self.__file.write(attrs_json)
+        self.__file.flush()
+        self.__records = None
+        self._grow(grow_frames)
+        self.__flushed = time.monotonic()
+
+    @property
+    def path(self):
+        return self.__path
+
+    @property
+    def count(self):
+        return self.__count
+
+    def _grow(self, capacity):
+        if self.__records is not None:
+            self.__records.flush()
+            self.__records = None
+        self.__file.truncate(HEADER_SIZE + capacity * self.__record.itemsize)
+        self.__records = np.memmap(self.__file, self.__record, 'r+',
+                                   HEADER_SIZE, (capacity,))
+
+    def append(self, frames, sequence, timestamps, flags=0):
+        first = self.__count
+        last = first + len(frames)
+        if last > len(self.__records):
+            grow = self.__grow_frames
+            self._grow((last + grow - 1) // grow * grow)
+        records = self.__records[first:last]
+        records['frame'] = frames
+        records['sequence'] = sequence
+        records['timestamp'] = timestamps
+        records['flags'] = flags
+        self.__count = last
+        if time.monotonic() - self.__flushed >= self.__flush_seconds:
+            self.flush()
+
+    def flush(self):
+        """Flush the records, then count them in the header."""
+        self.__records.flush()
+        self.__header['count'][0] = self.__count
+        self.__header.flush()
+        self.__flushed = time.monotonic()
+
+    def close(self):
+        if self.__file.closed:
+            return
+        self.__header['complete'][0] = 1
+        self.flush()
+        self.__records = None
+        self.__header = None
+        self.__file.truncate(HEADER_SIZE + self.__count * self.__record.itemsize)
+        self.__file.close()
+
+
+class raw_reader(object):
+    """
+    Read-only memory map of a raw recording. `frames` is an (N, H, W) view
+    straight into the file, nothing is copied until it is indexed.
+    """
+
+    def __init__(self, path):
+        self.__path = path
+        self.__header, self.__attrs = _read_header(path)
+        height = int(self.__header['height'])
+        width = int(self.__header['width'])
+        record = record_dtype(height, width)
+        # a file still being written may be preallocated past `count`
+        count = int(self.__header['count'])
+        available = (os.path.getsize(path) - HEADER_SIZE) // record.itemsize
+        count = min(count, available)
+        if count > 0:
+            self.__records = np.memmap(path, record, 'r', HEADER_SIZE,
+                                       (count,))
+        else:
+            self.__records = np.zeros(0, record)
+
+    @property
+    def path(self):
+        return self.__path
+
+    @property
+    def attrs(self):
+        return dict(self.__attrs)
+
+    @property
+    def complete(self):
+        """False while the file is being written or if writing was cut off."""
+        return bool(self.__header['complete'])
+
+    @property
+    def frames(self):
+        return self.__records['frame']
+
+    def per_frame(self, name):
+        """'timestamps', 'sequence' or 'flags' as an array, else None."""
+        field = {'timestamps': 'timestamp', 'sequence': 'sequence',
+                 'flags': 'flags'}.get(name)
+        if field is None:
+            return None
+        return np.array(self.__records[field])
+
+    def summary(self):
+        result = {
+            'format': 'raw',
+            'version': int(self.__header['version']),
+            'frames': len(self.__records),
+            'shape': self.__records['frame'].shape[1:],
+            'complete': self.complete,
+            'created': float(self.__header['created']),
+        }
+        result.update(self.__attrs)
+        if len(self.__records):
+            timestamps = self.__records['timestamp']
+            result['start'] = float(timestamps[0])
+            result['duration'] = float(timestamps[-1] - timestamps[0])
+        return result
+
+    def close(self):
+        self.__records = None
+
+
+def to_hdf5(source, destination, chunk_frames=32, compression=None,
+            compression_opts=None, batch=256):
+    """
+    Copy a raw recording, with the events and regions kept next to it, into
+    a recording_schema HDF5 file.
+    """
+    # imported here, roi reads raw recordings through heat_data
+    import roi
+    reader = raw_reader(source)
+    try:
+        frames = reader.frames
+        timestamps = reader.per_frame('timestamps')
+        sequence = reader.per_frame('sequence')
+        flags = reader.per_frame('flags')
+        attrs = reader.attrs
+        attrs['converted_from'] = source
+        with h5py.File(destination, 'w') as f:
+            frame_writer = recording_schema.create(
+                f, frames.shape[1:], chunk_frames, compression,
+                compression_opts, attrs)
+            for first in range(0, len(frames), batch):
+                part = slice(first, first + batch)
+                recording_schema.append(
+                    f, first, np.asarray(frames[part]), sequence[part],
+                    timestamps[part], flags[part], frame_writer)
+            events = read_events(source)
+            if events:
+                recording_schema.append_events(f, events)
+            regions = roi.load(source)
+            if regions:
+                roi.store(f, regions)
+        return len(frames)
+    finally:
+        reader.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Inspect raw recordings or convert them to HDF5.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    info = commands.add_parser('info', help='print a recording summary')
+    info.add_argument('path')
+    convert = commands.add_parser('convert', help='rewrite as HDF5')
+    convert.add_argument('source')
+    convert.add_argument('destination')
+    convert.add_argument('--compression', default=None,
+                         choices=('gzip', 'lzf', 'delta'))
+    args = parser.parse_args()
+
+    if args.command == 'info':
+        reader = raw_reader(args.path)
+        for key, value in reader.summary().items():
+            print('{0}: {1}'.format(key, value))
+        reader.close()
+    else:
+        count = to_hdf5(args.source, args.destination,
+                        compression=args.compression)
+        print('Converted ' + str(count) + ' frames to ' + args.destination)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,407 @@
+import math
+import threading
+import time
+import h5py
+import numpy as np
+from frame_ring import frame_ring
+import recording_schema
+import raw_recording
+import delta_codec
+import roi
+import storage
+
+# 'stacked': one resizable (N, H, W) 'frames' dataset plus parallel per-frame
+#            datasets, see recording_schema
+# 'image':   legacy layout, one 'image1' ... 'imageN' dataset per frame
+# 'raw':     memory-mapped raw frame records instead of HDF5, see
+#            raw_recording; the least work per frame for slow storage
+# 'delta':   lossless delta coded frames in a standalone container, see
+#            delta_codec; stacked recordings take compression='delta' too
+LAYOUTS = ('stacked', 'image', 'raw', 'delta')
+# Lepton frame rate, sizes the pre-trigger buffer when none is given
+DEFAULT_FPS = 8.7
+
+
+def file_extension(layout):
+    """File name extension of recordings written with `layout`."""
+    return {'raw': raw_recording.EXTENSION,
+            'delta': delta_codec.EXTENSION}.get(layout, '.HDF5')
+
+
+class hdf5_recorder(object):
+    """
+    Writes frames to an HDF5, raw or delta file on a background thread. submit()
+    only copies the frame into a bounded, preallocated buffer, so a slow or
+    stalled disk never blocks the caller; if the buffer overflows the oldest
+    frames are dropped and counted in stats(). `attrs` (serial, firmware,
+    gain_mode, fps) are stored with all but image recordings, `rois` (roi
+    regions) with every layout. `on_write`, if given, is called on the
+    writer thread with the sequence numbers and timestamps of every batch
+    once it is in the file. log_event() adds an event (a JSON-compatible
+    dict, e.g. an alarm) that the writer thread stores with the frames.
+    If writing fails the writer thread stops, the exception is kept in
+    `error` and stats() and raised by the next submit() and by stop().
+    """
+
+    def __init__(self, path, shape, layout='stacked', batch_size=32,
+                 chunk_frames=32, compression=None, compression_opts=None,
+                 max_pending=128, flush_interval=1.0, attrs=None,
+                 on_write=None, rois=None):
+        if layout not in LAYOUTS:
+            raise ValueError('Unknown layout: ' + str(layout))
+        if compression == 'delta' and layout == 'image':
+            raise ValueError('The image layout cannot be delta compressed')
+        self.__path = path
+        self.__shape = tuple(shape)
+        self.__layout = layout
+        self.__batch_size = batch_size
+        self.__chunk_frames = chunk_frames
+        self.__compression = compression
+        self.__compression_opts = compression_opts
+        self.__flush_interval = flush_interval
+        self.__attrs = attrs
+        self.__on_write = on_write
+        self.__rois = rois
+        self.__events = []
+        self.__events_lock = threading.Lock()
+        self.__buffer = frame_ring(max_pending, *self.__shape)
+        self.__file = None
+        self.__frame_writer = None
+        self.__thread = None
+        self.__running = False
+        self.__closed = False
+        self.__error = None
+        self.__written = 0
+        self.__batches = 0
+        self.__bytes = 0
+        self.__write_seconds = 0.0
+        self.__max_pending = 0
+
+    @property
+    def path(self):
+        return self.__path
+
+    @property
+    def layout(self):
+        return self.__layout
+
+    @property
+    def file(self):
+        return self.__file
+
+    @property
+    def running(self):
+        return self.__running
+
+    @property
+    def closed(self):
+        """True once stop() has closed the file."""
+        return self.__closed
+
+    @property
+    def error(self):
+        """Exception that stopped the writer thread, else None."""
+        return self.__error
+
+    def start(self):
+        if self.__layout == 'raw':
+            self.__file = raw_recording.raw_writer(
+                self.__path, self.__shape, self.__attrs)
+        elif self.__layout == 'delta':
+            self.__file = delta_codec.delta_writer(
+                self.__path, self.__shape, self.__attrs,
+                self.__compression_opts or delta_codec.KEYFRAME_INTERVAL)
+        else:
+            self.__file = h5py.File(self.__path, mode='w')
+        if self.__layout == 'stacked':
+            self.__frame_writer = recording_schema.create(
+                self.__file, self.__shape, self.__chunk_frames,
+                self.__compression, self.__compression_opts, self.__attrs)
+        if self.__rois:
+            if self.__layout in ('raw', 'delta'):
+                roi.save(self.__path, self.__rois)
+            else:
+                roi.store(self.__file, self.__rois)
+        self.__running = True
+        self.__thread = threading.Thread(target=self._run, daemon=True)
+        self.__thread.start()
+
+    def submit(self, frame, sequence=None, timestamp=None, flags=0):
+        """
+        Queue one frame for writing. Never blocks on disk. `flags` are
+        recording_schema.FLAG_* bits.
+        """
+        if self.__error is not None:
+            raise self.__error
+        if not self.__running:
+            return False
+        self.__buffer.push(frame, timestamp, sequence, flags)
+        self.__max_pending = max(self.__max_pending, self.__buffer.pending)
+        return True
+
+    def log_event(self, event):
+        if not self.__running:
+            return False
+        with self.__events_lock:
+            self.__events.append(event)
+        return True
+
+    def stop(self):
+        """Write everything still queued and close the file."""
+        if self.__thread is not None:
+            self.__running = False
+            self.__thread.join()
+            self.__thread = None
+        if self.__file is not None:
+            self.__file.close()
+        self.__closed = True
+        if self.__error is not None:
+            raise self.__error
+
+    def stats(self):
+        pending = self.__buffer.pending
+        return {
+            'written': self.__written,
+            'pending': pending,
+            'max_pending': self.__max_pending,
+            'capacity': self.__buffer.capacity,
+            'dropped': self.__buffer.dropped,
+            'batches': self.__batches,
+            'bytes': self.__bytes,
+            'file_bytes': storage.file_bytes(self.__path),
+            'write_seconds': self.__write_seconds,
+            'frames_per_second': (self.__written / self.__write_seconds
+                                  if self.__write_seconds > 0 else 0.0),
+            'error': None if self.__error is None else str(self.__error),
+        }
+
+    def _run(self):
+        buffer = self.__buffer
+        last_flush = time.monotonic()
+        try:
+            while self.__running or buffer.pending:
+                target = buffer.write_count - buffer.pending + self.__batch_size
+                # short waits so stop() is noticed quickly
+                buffer.wait_for_write(target - 1, 0.1)
+                if (self.__running and buffer.pending < self.__batch_size
+                        and time.monotonic() - last_flush < self.__flush_interval):
+                    continue
+                last_flush = time.monotonic()
+                frames, sequence, timestamps, flags = buffer.drain()
+                if len(frames):
+                    self._write(frames, sequence, timestamps, flags)
+                self._write_events()
+            self._write_events()
+        except Exception as e:
+            self.__error = e
+            self.__running = False
+
+    def _write_events(self):
+        with self.__events_lock:
+            events, self.__events = self.__events, []
+        if not events:
+            return
+        if self.__layout in ('raw', 'delta'):
+            raw_recording.append_events(self.__path, events)
+        else:
+            recording_schema.append_events(self.__file, events)
+
+    def _write(self, frames, sequence, timestamps, flags):
+        start = time.perf_counter()
+        if self.__layout == 'stacked':
+            recording_schema.append(self.__file, self.__written, frames,
+                                    sequence, timestamps, flags,
+                                    self.__frame_writer)
+        elif self.__layout in ('raw', 'delta'):
+            self.__file.append(frames, sequence, timestamps, flags)
+        else:
+            for i, frame in enumerate(frames):
+                # frames are labeled from "image1", as heat_data expects
+                self.__file.create_dataset(
+                    'image' + str(self.__written + i + 1), data=frame,
+                    compression=self.__compression,
+                    compression_opts=self.__compression_opts)
+        self.__write_seconds += time.perf_counter() - start
+        self.__written += len(frames)
+        self.__batches += 1
+        self.__bytes += frames.nbytes
+        if self.__on_write is not None:
+            self.__on_write(sequence, timestamps)
+
+
+class triggered_recorder(object):
+    """
+    Keeps the last `pre_seconds` of submitted frames in a preallocated
+    frame_ring and writes nothing until trigger() is called. A new
+    hdf5_recorder (at make_path()) then gets the buffered frames followed
+    by every frame submitted until `post_seconds` after the last trigger,
+    so a trigger during a recording extends it. The switch happens inside
+    submit(), between two frames, so no frame falls between the buffer and
+    the file; finished files are closed on a background thread. trigger()
+    may be called from any thread. submit(), stop() and stats() work like
+    those of hdf5_recorder, other keyword arguments are passed on to it,
+    except that a file failing to write is closed and submit() goes back
+    to buffering for the next trigger; the error is kept in `error`.
+    """
+
+    def __init__(self, make_path, shape, pre_seconds=10.0, post_seconds=10.0,
+                 fps=DEFAULT_FPS, max_pending=128, **recorder_options):
+        self.__make_path = make_path
+        self.__shape = tuple(shape)
+        self.__pre_seconds = pre_seconds
+        self.__post_seconds = post_seconds
+        self.__buffer = frame_ring(
+            max(1, int(math.ceil(pre_seconds * fps)) + 1), *self.__shape)
+        # the whole buffer is handed over at once, on top of the backlog
+        self.__max_pending = self.__buffer.capacity + max_pending
+        self.__options = recorder_options
+        self.__lock = threading.Lock()
+        # held by submit() and stop() while they switch files
+        self.__switch = threading.Lock()
+        self.__triggers = []
+        self.__recorder = None
+        self.__deadline = 0.0
+        self.__running = False
+        self.__closing = []
+        self.__saved = []
+        self.__error = None
+        self.__triggered = 0
+        self.__written = 0
+        self.__dropped = 0
+        self.__file_bytes = 0
+
+    @property
+    def running(self):
+        return self.__running
+
+    @property
+    def recording(self):
+        return self.__recorder is not None
+
+    @property
+    def error(self):
+        """The last exception writing or closing a file, else None."""
+        return self.__error
+
+    @property
+    def path(self):
+        """File being written, else the last one written, else None."""
+        recorder = self.__recorder
+        if recorder is not None:
+            return recorder.path
+        return self.__saved[-1] if self.__saved else None
+
+    @property
+    def saved(self):
+        """Paths of the finished recordings, oldest first."""
+        return list(self.__saved)
+
+    def start(self):
+        self.__running = True
+
+    def trigger(self, event=None):
+        """
+        Record from `pre_seconds` before now. `event` (a dict with a 'time'
+        in seconds since the epoch, e.g. an alarm) is logged into the file.
+        """
+        if event is None:
+            event = {'time': time.time(), 'kind': 'trigger'}
+        with self.__lock:
+            self.__triggers.append(event)
+
+    def log_event(self, event):
+        recorder = self.__recorder
+        return recorder is not None and recorder.log_event(event)
+
+    def submit(self, frame, sequence=None, timestamp=None, flags=0):
+        if timestamp is None:
+            timestamp = time.time()
+        with self.__switch:
+            if not self.__running:
+                return False
+            with self.__lock:
+                triggers, self.__triggers = self.__triggers, []
+            if triggers:
+                self._triggered(triggers)
+            recorder = self.__recorder
+            if recorder is None:
+                self.__buffer.push(frame, timestamp, sequence, flags)
+                return True
+            try:
+                recorder.submit(frame, sequence, timestamp, flags)
+            except Exception as e:
+                self.__error = e
+                self._finish()
+                return False
+            if timestamp >= self.__deadline:
+                self._finish()
+            return True
+
+    def _triggered(self, events):
+        first = min(event['time'] for event in events)
+        if self.__recorder is None:
+            recorder = hdf5_recorder(self.__make_path(), self.__shape,
+                                     max_pending=self.__max_pending,
+                                     **self.__options)
+            recorder.start()
+            frames, numbers, timestamps, flags = self.__buffer.drain()
+            for i in np.flatnonzero(timestamps >= first - self.__pre_seconds):
+                recorder.submit(frames[i], numbers[i], timestamps[i],
+                                flags[i])
+            self.__recorder = recorder
+        self.__triggered += len(events)
+        self.__deadline = max(
+            [self.__deadline] +
+            [event['time'] + self.__post_seconds for event in events])
+        for event in events:
+            self.__recorder.log_event(event)
+
+    def _finish(self):
+        recorder, self.__recorder = self.__recorder, None
+        self.__deadline = 0.0
+        self.__saved.append(recorder.path)
+        thread = threading.Thread(target=self._close, args=(recorder,),
+                                  daemon=True)
+        thread.start()
+        self.__closing.append(thread)
+
+    def _close(self, recorder):
+        try:
+            recorder.stop()
+        except Exception as e:
+            self.__error = e
+        stats = recorder.stats()
+        with self.__lock:
+            self.__written += stats['written']
+            self.__dropped += stats['dropped']
+            self.__file_bytes += stats['file_bytes']
+
+    def stop(self):
+        """Finish the recording in progress, if any, and wait for all files."""
+        with self.__switch:
+            self.__running = False
+            if self.__recorder is not None:
+                self._finish()
+        for thread in self.__closing:
+            thread.join()
+        self.__closing = []
+        if self.__error is not None:
+            raise self.__error
+
+    def stats(self):
+        recorder = self.__recorder
+        current = recorder.stats() if recorder is not None else {}
+        with self.__lock:
+            return {
+                'recording': recorder is not None,
+                'triggers': self.__triggered,
+                'files': len(self.__saved) + (recorder is not None),
+                'buffered': self.__buffer.pending,
+                'buffer_capacity': self.__buffer.capacity,
+                'written': self.__written + current.get('written', 0),
+                'dropped': self.__dropped + current.get('dropped', 0),
+                'file_bytes': (self.__file_bytes
+                               + current.get('file_bytes', 0)),
+                'pending': current.get('pending', 0),
+                'error': None if self.__error is None else str(self.__error),
+            }
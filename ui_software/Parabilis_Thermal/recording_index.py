@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# Whole-recording statistics for fast timelines and navigation. Build the
+# index of a recording ahead of time with
+#   python3 recording_index.py <file> [--inside]
+import argparse
+import os
+import time
+import h5py
+import numpy as np
+import heat_data
+import recording_schema
+
+INDEX_VERSION = 1
+INDEX_GROUP = 'index'
+SIDECAR_SUFFIX = '.index.h5'
+PERCENTILES = (1, 5, 50, 95, 99)
+# thumbnails are the frames averaged over THUMB_FACTOR x THUMB_FACTOR blocks
+THUMB_FACTOR = 8
+EVENT_KINDS = ('ffc', 'gap', 'peak')
+# a peak event starts where the frame max rises this far (centikelvin)
+# above the recording's median frame max
+PEAK_DELTA = 500
+
+
+def sidecar_path(path):
+    return path + SIDECAR_SUFFIX
+
+
+def _thumbnails(frames, factor):
+    count, height, width = frames.shape
+    rows, cols = height // factor, width // factor
+    blocks = frames[:, :rows * factor, :cols * factor].reshape(
+        count, rows, factor, cols, factor)
+    return blocks.mean(axis=(2, 4)).astype(np.uint16)
+
+
+def _rising_edges(mask):
+    # frames where mask turns on
+    previous = np.concatenate(([False], mask[:-1]))
+    return np.flatnonzero(mask & ~previous)
+
+
+def _events(stats, flags, sequence, peak_delta):
+    found = []
+    if flags is not None:
+        ffc = (flags & recording_schema.FLAG_FFC) != 0
+        found.append((_rising_edges(ffc), 0))
+    if sequence is not None and len(sequence) > 1:
+        # the camera numbers frames consecutively, a jump means lost frames
+        found.append((np.flatnonzero(np.diff(sequence) > 1) + 1, 1))
+    high = stats['max']
+    if len(high):
+        peaks = high > np.median(high) + peak_delta
+        found.append((_rising_edges(peaks), 2))
+    frames = np.concatenate([f for f, _ in found] + [np.empty(0, np.intp)])
+    kinds = np.concatenate([np.full(len(f), k, np.uint8) for f, k in found]
+                           + [np.empty(0, np.uint8)])
+    order = np.argsort(frames, kind='stable')
+    # stored frame numbers count from 1, like heat_data
+    return frames[order] + 1, kinds[order]
+
+
+def compute(data, batch=256, percentiles=PERCENTILES,
+            thumb_factor=THUMB_FACTOR, peak_delta=PEAK_DELTA, progress=None):
+    """
+    Statistics of every frame of an open heat_data, streamed in batches of
+    `batch` frames with one vectorized pass each. Returns a dict of arrays.
+    """
+    total = data.last_frame
+    height, width = data.shape
+    stats = {
+        'min': np.empty(total, np.uint16),
+        'max': np.empty(total, np.uint16),
+        'mean': np.empty(total, np.float32),
+        'min_loc': np.empty((total, 2), np.int32),
+        'max_loc': np.empty((total, 2), np.int32),
+        'percentiles': np.empty((total, len(percentiles)), np.float32),
+        'thumbnails': np.empty((total, height // thumb_factor,
+                                width // thumb_factor), np.uint16),
+    }
+    for first in range(1, total + 1, batch):
+        frames = data.frames(first, first + batch)
+        flat = frames.reshape(len(frames), -1)
+        part = slice(first - 1, first - 1 + len(frames))
+        low = flat.argmin(axis=1)
+        high = flat.argmax(axis=1)
+        stats['min'][part] = np.take_along_axis(flat, low[:, None], 1)[:, 0]
+        stats['max'][part] = np.take_along_axis(flat, high[:, None], 1)[:, 0]
+        stats['mean'][part] = flat.mean(axis=1, dtype=np.float64)
+        # (column, row), the order cv2.minMaxLoc reports
+        stats['min_loc'][part] = np.column_stack(
+            (low % width, low // width))
+        stats['max_loc'][part] = np.column_stack(
+            (high % width, high // width))
+        stats['percentiles'][part] = np.percentile(
+            flat, percentiles, axis=1).T
+        stats['thumbnails'][part] = _thumbnails(frames, thumb_factor)
+        if progress is not None:
+            progress(first - 1 + len(frames), total)
+    stats['event_frame'], stats['event_kind'] = _events(
+        stats, data.per_frame('flags'), data.per_frame('sequence'),
+        peak_delta)
+    timestamps = data.timestamps
+    if timestamps is not None:
+        stats['timestamps'] = timestamps
+    return stats, {'percentile_levels': np.asarray(percentiles, np.float32),
+                   'thumb_factor': thumb_factor}
+
+
+def _write(group, stats, attrs, frames):
+    for name, values in stats.items():
+        group.create_dataset(name, data=values)
+    for key, value in attrs.items():
+        group.attrs[key] = value
+    group.attrs['index_version'] = INDEX_VERSION
+    group.attrs['frames'] = frames
+    group.attrs['created'] = time.time()
+
+
+def build(path, inside=False, progress=None, **options):
+    """
+    Compute the index of the recording at `path` and store it in the
+    recording's 'index' group (inside=True) or in a sidecar file next to
+    it. Raw and delta recordings always get a sidecar. Returns the frame_index.
+    """
+    data = heat_data.heat_data(path)
+    try:
+        frames = data.last_frame
+        stats, attrs = compute(data, progress=progress, **options)
+    finally:
+        data.close()
+    if inside and h5py.is_hdf5(path):
+        with h5py.File(path, 'a') as f:
+            if INDEX_GROUP in f:
+                del f[INDEX_GROUP]
+            _write(f.create_group(INDEX_GROUP), stats, attrs, frames)
+    else:
+        with h5py.File(sidecar_path(path), 'w') as f:
+            _write(f, stats, attrs, frames)
+    return frame_index(stats, attrs)
+
+
+def load(path, frames=None):
+    """
+    The stored index of a recording, or None when there is none or it
+    does not cover `frames` frames (the recording grew or was replaced).
+    """
+    if h5py.is_hdf5(path):
+        with h5py.File(path, 'r') as f:
+            if INDEX_GROUP in f:
+                index = _read(f[INDEX_GROUP], frames)
+                if index is not None:
+                    return index
+    if os.path.exists(sidecar_path(path)):
+        with h5py.File(sidecar_path(path), 'r') as f:
+            return _read(f, frames)
+    return None
+
+
+def _read(group, frames):
+    if group.attrs.get('index_version') != INDEX_VERSION:
+        return None
+    if frames is not None and group.attrs.get('frames') != frames:
+        return None
+    stats = {name: group[name][:] for name in group}
+    return frame_index(stats, dict(group.attrs))
+
+
+def open_index(path, frames=None, inside=False, progress=None):
+    """load() the index of a recording, building it first if needed."""
+    index = load(path, frames)
+    if index is None:
+        index = build(path, inside, progress)
+    return index
+
+
+class frame_index(object):
+    """
+    Per-frame statistics of a whole recording. Arrays are indexed by frame
+    number - 1; values are raw centikelvin, locations (column, row) in
+    sensor pixels.
+    """
+
+    def __init__(self, stats, attrs):
+        self.__stats = stats
+        self.__attrs = attrs
+
+    def __len__(self):
+        return len(self.__stats['max'])
+
+    def __getitem__(self, name):
+        """'min', 'max', 'mean', 'min_loc', 'max_loc', 'thumbnails', ..."""
+        return self.__stats[name]
+
+    @property
+    def percentile_levels(self):
+        return tuple(self.__attrs['percentile_levels'])
+
+    def percentile(self, level):
+        """Per-frame values of one of the stored percentile levels."""
+        column = self.percentile_levels.index(level)
+        return self.__stats['percentiles'][:, column]
+
+    def times(self, fps=8.7):
+        """Seconds since the first frame, from timestamps when recorded."""
+        timestamps = self.__stats.get('timestamps')
+        if timestamps is None or len(timestamps) == 0:
+            return np.arange(len(self), dtype=np.float64) / fps
+        return timestamps - timestamps[0]
+
+    def hottest(self, count=1):
+        """Frame numbers with the highest max temperature, hottest first."""
+        return np.argsort(self.__stats['max'], kind='stable')[::-1][
+            :count] + 1
+
+    def coldest(self, count=1):
+        """Frame numbers with the lowest min temperature, coldest first."""
+        return np.argsort(self.__stats['min'], kind='stable')[:count] + 1
+
+    def events(self, kind=None):
+        """[(frame number, kind name)], optionally only of one kind."""
+        frames = self.__stats['event_frame']
+        kinds = self.__stats['event_kind']
+        return [(int(f), EVENT_KINDS[k]) for f, k in zip(frames, kinds)
+                if kind is None or EVENT_KINDS[k] == kind]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Build the statistics index of a recording.')
+    parser.add_argument('path')
+    parser.add_argument('--inside', action='store_true',
+                        help='store the index in the recording itself '
+                        'instead of a sidecar file')
+    args = parser.parse_args()
+    started = time.perf_counter()
+    index = build(args.path, args.inside)
+    hottest = int(index.hottest()[0])
+    print('Indexed {0} frames in {1:.1f} s, hottest frame {2}, {3} events'
+          .format(len(index), time.perf_counter() - started, hottest,
+                  len(index.events())))
+
+
+if __name__ == '__main__':
+    main()
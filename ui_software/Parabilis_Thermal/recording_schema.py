@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# Layout of stacked HDF5 recordings. Run as
+#   python3 recording_schema.py info <file>
+#   python3 recording_schema.py convert <legacy file> <new file>
+import argparse
+import json
+import re
+import time
+import h5py
+import numpy as np
+import delta_codec
+
+SCHEMA_VERSION = 1
+
+# version 1:
+#   frames       (N, H, W) uint16 centikelvin, chunked along N
+#   timestamps   (N,) float64 capture time, seconds since the epoch
+#   sequence     (N,) int64 frame number from the camera
+#   flags        (N,) uint8, see FLAG_*
+#   frame_min    (N,) uint16
+#   frame_max    (N,) uint16
+#   frame_mean   (N,) float32
+#   events       (E,) JSON text, one object per event (alarms), optional
+# Delta compressed files (compression='delta') have delta_data and
+#   delta_offsets in place of 'frames', see delta_codec.
+# file attributes: schema_version, serial, firmware, gain_mode, fps,
+#   created. Files with a 3-D 'frames' dataset but no schema_version are
+#   version 0, with only timestamps and sequence. Legacy files (one 'imageN'
+#   dataset per frame, nothing else) have no version at all.
+FRAMES = 'frames'
+PER_FRAME = (
+    ('timestamps', np.float64),
+    ('sequence', np.int64),
+    ('flags', np.uint8),
+    ('frame_min', np.uint16),
+    ('frame_max', np.uint16),
+    ('frame_mean', np.float32),
+)
+ATTRIBUTES = ('serial', 'firmware', 'gain_mode', 'fps')
+EVENTS = 'events'
+
+# an FFC was commanded shortly before the frame; the Lepton freezes the
+# image while the shutter is closed
+FLAG_FFC = 1
+
+IMAGE_NAME = re.compile(r'^image(\d+)$')
+
+
+def create(h5file, shape, chunk_frames=32, compression=None,
+           compression_opts=None, attrs=None):
+    """
+    Create the empty, resizable datasets and attributes of a recording.
+    With compression='delta' the frames are delta coded (compression_opts
+    is the keyframe interval) and the frame writer to pass to append() is
+    returned, else None.
+    """
+    height, width = shape
+    chunk_frames = max(1, chunk_frames)
+    frame_writer = None
+    if compression == 'delta':
+        frame_writer = delta_codec.create_hdf5(
+            h5file, shape,
+            compression_opts or delta_codec.KEYFRAME_INTERVAL)
+    else:
+        h5file.create_dataset(
+            FRAMES, shape=(0, height, width), maxshape=(None, height, width),
+            dtype=np.uint16, chunks=(chunk_frames, height, width),
+            compression=compression, compression_opts=compression_opts)
+    for name, dtype in PER_FRAME:
+        h5file.create_dataset(name, shape=(0,), maxshape=(None,), dtype=dtype,
+                              chunks=(max(1024, chunk_frames),))
+    h5file.attrs['schema_version'] = SCHEMA_VERSION
+    h5file.attrs['created'] = time.time()
+    for key, value in (attrs or {}).items():
+        if value is not None:
+            h5file.attrs[key] = value
+    return frame_writer
+
+
+def append(h5file, first, frames, sequence, timestamps, flags=0,
+           frame_writer=None):
+    """
+    Write frames first ... first + len(frames) - 1 (counted from 0) with
+    their per-frame data. The statistics come from one pass per batch.
+    `frame_writer` is the one create() returned for delta compression.
+    """
+    last = first + len(frames)
+    values = {
+        'timestamps': timestamps,
+        'sequence': sequence,
+        'flags': flags,
+        'frame_min': frames.min(axis=(1, 2)),
+        'frame_max': frames.max(axis=(1, 2)),
+        'frame_mean': frames.mean(axis=(1, 2), dtype=np.float64),
+    }
+    if frame_writer is not None:
+        frame_writer.append(frames)
+    else:
+        values[FRAMES] = frames
+    for name, data in values.items():
+        dataset = h5file[name]
+        dataset.resize(last, axis=0)
+        dataset[first:last] = data
+
+
+def append_events(h5file, events):
+    """Add event dicts to the events dataset, created on first use."""
+    if EVENTS not in h5file:
+        h5file.create_dataset(EVENTS, shape=(0,), maxshape=(None,),
+                              dtype=h5py.string_dtype(), chunks=(64,))
+    dataset = h5file[EVENTS]
+    first = dataset.shape[0]
+    dataset.resize(first + len(events), axis=0)
+    dataset[first:] = [json.dumps(event) for event in events]
+
+
+def read_events(h5file):
+    if EVENTS not in h5file:
+        return []
+    return [json.loads(text) for text in h5file[EVENTS].asstr()[:]]
+
+
+def frames(h5file):
+    """
+    The (N, H, W) frames of a stacked recording: the 'frames' dataset, or
+    a delta_codec.delta_frames decoding them.
+    """
+    if delta_codec.is_hdf5_delta(h5file):
+        return delta_codec.hdf5_frames(h5file)
+    return h5file[FRAMES]
+
+
+def version(h5file):
+    """Schema version, 0 for early stacked files, None for legacy files."""
+    if 'schema_version' in h5file.attrs:
+        return int(h5file.attrs['schema_version'])
+    frames = h5file.get(FRAMES)
+    if isinstance(frames, h5py.Dataset) and frames.ndim == 3:
+        return 0
+    return None
+
+
+def summary(h5file):
+    """
+    Frame count, size, attributes and time span of a stacked recording,
+    read from metadata and the first and last timestamps only.
+    """
+    stack = frames(h5file)
+    result = {
+        'schema_version': version(h5file),
+        'frames': stack.shape[0],
+        'shape': stack.shape[1:],
+        'compression': getattr(stack, 'compression', 'delta'),
+    }
+    for key in ATTRIBUTES + ('created',):
+        if key in h5file.attrs:
+            value = h5file.attrs[key]
+            result[key] = value.item() if hasattr(value, 'item') else value
+    timestamps = h5file.get('timestamps')
+    if timestamps is not None and timestamps.shape[0] > 0:
+        result['start'] = float(timestamps[0])
+        result['duration'] = float(timestamps[-1] - timestamps[0])
+    return result
+
+
+def legacy_frames(h5file):
+    """{number: dataset} of a legacy one-dataset-per-frame recording."""
+    numbered = {}
+    for name, item in h5file.items():
+        match = IMAGE_NAME.match(name)
+        if match and isinstance(item, h5py.Dataset):
+            numbered[int(match.group(1))] = item
+    return numbered
+
+
+def convert_legacy(source, destination, chunk_frames=32, compression=None,
+                   compression_opts=None, batch=256, fps=8.7, attrs=None):
+    """
+    Copy a legacy recording into a new version 1 file. Legacy files carry
+    no capture times, so timestamps are spaced 1 / fps apart from 0 and
+    sequence counts from 0. Returns the number of frames copied.
+    """
+    with h5py.File(source, 'r') as src:
+        numbered = legacy_frames(src)
+        numbers = sorted(numbered)
+        if not numbers:
+            raise ValueError(source + ' holds no imageN frames')
+        shape = numbered[numbers[0]].shape
+        attrs = dict(attrs or {})
+        attrs.setdefault('fps', fps)
+        attrs['converted_from'] = source
+        with h5py.File(destination, 'w') as dst:
+            frame_writer = create(dst, shape, chunk_frames, compression,
+                                  compression_opts, attrs)
+            buffer = np.empty((batch,) + tuple(shape), np.uint16)
+            for first in range(0, len(numbers), batch):
+                chunk = numbers[first:first + batch]
+                for i, number in enumerate(chunk):
+                    numbered[number].read_direct(buffer[i])
+                indices = np.arange(first, first + len(chunk))
+                append(dst, first, buffer[:len(chunk)], indices,
+                       indices / float(fps), frame_writer=frame_writer)
+    return len(numbers)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Inspect recordings or convert legacy ones.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    info = commands.add_parser('info', help='print a recording summary')
+    info.add_argument('path')
+    convert = commands.add_parser(
+        'convert', help='rewrite a legacy imageN recording as version ' +
+        str(SCHEMA_VERSION))
+    convert.add_argument('source')
+    convert.add_argument('destination')
+    convert.add_argument('--compression', default=None,
+                         choices=('gzip', 'lzf', 'delta'))
+    convert.add_argument('--fps', type=float, default=8.7,
+                         help='frame rate the legacy file was recorded at')
+    args = parser.parse_args()
+
+    if args.command == 'info':
+        with h5py.File(args.path, 'r') as f:
+            if version(f) is None:
+                print(args.path + ': legacy recording, ' +
+                      str(len(legacy_frames(f))) + ' frames')
+            else:
+                for key, value in summary(f).items():
+                    print('{0}: {1}'.format(key, value))
+    else:
+        count = convert_legacy(args.source, args.destination,
+                               compression=args.compression, fps=args.fps)
+        print('Converted ' + str(count) + ' frames to ' + args.destination)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+# Regions of interest and their per-frame statistics. Run as
+#   python3 roi.py show <recording>
+#   python3 roi.py set <recording> <rois.json>
+#   python3 roi.py stats <recording> <table.csv> [--unit C]
+import argparse
+import base64
+import json
+import os
+import threading
+import time
+import h5py
+import numpy as np
+import cv2
+import heat_data
+import radiometry
+from shared_frames import frame_cursor
+
+KINDS = ('rect', 'polygon', 'ellipse', 'mask')
+STATS = ('min', 'max', 'mean', 'std')
+# where the definitions are kept: a JSON text dataset in HDF5 recordings,
+# a sidecar file next to raw and delta ones
+ROIS_DATASET = 'rois'
+SIDECAR_SUFFIX = '.rois.json'
+
+
+class region(object):
+    """
+    A named region in sensor coordinates: (column, row) points, pixel
+    centres inside the outline belong to it. Build one with rect(),
+    polygon(), ellipse() or mask().
+    """
+
+    def __init__(self, name, kind, **params):
+        if kind not in KINDS:
+            raise ValueError('Unknown region kind: ' + str(kind))
+        self.name = name
+        self.kind = kind
+        self.params = params
+
+    def mask(self, shape):
+        """Boolean (height, width) mask of the pixels in the region."""
+        height, width = shape
+        p = self.params
+        if self.kind == 'rect':
+            inside = np.zeros(shape, bool)
+            col, row = max(p['col'], 0), max(p['row'], 0)
+            inside[row:p['row'] + p['height'], col:p['col'] + p['width']] = \
+                True
+            return inside
+        if self.kind == 'polygon':
+            inside = np.zeros(shape, np.uint8)
+            points = np.rint(p['points']).astype(np.int32)
+            cv2.fillPoly(inside, [points], 1)
+            return inside.astype(bool)
+        if self.kind == 'ellipse':
+            rows, cols = np.mgrid[0:height, 0:width]
+            angle = np.radians(p.get('angle', 0.0))
+            dx = cols - p['center'][0]
+            dy = rows - p['center'][1]
+            u = dx * np.cos(angle) + dy * np.sin(angle)
+            v = -dx * np.sin(angle) + dy * np.cos(angle)
+            a, b = p['axes']
+            return (u / a) ** 2 + (v / b) ** 2 <= 1.0
+        bits = np.frombuffer(base64.b64decode(p['bits']), np.uint8)
+        inside = np.unpackbits(bits, count=p['height'] * p['width'])
+        inside = inside.reshape(p['height'], p['width']).astype(bool)
+        if inside.shape != tuple(shape):
+            raise ValueError('Mask of ' + self.name + ' is ' +
+                             str(inside.shape) + ', frames are ' + str(shape))
+        return inside
+
+    def to_dict(self):
+        return dict(self.params, name=self.name, kind=self.kind)
+
+    @classmethod
+    def from_dict(cls, values):
+        values = dict(values)
+        return cls(values.pop('name'), values.pop('kind'), **values)
+
+
+def rect(name, col, row, width, height):
+    return region(name, 'rect', col=int(col), row=int(row), width=int(width),
+                  height=int(height))
+
+
+def polygon(name, points):
+    return region(name, 'polygon',
+                  points=[[float(c), float(r)] for c, r in points])
+
+
+def ellipse(name, center, axes, angle=0.0):
+    """`axes` are the half lengths along and across `angle` (degrees)."""
+    return region(name, 'ellipse', center=[float(v) for v in center],
+                  axes=[float(v) for v in axes], angle=float(angle))
+
+
+def mask(name, inside):
+    inside = np.asarray(inside, bool)
+    bits = base64.b64encode(np.packbits(inside)).decode('ascii')
+    return region(name, 'mask', height=inside.shape[0],
+                  width=inside.shape[1], bits=bits)
+
+
+class roi_set(object):
+    """
+    The regions of one camera, prepared for per-frame statistics. The pixel
+    indices of all regions are concatenated once, region after region, so
+    a frame (or a batch of frames) is reduced with a single gather and one
+    ufunc.reduceat per statistic, however many regions there are. Regions
+    may overlap. Values are raw centikelvin.
+    """
+
+    def __init__(self, regions, shape, percentiles=()):
+        self.__regions = list(regions)
+        self.__shape = tuple(shape)
+        self.__percentiles = tuple(float(p) for p in percentiles)
+        if not self.__regions:
+            raise ValueError('No regions given')
+        pixels = []
+        for item in self.__regions:
+            inside = np.flatnonzero(item.mask(self.__shape))
+            if len(inside) == 0:
+                raise ValueError('Region ' + item.name + ' covers no pixels')
+            pixels.append(inside)
+        counts = np.array([len(p) for p in pixels], np.intp)
+        self.__pixels = np.concatenate(pixels)
+        self.__counts = counts
+        self.__starts = np.concatenate(([0], np.cumsum(counts)[:-1])) \
+            .astype(np.intp)
+        # the region number above the 16 bit value makes one sort order
+        # every region's values at once
+        self.__keys = np.repeat(
+            np.arange(len(counts), dtype=np.int64) << 16, counts)
+
+    def __len__(self):
+        return len(self.__regions)
+
+    @property
+    def regions(self):
+        return list(self.__regions)
+
+    @property
+    def names(self):
+        return [item.name for item in self.__regions]
+
+    @property
+    def shape(self):
+        return self.__shape
+
+    @property
+    def percentiles(self):
+        return self.__percentiles
+
+    @property
+    def counts(self):
+        """Pixels per region."""
+        return self.__counts.copy()
+
+    def labels(self):
+        """Label image, 0 outside every region, i + 1 in region i (the
+        later region where they overlap), e.g. for drawing outlines."""
+        labels = np.zeros(self.__shape[0] * self.__shape[1], np.int32)
+        for i in range(len(self.__counts)):
+            start = self.__starts[i]
+            labels[self.__pixels[start:start + self.__counts[i]]] = i + 1
+        return labels.reshape(self.__shape)
+
+    def compute(self, frames):
+        """
+        Statistics of every region for one (H, W) frame or a batch of
+        (N, H, W) frames: {'min', 'max', 'mean', 'std'} arrays of shape (R,)
+        or (N, R), plus 'percentiles' (.., R, P) when the set has any.
+        """
+        frames = np.asarray(frames)
+        single = frames.ndim == 2
+        flat = frames.reshape(1 if single else len(frames), -1)
+        values = flat[:, self.__pixels]
+        starts = self.__starts
+        sums = np.add.reduceat(values, starts, axis=1, dtype=np.float64)
+        squares = np.add.reduceat(np.square(values, dtype=np.float64),
+                                  starts, axis=1)
+        mean = sums / self.__counts
+        variance = squares / self.__counts - mean * mean
+        stats = {
+            'min': np.minimum.reduceat(values, starts, axis=1),
+            'max': np.maximum.reduceat(values, starts, axis=1),
+            'mean': mean,
+            'std': np.sqrt(np.maximum(variance, 0.0)),
+        }
+        if self.__percentiles:
+            stats['percentiles'] = self._percentiles(values)
+        if single:
+            stats = {name: value[0] for name, value in stats.items()}
+        return stats
+
+    def _percentiles(self, values):
+        ordered = np.sort(values | self.__keys, axis=1) & 0xFFFF
+        # linear interpolation between the closest ranks, like np.percentile
+        levels = np.asarray(self.__percentiles) / 100.0
+        ranks = (self.__counts[:, None] - 1) * levels[None, :]
+        low = np.floor(ranks).astype(np.intp)
+        high = np.minimum(low + 1, self.__counts[:, None] - 1)
+        weight = ranks - low
+        base = self.__starts[:, None]
+        below = ordered[:, base + low].astype(np.float64)
+        above = ordered[:, base + high].astype(np.float64)
+        return below + (above - below) * weight
+
+
+def in_unit(stats, unit):
+    """compute() results converted from centikelvin to `unit`."""
+    converted = {}
+    for name, values in stats.items():
+        if name == 'std':
+            # a spread is a difference, so only the scale applies
+            converted[name] = values * (0.018 if unit == 'F' else 0.01)
+        else:
+            converted[name] = radiometry.convert(values, unit)
+    return converted
+
+
+def over_recording(data, rois, batch=256, progress=None):
+    """
+    compute() for every frame of an open heat_data, in batches of `batch`
+    frames. Returns (N, R) arrays, frame n at index n - 1.
+    """
+    total = data.last_frame
+    count = len(rois)
+    result = {
+        'min': np.empty((total, count), np.uint16),
+        'max': np.empty((total, count), np.uint16),
+        'mean': np.empty((total, count), np.float64),
+        'std': np.empty((total, count), np.float64),
+    }
+    if rois.percentiles:
+        result['percentiles'] = np.empty(
+            (total, count, len(rois.percentiles)), np.float64)
+    for first in range(1, total + 1, batch):
+        stats = rois.compute(data.frames(first, first + batch))
+        part = slice(first - 1, first - 1 + len(stats['min']))
+        for name, values in stats.items():
+            result[name][part] = values
+        if progress is not None:
+            progress(part.stop, total)
+    return result
+
+
+def to_json(regions):
+    return json.dumps([item.to_dict() for item in regions])
+
+
+def from_json(text):
+    return [region.from_dict(values) for values in json.loads(text)]
+
+
+def read_file(path):
+    """Regions from a JSON file, as written by write_file()."""
+    with open(path) as f:
+        return from_json(f.read())
+
+
+def write_file(path, regions):
+    with open(path, 'w') as f:
+        f.write(to_json(regions))
+
+
+def sidecar_path(path):
+    return path + SIDECAR_SUFFIX
+
+
+def store(h5file, regions):
+    """Keep the region definitions in an open, writable HDF5 recording."""
+    if ROIS_DATASET in h5file:
+        del h5file[ROIS_DATASET]
+    h5file.create_dataset(ROIS_DATASET, data=to_json(regions))
+
+
+def save(path, regions):
+    """Keep the region definitions with the recording at `path`."""
+    if not h5py.is_hdf5(path):
+        write_file(sidecar_path(path), regions)
+    else:
+        with h5py.File(path, 'a') as f:
+            store(f, regions)
+
+
+def load(path):
+    """Regions stored with a recording, [] when it has none."""
+    if h5py.is_hdf5(path):
+        with h5py.File(path, 'r') as f:
+            if ROIS_DATASET in f:
+                return from_json(f[ROIS_DATASET].asstr()[()])
+    if os.path.exists(sidecar_path(path)):
+        return read_file(sidecar_path(path))
+    return []
+
+
+class roi_monitor(object):
+    """
+    Live statistics of a roi_set for every frame of a frame ring, computed
+    on a thread of its own that reads through its own frame_cursor, so the
+    display and recording are not held up. Listeners are called on that
+    thread with (number, timestamp, frame, stats) for each frame, where
+    `frame` is reused for the next one. `rois` can be replaced while
+    running, or be None when listeners only need the frames (stats is None
+    then).
+    """
+
+    def __init__(self, ring, rois):
+        self.rois = rois
+        self.__cursor = frame_cursor(ring)
+        self.__frame = np.empty(ring.shape, np.uint16)
+        self.__listeners = []
+        self.__latest = None
+        self.__lock = threading.Lock()
+        self.__thread = None
+        self.__running = False
+        self.__computed = 0
+        self.__seconds = 0.0
+
+    def add_listener(self, callback):
+        self.__listeners.append(callback)
+
+    def remove_listener(self, callback):
+        self.__listeners.remove(callback)
+
+    @property
+    def latest(self):
+        """(number, timestamp, stats) of the newest frame, or None."""
+        with self.__lock:
+            return self.__latest
+
+    def start(self):
+        self.__running = True
+        self.__thread = threading.Thread(target=self._run, daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        self.__running = False
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+
+    def stats(self):
+        return {
+            'computed': self.__computed,
+            'skipped': self.__cursor.dropped,
+            'pending': self.__cursor.pending,
+            'frame_ms': (self.__seconds * 1000.0 / self.__computed
+                         if self.__computed else 0.0),
+        }
+
+    def _run(self):
+        while self.__running:
+            result = self.__cursor.next(0.5, self.__frame)
+            if result is None:
+                continue
+            frame, number, timestamp = result
+            started = time.perf_counter()
+            rois = self.rois
+            stats = rois.compute(frame) if rois is not None else None
+            self.__seconds += time.perf_counter() - started
+            self.__computed += 1
+            with self.__lock:
+                self.__latest = (number, timestamp, stats)
+            for callback in list(self.__listeners):
+                callback(number, timestamp, frame, stats)
+
+
+def write_table(path, rois, stats, unit=None):
+    """
+    One CSV line per frame: the frame number, then min, max, mean and std
+    (and percentiles) of every region.
+    """
+    if unit is not None:
+        stats = in_unit(stats, unit)
+    columns = [np.arange(1, len(stats['min']) + 1)[:, None]]
+    header = ['frame']
+    for name in STATS:
+        columns.append(stats[name])
+        header += [region_name + '_' + name for region_name in rois.names]
+    if 'percentiles' in stats:
+        values = stats['percentiles']
+        columns.append(values.reshape(len(values), -1))
+        header += ['{0}_p{1:g}'.format(region_name, level)
+                   for region_name in rois.names
+                   for level in rois.percentiles]
+    table = np.hstack([np.asarray(c, np.float64) for c in columns])
+    fmt = ['%d'] + ['%.2f' if unit is not None else '%.1f'] * \
+        (table.shape[1] - 1)
+    np.savetxt(path, table, fmt=fmt, delimiter=',',
+               header=','.join(header), comments='')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Store regions of interest with a recording or compute '
+        'their statistics over it.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    show = commands.add_parser('show', help='print the stored regions')
+    show.add_argument('path')
+    define = commands.add_parser('set', help='store regions from JSON')
+    define.add_argument('path')
+    define.add_argument('rois')
+    table = commands.add_parser('stats', help='per-frame statistics as CSV')
+    table.add_argument('path')
+    table.add_argument('out')
+    table.add_argument('--rois', default=None,
+                       help='JSON regions instead of the stored ones')
+    table.add_argument('--unit', default=None, choices=radiometry.UNITS)
+    table.add_argument('--percentiles', type=float, nargs='*', default=())
+    args = parser.parse_args()
+
+    if args.command == 'show':
+        for item in load(args.path):
+            print(json.dumps(item.to_dict()))
+    elif args.command == 'set':
+        regions = read_file(args.rois)
+        save(args.path, regions)
+        print('Stored ' + str(len(regions)) + ' regions in ' + args.path)
+    else:
+        regions = read_file(args.rois) if args.rois else load(args.path)
+        if not regions:
+            parser.error(args.path + ' has no regions, use --rois')
+        data = heat_data.heat_data(args.path)
+        try:
+            rois = roi_set(regions, data.shape, args.percentiles)
+            started = time.perf_counter()
+            stats = over_recording(data, rois)
+            seconds = time.perf_counter() - started
+        finally:
+            data.close()
+        write_table(args.out, rois, stats, args.unit)
+        print('{0} regions over {1} frames in {2:.1f} s, written to {3}'
+              .format(len(rois), len(stats['min']), seconds, args.out))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,71 +1,442 @@
 import heat_data
 import colors
-import csv
+import radiometry
+import export_worker
+import json
+import os
+import time
+import collections
 import tifffile
 import cv2
 import numpy as np
-from tifffile import imsave
-from PIL import Image, TiffImagePlugin
 
+# frames handed to a worker process at a time
+EXPORT_BATCH = 16
+# fewer frames are exported in this process, starting a pool would take
+# longer than it saves
+MIN_POOL_FRAMES = 4 * EXPORT_BATCH
+# Lepton frame rate, used when a recording has no timestamps
+DEFAULT_FPS = 8.7
+# default fourcc per video container
+VIDEO_CODECS = {'.avi': 'XVID', '.mp4': 'mp4v', '.mkv': 'XVID'}
+# cv2.imwrite setting that `level` controls for each image format: PNG
+# compression 0 - 9, JPEG and WebP quality 0 - 100
+IMAGE_LEVELS = {
+    'png': cv2.IMWRITE_PNG_COMPRESSION,
+    'jpg': cv2.IMWRITE_JPEG_QUALITY,
+    'webp': cv2.IMWRITE_WEBP_QUALITY,
+}
 
-def to_csvs(stem, data, start, end):
-    for i in range(start, end):
-        savepath = stem + '_f' + str(i) + '.csv'
-        frame = data.frame(i, 640, 480)
-        to_csv(savepath, frame)
-    print('Finished saving csv files')
-    return
+
+def csv_format(unit):
+    # raw centikelvin values are integers, temperatures get two decimals
+    return '%d' if unit is None else '%.2f'
+
+
+def csv_values(frames, unit):
+    if unit is None:
+        return frames
+    return radiometry.temperatures(frames, unit)
+
+
+def write_csv_frame(savepath, frame, unit=None):
+    # np.savetxt formats a whole row per call instead of one cell at a time
+    np.savetxt(savepath, csv_values(frame, unit), fmt=csv_format(unit),
+               delimiter=',')
+
+
+def export_summary(name, frames, errors, started):
+    seconds = time.perf_counter() - started
+    summary = {
+        'frames': frames,
+        'errors': errors,
+        'seconds': seconds,
+        'frames_per_second': frames / seconds if seconds > 0 else 0.0,
+    }
+    print('Finished saving {0}: {1} frames in {2:.1f} s ({3:.1f} frames/s), '
+          '{4} errors'.format(name, frames, seconds,
+                              summary['frames_per_second'], len(errors)))
+    for number, message in errors:
+        print('  frame ' + str(number) + ': ' + message)
+    return summary
+
+
+def frame_batches(start, end, batch=EXPORT_BATCH):
+    return [(i, min(i + batch, end)) for i in range(start, end, batch)]
+
+
+def pool_size(processes, batches):
+    """
+    Worker processes for `batches`: `processes`, by default one per CPU,
+    at most one per batch and never more than there are CPUs. 1 means no
+    pool, with one CPU or too few frames for a pool to pay off.
+    """
+    cpus = os.cpu_count() or 1
+    if processes is None:
+        processes = cpus
+    frames = sum(stop - first for first, stop in batches)
+    if frames < MIN_POOL_FRAMES:
+        return 1
+    return max(1, min(processes, cpus, len(batches)))
+
+
+def run_batches(data, task, batches, args, processes, progress):
+    """
+    Run task(data, first, stop, *args) for every batch, in a process pool
+    of pool_size(processes) workers. Each task returns (frames done,
+    errors). Calls progress(done, total) after every batch.
+    """
+    total = sum(stop - first for first, stop in batches)
+    done = 0
+    errors = []
+    processes = pool_size(processes, batches)
+    if processes <= 1:
+        results = (task(data, first, stop, *args) for first, stop in batches)
+        pool = None
+    else:
+        pool = export_worker.pool(data.fullpath, processes)
+        results = pool.imap_unordered(
+            export_worker.run, [(task, first, stop, args)
+                                for first, stop in batches])
+    try:
+        for count, batch_errors in results:
+            done += count
+            errors.extend(batch_errors)
+            if progress is not None:
+                progress(done, total)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return done, errors
+
+
+def _csv_batch(data, first, stop, stem, width, height, unit):
+    frames = data.frames(first, stop, 1, width, height)
+    errors = []
+    for number, frame in zip(range(first, stop), frames):
+        try:
+            write_csv_frame(stem + '_f' + str(number) + '.csv', frame, unit)
+        except (IOError, OSError, ValueError) as e:
+            errors.append((number, str(e)))
+    return len(frames) - len(errors), errors
+
+
+def to_csvs(stem, data, start, end, width=0, height=0, unit=None,
+            processes=None, progress=None):
+    """
+    One CSV per frame at native resolution (or width x height), raw values
+    or temperatures in `unit`, spread over a process pool.
+    """
+    started = time.perf_counter()
+    done, errors = run_batches(
+        data, _csv_batch, frame_batches(start, end),
+        (stem, width, height, unit), processes, progress)
+    return export_summary('csv files', done, errors, started)
+
+
+def to_csv_table(savepath, data, start, end, layout='long', unit=None,
+                 progress=None):
+    """
+    A whole frame range in one CSV. 'long' writes frame,row,col,value lines,
+    'wide' writes one line per frame with a column per pixel. Frames are
+    read in batches so memory stays bounded.
+    """
+    started = time.perf_counter()
+    height, width = data.shape
+    fmt = csv_format(unit)
+    rows, cols = np.divmod(np.arange(height * width), width)
+    total = max(0, min(end, data.last_frame + 1) - start)
+    done = 0
+    with open(savepath, 'w', newline='') as f:
+        if layout == 'long':
+            f.write('frame,row,col,value\n')
+        else:
+            f.write('frame,' + ','.join(
+                'r{0}c{1}'.format(r, c) for r, c in zip(rows, cols)) + '\n')
+        for first, stop in frame_batches(start, end):
+            values = csv_values(data.frames(first, stop), unit)
+            for number, frame in zip(range(first, stop), values):
+                if layout == 'long':
+                    table = np.column_stack((
+                        np.full(rows.shape, number), rows, cols,
+                        frame.reshape(-1)))
+                    np.savetxt(f, table, fmt=('%d', '%d', '%d', fmt),
+                               delimiter=',')
+                else:
+                    f.write(str(number) + ',')
+                    np.savetxt(f, frame.reshape(1, -1), fmt=fmt,
+                               delimiter=',')
+            done += len(values)
+            if progress is not None:
+                progress(done, total)
+    return export_summary(savepath, done, [], started)
 
 
-def to_tiffs(savepath, data, colormap, start, end):
+def to_tiffs(savepath, data, colormap, start, end, raw=False,
+             compression='zlib', bigtiff=None, width=640, height=480,
+             progress=None):
+    """
+    Frames start to end - 1 as one multi-page TIFF, appended page by page
+    so memory does not grow with the recording. Pages are colorized RGB at
+    width x height, or with raw=True the native 16-bit radiometric frames.
+    Every page's description holds its frame number, timestamp and raw
+    min/max as JSON. BigTIFF is used automatically when the file could
+    pass 4 GB.
+    """
+    started = time.perf_counter()
+    end = min(end, data.last_frame + 1)
+    total = max(0, end - start)
+    if raw:
+        height, width = data.shape
+        page_bytes = 2 * height * width
+    else:
+        page_bytes = 3 * height * width
+    if bigtiff is None:
+        bigtiff = total * page_bytes > 2 ** 32 - 2 ** 26
+    timestamps = data.timestamps
+    bgr = np.empty((height, width, 3), np.uint8)
+    rgb = np.empty((height, width, 3), np.uint8)
+    scratch = np.empty((height, width), np.float64)
+    done = 0
+    errors = []
     try:
-        images = []
-        for i in range(1, data.last_frame):
-            frame = data.frame(i, 640, 480)
-            bgr = colors.colorize(frame, colormap)
-            # BGR2RGB conversion because of "Image.fromarray"
-            rgb_image = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
-            images.append(Image.fromarray(rgb_image))
-
-        images[0].save(savepath, compression='tiff_deflate',
-                       save_all=True, append_images=images[1:])
+        with tifffile.TiffWriter(savepath, bigtiff=bigtiff) as tif:
+            for first, stop in frame_batches(start, end):
+                frames = data.frames(first, stop)
+                for number, frame in zip(range(first, stop), frames):
+                    description = {
+                        'frame': number,
+                        'min': int(frame.min()),
+                        'max': int(frame.max()),
+                    }
+                    if timestamps is not None:
+                        description['timestamp'] = float(
+                            timestamps[number - 1])
+                    if raw:
+                        page = frame
+                    else:
+                        resized = cv2.resize(frame, (width, height))
+                        colors.colorize_into(bgr, resized, colormap,
+                                             scratch=scratch)
+                        page = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB, rgb)
+                    tif.write(page, compression=compression,
+                              photometric='rgb' if page.ndim == 3
+                              else 'minisblack',
+                              description=json.dumps(description),
+                              metadata=None, contiguous=False)
+                    done += 1
+                if progress is not None:
+                    progress(done, total)
         print('Saved ' + savepath)
-    except:
+    except (IOError, OSError, ValueError) as e:
+        errors.append((start + done, str(e)))
         print('Error while saving ' + savepath)
-    return
+    return export_summary(savepath, done, errors, started)
 
 
-def to_pngs(stem, data, colormap, start, end):
-    for i in range(start, end):
-        savepath = stem + 'f_' + str(i) + '.png'
-        frame = data.frame(i, 640, 480)
-        to_png(savepath, frame, colormap)
-    print('Finished saving png files')
-    return
+def recorded_fps(data, start=1, end=None, default=DEFAULT_FPS):
+    """Average frame rate of frames start to end - 1 from their timestamps."""
+    timestamps = data.timestamps
+    if timestamps is None:
+        return default
+    if end is None:
+        end = data.last_frame + 1
+    timestamps = timestamps[max(start, 1) - 1:end - 1]
+    if len(timestamps) < 2:
+        return default
+    span = float(timestamps[-1] - timestamps[0])
+    if not np.isfinite(span) or span <= 0:
+        return default
+    return (len(timestamps) - 1) / span
+
+
+def _video_batch(data, first, stop, colormap, width, height, overlay, unit,
+                 timestamps):
+    # `timestamps` are those of frames first to stop - 1, or None
+    frames = data.frames(first, stop, 1, width, height)
+    bgr = np.empty((len(frames), height, width, 3), np.uint8)
+    scratch = np.empty((height, width), np.float64)
+    for i, frame in enumerate(frames):
+        colors.colorize_into(bgr[i], frame, colormap, scratch=scratch)
+        if overlay:
+            text = 'f' + str(first + i)
+            if timestamps is not None:
+                text += '  ' + time.strftime(
+                    '%H:%M:%S', time.localtime(timestamps[i]))
+            text += '  max ' + radiometry.format_temp(frame.max(), unit)
+            cv2.putText(bgr[i], text, (8, height - 10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1,
+                        cv2.LINE_AA)
+    return bgr
+
+
+def run_ordered(data, jobs, processes):
+    """
+    Yield (first, task(data, first, stop, *args)) for every (task, first,
+    stop, args) in `jobs`, in order, from a process pool when processes > 1.
+    At most two batches per process are in flight, so results do not pile
+    up when the consumer is the slower side. A task's exception is yielded
+    in place of its result.
+    """
+    if processes <= 1:
+        for task, first, stop, args in jobs:
+            try:
+                yield first, task(data, first, stop, *args)
+            except Exception as e:
+                yield first, e
+        return
+    pool = export_worker.pool(data.fullpath, processes)
+    pending = collections.deque()
+    try:
+        for job in jobs:
+            pending.append((job[1], pool.apply_async(export_worker.run,
+                                                     (job,))))
+            if len(pending) >= 2 * processes:
+                yield _ordered_result(*pending.popleft())
+        while pending:
+            yield _ordered_result(*pending.popleft())
+    finally:
+        if pending:
+            # the consumer stopped early, drop the batches still in flight
+            pool.terminate()
+        else:
+            pool.close()
+        pool.join()
+
+
+def _ordered_result(first, result):
+    try:
+        return first, result.get()
+    except Exception as e:
+        return first, e
 
 
-def to_avi(savepath, data, colormap, start, end):
+def to_avi(savepath, data, colormap, start, end, codec=None, fps=None,
+           quality=None, width=640, height=480, overlay=False, unit='C',
+           hw_acceleration=False, processes=None, progress=None):
+    """
+    Frames start to end - 1 as a colorized video. Reading and colorizing
+    run in a process pool, batch by batch, while this process encodes the
+    finished batches in order. The container follows the file extension
+    (.avi, .mp4, .mkv), `codec` is a fourcc overriding its default,
+    `quality` (0 - 100) applies to codecs that support it. `fps` defaults
+    to the rate the frames were recorded at. The overlay shows the frame
+    number, time and maximum temperature in `unit`.
+    """
+    started = time.perf_counter()
+    end = min(end, data.last_frame + 1)
+    total = max(0, end - start)
+    if codec is None:
+        extension = os.path.splitext(savepath)[1].lower()
+        codec = VIDEO_CODECS.get(extension, 'XVID')
+    if fps is None:
+        fps = recorded_fps(data, start, end)
+    params = []
+    if quality is not None:
+        params += [cv2.VIDEOWRITER_PROP_QUALITY, int(quality)]
+    if hw_acceleration and hasattr(cv2, 'VIDEOWRITER_PROP_HW_ACCELERATION'):
+        params += [cv2.VIDEOWRITER_PROP_HW_ACCELERATION,
+                   cv2.VIDEO_ACCELERATION_ANY]
+    out = cv2.VideoWriter(savepath, cv2.CAP_ANY,
+                          cv2.VideoWriter_fourcc(*codec), fps,
+                          (width, height), params)
+    if not out.isOpened():
+        print('Error while saving ' + savepath + ': cannot open ' + codec +
+              ' encoder')
+        return export_summary(savepath, 0, [(start, 'cannot open encoder')],
+                              started)
+    batches = frame_batches(start, end)
+    if processes is None:
+        # one process stays free for the encoder
+        processes = max(1, (os.cpu_count() or 1) - 1)
+    processes = pool_size(processes, batches)
+    timestamps = data.timestamps
+    jobs = ((_video_batch, first, stop,
+             (colormap, width, height, overlay, unit,
+              None if timestamps is None else timestamps[first - 1:stop - 1]))
+            for first, stop in batches)
+    done = 0
+    errors = []
     try:
-        fourcc = cv2.VideoWriter_fourcc(*'XVID')
-        fps = 8.7
-        out = cv2.VideoWriter(savepath, fourcc, fps, (640, 480), True)
-        print(data)
-        for i in range(start, end):
-            frame = data.frame(i, 640, 480)
-            bgr = colors.colorize(frame, colormap)
-            out.write(bgr)
+        for first, result in run_ordered(data, jobs, processes):
+            if isinstance(result, Exception):
+                errors.append((first, str(result)))
+                continue
+            try:
+                for bgr in result:
+                    out.write(bgr)
+                    done += 1
+            except (cv2.error, ValueError) as e:
+                errors.append((first, str(e)))
+            if progress is not None:
+                progress(done, total)
+    finally:
         out.release()
-        print('Saved ' + savepath)
-    except:
+    if errors:
         print('Error while saving ' + savepath)
-    return
+    else:
+        print('Saved ' + savepath)
+    return export_summary(savepath, done, errors, started)
+
+
+def _image_batch(data, first, stop, stem, ext, colormap, raw, width, height,
+                 params):
+    if raw:
+        frames = data.frames(first, stop)
+    else:
+        frames = data.frames(first, stop, 1, width, height)
+        bgr = np.empty((height, width, 3), np.uint8)
+        scratch = np.empty((height, width), np.float64)
+    errors = []
+    for number, frame in zip(range(first, stop), frames):
+        savepath = stem + 'f_' + str(number) + '.' + ext
+        try:
+            # raw frames are written as 16-bit grayscale
+            image = frame if raw else colors.colorize_into(
+                bgr, frame, colormap, scratch=scratch)
+            if not cv2.imwrite(savepath, image, params):
+                errors.append((number, 'could not write ' + savepath))
+        except cv2.error as e:
+            errors.append((number, str(e)))
+    return len(frames) - len(errors), errors
+
+
+def to_images(stem, data, colormap, start, end, ext='png', level=None,
+              raw=False, width=640, height=480, processes=None,
+              progress=None):
+    """
+    Frames start to end - 1 as numbered png, jpg or webp files, spread over a
+    process pool. `level` is the PNG compression level or the JPEG/WebP
+    quality, the format's default when omitted. With raw=True PNGs hold the
+    native 16-bit radiometric frames instead of colorized ones.
+    """
+    ext = ext.lower().lstrip('.')
+    if ext == 'jpeg':
+        ext = 'jpg'
+    if ext not in IMAGE_LEVELS:
+        raise ValueError('Unsupported image format: ' + ext)
+    if raw and ext != 'png':
+        raise ValueError('Raw 16-bit frames can only be saved as png')
+    started = time.perf_counter()
+    end = min(end, data.last_frame + 1)
+    params = [] if level is None else [IMAGE_LEVELS[ext], int(level)]
+    done, errors = run_batches(
+        data, _image_batch, frame_batches(start, end),
+        (stem, ext, colormap, raw, width, height, params), processes,
+        progress)
+    return export_summary(ext + ' files', done, errors, started)
+
+
+def to_pngs(stem, data, colormap, start, end, level=None, raw=False,
+            processes=None, progress=None):
+    return to_images(stem, data, colormap, start, end, 'png', level, raw,
+                     processes=processes, progress=progress)
 
 
 def to_csv(savepath, frame):
     try:
-        with open(savepath, 'w', newline="") as f:
-            writer = csv.writer(f)
-            writer.writerows(frame)
+        write_csv_frame(savepath, frame)
         print('Saved ' + savepath)
     except:
         print('Error while saving ' + savepath)
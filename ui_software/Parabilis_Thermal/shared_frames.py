@@ -0,0 +1,201 @@
+import atexit
+import sys
+import time
+import numpy as np
+from multiprocessing import resource_tracker, shared_memory
+from frame_ring import frame_ring
+
+# header: capacity, height, width, write_count
+HEADER_FIELDS = 4
+
+
+def _open_shared_memory(name, create, size=0):
+    try:
+        # keep attaching processes from unlinking the producer's block on exit
+        return shared_memory.SharedMemory(
+            name=name, create=create, size=size, track=create)
+    except TypeError:  # python < 3.13
+        shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+        if not create:
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+def _layout_size(capacity, height, width):
+    return 8 * (HEADER_FIELDS + 4 * capacity) + 2 * capacity * height * width
+
+
+class shared_frame_ring(frame_ring):
+    """
+    frame_ring whose slots live in a multiprocessing.shared_memory block, so
+    each frame is written once and read in place by frame_cursor consumers in
+    this or any other process. Other processes use attach(name).
+    """
+
+    def __init__(self, capacity, height, width, name=None):
+        self.__owner = True
+        self.__shm = _open_shared_memory(
+            name, True, _layout_size(capacity, height, width))
+        # a block left behind stays in /dev/shm until reboot, so unlink it
+        # on any interpreter exit, not only when the owner remembers to
+        atexit.register(self.unlink)
+        super().__init__(capacity, height, width)
+        self._header[:3] = (capacity, height, width)
+
+    @classmethod
+    def attach(cls, name):
+        """Map an existing ring created by another process."""
+        ring = cls.__new__(cls)
+        ring.__owner = False
+        ring.__shm = _open_shared_memory(name, False)
+        header = np.ndarray((HEADER_FIELDS,), np.int64, ring.__shm.buf)
+        capacity, height, width = (int(v) for v in header[:3])
+        frame_ring.__init__(ring, capacity, height, width)
+        return ring
+
+    def _allocate(self, capacity, height, width):
+        buf = self.__shm.buf
+        offset = 0
+        self._header = np.ndarray((HEADER_FIELDS,), np.int64, buf, offset)
+        offset += 8 * HEADER_FIELDS
+        self._sequence = np.ndarray((capacity,), np.int64, buf, offset)
+        offset += 8 * capacity
+        self._timestamps = np.ndarray((capacity,), np.float64, buf, offset)
+        offset += 8 * capacity
+        self._numbers = np.ndarray((capacity,), np.int64, buf, offset)
+        offset += 8 * capacity
+        self._flags = np.ndarray((capacity,), np.int64, buf, offset)
+        offset += 8 * capacity
+        self._frames = np.ndarray(
+            (capacity, height, width), np.uint16, buf, offset)
+        self._write_count = self._header[3:4]
+
+    @property
+    def name(self):
+        return self.__shm.name
+
+    def wait_for_write(self, count, timeout=None, poll=0.002):
+        if self.__owner:
+            return super().wait_for_write(count, timeout)
+        # the producer cannot notify another process, so poll the header
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.write_count <= count:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(poll)
+        return True
+
+    def close(self):
+        # numpy views must go before the mapping can be released
+        self._header = self._sequence = self._timestamps = self._numbers = None
+        self._flags = None
+        self._frames = self._write_count = None
+        self.__shm.close()
+
+    def unlink(self):
+        """Remove the block once; attached readers keep their mapping."""
+        if self.__owner:
+            self.__owner = False
+            atexit.unregister(self.unlink)
+            try:
+                self.__shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class frame_cursor(object):
+    """
+    Independent read position on a frame_ring. Every consumer (display,
+    recorder, analytics) owns one, so reading never takes frames away from
+    anybody else. next() hands out views into the ring; check still_valid()
+    after using a view to know it was not overwritten meanwhile.
+    """
+
+    def __init__(self, ring, from_start=False):
+        self.__ring = ring
+        self.__position = 0 if from_start else ring.write_count
+        self.__last = -1
+        self.__dropped = 0
+
+    @property
+    def position(self):
+        return self.__position
+
+    @property
+    def dropped(self):
+        return self.__dropped
+
+    @property
+    def pending(self):
+        return self.__ring.write_count - self.__position
+
+    def _skip_overrun(self):
+        oldest = self.__ring.write_count - self.__ring.capacity
+        if self.__position < oldest:
+            self.__dropped += oldest - self.__position
+            self.__position = oldest
+
+    def next(self, timeout=None, out=None):
+        """
+        Next unread frame as (frame, number, timestamp) or None on timeout.
+        Without `out` the frame is a zero-copy view into the ring.
+        """
+        while True:
+            if not self.__ring.wait_for_write(self.__position, timeout):
+                return None
+            self._skip_overrun()
+            frame, number, timestamp = self.__ring.view(self.__position)
+            if out is not None:
+                np.copyto(out, frame)
+                frame = out
+            if self.__ring.is_current(self.__position):
+                self.__last = self.__position
+                self.__position += 1
+                return frame, number, timestamp
+            # overwritten while we were reading it, try the next one
+            self.__dropped += 1
+            self.__position += 1
+
+    def latest(self, out=None):
+        """
+        Skip to the newest frame this cursor has not read yet, counting the
+        skipped ones. Returns None when there is nothing new.
+        """
+        count = self.__ring.write_count
+        if count > self.__position + 1:
+            self.__dropped += count - 1 - self.__position
+            self.__position = count - 1
+        return self.next(0, out)
+
+    def still_valid(self):
+        """True while the view last returned by next() is intact."""
+        return self.__last >= 0 and self.__ring.is_current(self.__last)
+
+
+def main():
+    # minimal out-of-process consumer: python3 shared_frames.py <shm name>
+    ring = shared_frame_ring.attach(sys.argv[1])
+    cursor = frame_cursor(ring)
+    printed = 0.0
+    try:
+        while True:
+            result = cursor.next(timeout=5)
+            if result is None:
+                print('No frames for 5 seconds')
+                continue
+            # reads every frame, prints about one a second
+            if time.monotonic() - printed < 1.0:
+                continue
+            printed = time.monotonic()
+            frame, number, timestamp = result
+            print('{0}\t{1:.3f}\tmin {2}\tmax {3}\tdropped {4}'.format(
+                number, timestamp, frame.min(), frame.max(), cursor.dropped))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        del cursor
+        ring.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+import threading
+import time
+import numpy as np
+
+LEPTON_3_SHAPE = (120, 160)
+LEPTON_2_SHAPE = (60, 80)
+LEPTON_FPS = 8.7
+
+
+class synthetic_frames(object):
+    """
+    Synthetic radiometric Y16 frames (centikelvin): a room temperature
+    background with a vertical gradient, a hot spot circling the frame and
+    sensor noise. Noise is drawn once into a small bank so producing a frame
+    costs a few array additions, not a random number per pixel.
+    """
+
+    def __init__(self, shape=LEPTON_3_SHAPE, background_k=295.0,
+                 hot_spot_k=330.0, noise_ck=8.0, seed=0):
+        height, width = shape
+        self.__shape = (height, width)
+        rng = np.random.default_rng(seed)
+        rows = np.linspace(-150.0, 150.0, height)[:, None]
+        self.__background = np.full(shape, background_k * 100.0) + rows
+        yy, xx = np.mgrid[0:height, 0:width]
+        self.__yy = yy
+        self.__xx = xx
+        self.__sigma2 = 2.0 * (min(shape) / 10.0) ** 2
+        self.__spot_ck = (hot_spot_k - background_k) * 100.0
+        self.__noise = rng.normal(0.0, noise_ck, (8,) + self.__shape)
+        self.__count = 0
+
+    @property
+    def shape(self):
+        return self.__shape
+
+    def next(self, out=None):
+        if out is None:
+            out = np.empty(self.__shape, np.uint16)
+        height, width = self.__shape
+        angle = self.__count * 0.05
+        cy = height / 2.0 + height / 4.0 * np.sin(angle)
+        cx = width / 2.0 + width / 4.0 * np.cos(angle)
+        spot = np.exp(-((self.__yy - cy) ** 2 + (self.__xx - cx) ** 2)
+                      / self.__sigma2)
+        frame = self.__background + self.__spot_ck * spot
+        frame += self.__noise[self.__count % len(self.__noise)]
+        np.copyto(out, np.clip(frame, 0, 65535), casting='unsafe')
+        self.__count += 1
+        return out
+
+
+class simulated_device(object):
+    def __init__(self, serial, shape, fps):
+        self.serial = serial
+        self.shape = shape
+        self.fps = fps
+        self.thread = None
+        self.running = False
+
+
+class simulated_backend(object):
+    """
+    Stand-in for the libuvc backend of capture_daemon. Each serial streams
+    synthetic frames at `fps` from its own thread into the ring given to
+    start(). unplug()/plug() simulate hot-plug events.
+    """
+
+    def __init__(self, serials=('SIM00001',), shape=LEPTON_3_SHAPE,
+                 fps=LEPTON_FPS):
+        self.__shape = tuple(shape)
+        self.__fps = fps
+        self.__attached = list(serials)
+        self.__lock = threading.Lock()
+
+    def enumerate(self):
+        with self.__lock:
+            return list(self.__attached)
+
+    def plug(self, serial):
+        with self.__lock:
+            if serial not in self.__attached:
+                self.__attached.append(serial)
+
+    def unplug(self, serial):
+        with self.__lock:
+            if serial in self.__attached:
+                self.__attached.remove(serial)
+
+    def open(self, serial):
+        if serial not in self.enumerate():
+            raise IOError('Device ' + serial + ' not found')
+        return simulated_device(serial, self.__shape, self.__fps)
+
+    def info(self, device):
+        return {'serial': device.serial, 'firmware': 'simulated'}
+
+    def start(self, device, ring):
+        device.running = True
+        device.thread = threading.Thread(
+            target=self._stream, args=(device, ring), daemon=True)
+        device.thread.start()
+
+    def close(self, device):
+        device.running = False
+        if device.thread is not None:
+            device.thread.join()
+            device.thread = None
+
+    def _stream(self, device, ring):
+        source = synthetic_frames(
+            device.shape, seed=sum(device.serial.encode()))
+        frame = np.empty(device.shape, np.uint16)
+        interval = 1.0 / device.fps
+        deadline = time.monotonic()
+        sequence = 0
+        # an unplugged device stops delivering frames, like real hardware
+        while device.running and device.serial in self.enumerate():
+            source.next(frame)
+            ring.push_pointer(frame.ctypes.data, frame.nbytes, time.time(),
+                              sequence)
+            sequence += 1
+            deadline += interval
+            time.sleep(max(0.0, deadline - time.monotonic()))
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+# Recording time left on the disks being recorded to, from the rate the
+# recordings actually grow at. Run as
+#   python3 storage.py <directory> [--rate BYTES_PER_SECOND]
+import argparse
+import glob
+import math
+import os
+import shutil
+import time
+
+# uncompressed 160x120 Lepton 3.5 video at 8.7 fps, assumed until a
+# recording has been measured
+DEFAULT_BYTES_PER_SECOND = 160 * 120 * 2 * 8.7
+# compression ratios on the synthetic scene of benchmark.py, for the rate of
+# a recording that has not been measured yet
+COMPRESSION_RATIOS = {None: 1.0, 'lzf': 1.1, 'gzip': 1.6, 'delta': 2.4}
+# seconds for the measured rate to follow a change (e.g. a busier scene
+# compressing worse) by 63 %
+TIME_CONSTANT = 30.0
+# recording time left, in seconds, below which the recordings are switched
+# to delta compression, rotated into a new file (deleting the oldest ones)
+# and stopped
+COMPRESS_SECONDS = 30 * 60
+ROTATE_SECONDS = 5 * 60
+STOP_SECONDS = 60
+# a rotation deletes the oldest closed recordings until this many times
+# rotate_seconds of recording time is free again
+RECLAIM_FACTOR = 2.0
+# (action, threshold argument) from the first to the last resort
+ACTIONS = (('compress', 'compress_seconds'), ('rotate', 'rotate_seconds'),
+           ('stop', 'stop_seconds'))
+
+
+def file_bytes(path):
+    """Space a file takes on disk, 0 when it does not exist (yet)."""
+    try:
+        info = os.stat(path)
+    except (OSError, TypeError):
+        return 0
+    # preallocated raw recordings are sparse, count what is allocated
+    if hasattr(info, 'st_blocks'):
+        return min(info.st_size, info.st_blocks * 512)
+    return info.st_size
+
+
+def remove_recording(path):
+    """
+    Delete a recording and the files kept next to it (events, regions).
+    Returns the bytes freed.
+    """
+    freed = 0
+    for name in [path] + glob.glob(glob.escape(path) + '.*'):
+        size = file_bytes(name)
+        try:
+            os.remove(name)
+        except OSError:
+            continue
+        freed += size
+    return freed
+
+
+def expected_rate(shape, fps, layout='stacked', compression=None):
+    """
+    Bytes per second a recording of `shape` frames at `fps` is expected to
+    grow by before it has been measured.
+    """
+    if layout == 'delta':
+        compression = 'delta'
+    elif layout == 'raw':
+        compression = None
+    ratio = COMPRESSION_RATIOS.get(compression, 1.0)
+    return shape[0] * shape[1] * 2 * fps / ratio
+
+
+def seconds_left(directory, bytes_per_second=DEFAULT_BYTES_PER_SECOND):
+    """Recording time the free space of `directory`'s filesystem holds."""
+    if bytes_per_second <= 0:
+        return math.inf
+    return shutil.disk_usage(directory).free / float(bytes_per_second)
+
+
+def compressed_layout(layout, compression):
+    """(layout, compression) to switch to when space runs low."""
+    if layout == 'raw':
+        return 'delta', None
+    if layout == 'delta':
+        return layout, compression
+    return 'stacked', 'delta'
+
+
+class storage_budget(object):
+    """
+    Watches recorders, each under a name (one per camera), and forecasts
+    how long each can keep recording. A recorder's rate is the smoothed
+    growth of stats()['file_bytes'], so it holds for whatever layout and
+    compression it writes; recorders on the same filesystem share its free
+    space. update() polls them and returns the (name, action) pairs whose
+    threshold was crossed: 'compress' below compress_seconds, 'rotate'
+    below rotate_seconds and 'stop' below stop_seconds, each at most once
+    per name and only the last of several crossed at once (a threshold of
+    0 or None is never crossed). Acting on them is up to the caller; after
+    a rotation, watch() the new recorder under the same name to keep its
+    rate and the actions already taken.
+
+    Rotating frees space: the recorders a name was watched with before are
+    its closed recordings, and after a 'rotate' the following updates
+    delete the oldest of them, once closed, until RECLAIM_FACTOR times
+    rotate_seconds of recording time is free. 'rotate' is then returned
+    again the next time the threshold is crossed, so a session keeps
+    recording into a ring of files; with nothing left to delete it goes on
+    to 'stop'. The recording being written is never deleted.
+    """
+
+    def __init__(self, time_constant=TIME_CONSTANT,
+                 compress_seconds=COMPRESS_SECONDS,
+                 rotate_seconds=ROTATE_SECONDS, stop_seconds=STOP_SECONDS):
+        self.__time_constant = time_constant
+        self.__thresholds = {'compress_seconds': compress_seconds,
+                             'rotate_seconds': rotate_seconds,
+                             'stop_seconds': stop_seconds}
+        self.__watched = {}
+        self.__forecast = {}
+
+    @property
+    def names(self):
+        return list(self.__watched)
+
+    def watch(self, name, recorder, directory=None,
+              expected_rate=DEFAULT_BYTES_PER_SECOND):
+        """
+        Measure `recorder` (anything with stats()['file_bytes'], e.g. an
+        hdf5_recorder) writing into `directory`, by default the directory
+        of recorder.path. The measured rate starts from `expected_rate`, in
+        bytes per second.
+        """
+        if directory is None:
+            directory = os.path.dirname(os.path.abspath(recorder.path))
+        entry = self.__watched.get(name)
+        if entry is None:
+            entry = {'rate': None, 'taken': set(), 'closed': [],
+                     'reclaim': False}
+            self.__watched[name] = entry
+        elif entry['recorder'] is not recorder:
+            entry['closed'].append(entry['recorder'])
+        entry.update({
+            'recorder': recorder,
+            'directory': directory,
+            'device': os.stat(directory).st_dev,
+            'expected_rate': expected_rate,
+            'bytes': recorder.stats().get('file_bytes', 0),
+            'time': time.monotonic(),
+        })
+
+    def unwatch(self, name):
+        self.__watched.pop(name, None)
+        self.__forecast.pop(name, None)
+
+    def _measure(self, entry, now):
+        if entry['rate'] is None:
+            entry['rate'] = float(entry['expected_rate'])
+        written = entry['recorder'].stats().get('file_bytes', 0)
+        elapsed = now - entry['time']
+        if elapsed <= 0:
+            return
+        rate = max(0, written - entry['bytes']) / elapsed
+        # weighted by the time since the last poll, so irregular polls
+        # smooth over the same time span
+        weight = 1.0 - math.exp(-elapsed / self.__time_constant)
+        entry['rate'] += weight * (rate - entry['rate'])
+        entry['bytes'] = written
+        entry['time'] = now
+
+    def _reclaim(self, entry, rate):
+        """Delete the oldest closed recordings of `entry`, returns paths."""
+        directory = entry['directory']
+        wanted = RECLAIM_FACTOR * self.__thresholds['rotate_seconds'] * rate
+        deleted = []
+        for recorder in list(entry['closed']):
+            if shutil.disk_usage(directory).free >= wanted:
+                break
+            # a file still being closed is deleted by a later update
+            if not getattr(recorder, 'closed', True):
+                continue
+            remove_recording(recorder.path)
+            entry['closed'].remove(recorder)
+            deleted.append(recorder.path)
+        if shutil.disk_usage(directory).free >= wanted:
+            entry['reclaim'] = False
+            # space is back, the next crossing rotates again
+            entry['taken'].discard('rotate')
+        elif not entry['closed']:
+            # nothing left to delete, the recording goes on to 'stop'
+            entry['reclaim'] = False
+        return deleted
+
+    def update(self):
+        now = time.monotonic()
+        for entry in self.__watched.values():
+            self._measure(entry, now)
+        # recorders on one filesystem share its free space
+        devices = {}
+        for entry in self.__watched.values():
+            device = devices.setdefault(
+                entry['device'], {'directory': entry['directory'], 'rate': 0.0})
+            device['rate'] += entry['rate']
+        deleted = {}
+        for name, entry in self.__watched.items():
+            if entry['reclaim']:
+                deleted[name] = self._reclaim(
+                    entry, devices[entry['device']]['rate'])
+        usage = {device: shutil.disk_usage(values['directory'])
+                 for device, values in devices.items()}
+        actions = []
+        for name, entry in self.__watched.items():
+            total_rate = devices[entry['device']]['rate']
+            free = usage[entry['device']].free
+            left = free / total_rate if total_rate > 0 else math.inf
+            self.__forecast[name] = {
+                'directory': entry['directory'],
+                'free_bytes': free,
+                'disk_bytes': usage[entry['device']].total,
+                'file_bytes': entry['bytes'],
+                'bytes_per_second': entry['rate'],
+                'filesystem_bytes_per_second': total_rate,
+                'seconds_left': left,
+                'deleted': deleted.get(name, []),
+            }
+            # only the last resort crossed, the earlier ones are moot
+            for i in reversed(range(len(ACTIONS))):
+                action, threshold = ACTIONS[i]
+                limit = self.__thresholds[threshold]
+                if limit and left < limit:
+                    if action not in entry['taken']:
+                        entry['taken'].update(a for a, _ in ACTIONS[:i + 1])
+                        actions.append((name, action))
+                        if action == 'rotate':
+                            entry['reclaim'] = True
+                    break
+        return actions
+
+    def forecast(self, name=None):
+        """
+        The forecast of the last update() for `name`, None before then, or
+        for every name: free_bytes and disk_bytes of the filesystem, the
+        recorder's file_bytes and smoothed bytes_per_second,
+        filesystem_bytes_per_second of all recorders on it, seconds_left
+        at that rate and the paths of the closed recordings that update()
+        deleted.
+        """
+        if name is None:
+            return {key: dict(value) for key, value in self.__forecast.items()}
+        value = self.__forecast.get(name)
+        return None if value is None else dict(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Print the recording time left in a directory.')
+    parser.add_argument('directory', nargs='?', default='.')
+    parser.add_argument('--rate', type=float,
+                        default=DEFAULT_BYTES_PER_SECOND,
+                        help='bytes per second recorded, by default '
+                             'uncompressed Lepton 3.5 video')
+    args = parser.parse_args()
+
+    usage = shutil.disk_usage(args.directory)
+    left = seconds_left(args.directory, args.rate)
+    print('{0}: {1:.1f} of {2:.1f} GB free, {3:.1f} hours of recording '
+          'at {4:.0f} kB/s'.format(args.directory, usage.free / 1e9,
+                                   usage.total / 1e9, left / 3600.0,
+                                   args.rate / 1e3))
+
+
+if __name__ == '__main__':
+    main()
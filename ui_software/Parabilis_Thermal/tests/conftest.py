@@ -0,0 +1,37 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+# the modules sit next to this directory and import each other by name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from simulated_uvc import synthetic_frames  # noqa: E402
+
+SHAPE = (120, 160)
+
+
+@pytest.fixture
+def frames():
+    """Sixty synthetic 160x120 Lepton frames, a moving hot spot on noise."""
+    source = synthetic_frames(SHAPE, seed=1)
+    stack = np.empty((60,) + SHAPE, np.uint16)
+    for frame in stack:
+        source.next(frame)
+    return stack
+
+
+@pytest.fixture
+def recording(tmp_path, frames):
+    """The frames as a stacked recording, 8.7 fps from t = 1000 s, open."""
+    import heat_data
+    from recorder import hdf5_recorder
+    path = str(tmp_path / 'recording.HDF5')
+    writer = hdf5_recorder(path, frames.shape[1:])
+    writer.start()
+    for i, frame in enumerate(frames):
+        writer.submit(frame, i, 1000.0 + i / 8.7)
+    writer.stop()
+    data = heat_data.heat_data(path)
+    yield data
+    data.close()
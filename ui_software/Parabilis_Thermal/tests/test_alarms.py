@@ -0,0 +1,136 @@
+import numpy as np
+import pytest
+import alarms
+import radiometry
+import roi
+
+
+def frame(celsius, shape=(12, 16)):
+    value = (celsius + radiometry.KELVIN_OFFSET) * 100.0
+    return np.full(shape, int(round(value)), np.uint16)
+
+
+def run(engine, values, fps=10.0):
+    """(time, rule, state) of the events over a series of frame values."""
+    events = []
+    for i, value in enumerate(values):
+        for event in engine.update(frame(value), i / fps, number=i):
+            events.append((event['time'], event['rule'], event['state']))
+    return events
+
+
+def test_threshold_with_hysteresis():
+    engine = alarms.alarm_engine([alarms.rule(
+        'hot', 'threshold', 'frame:max', 40.0, hysteresis=2.0)])
+    values = [30, 41, 39, 38.5, 41, 37.5, 37, 45]
+    events = run(engine, values, fps=1.0)
+    # 39 and 38.5 are within the hysteresis, 37.5 is below it
+    assert events == [(1.0, 'hot', 'raised'), (5.0, 'hot', 'cleared'),
+                      (7.0, 'hot', 'raised')]
+    assert engine.active == ['hot']
+
+
+def test_threshold_below():
+    engine = alarms.alarm_engine([alarms.rule(
+        'cold', 'threshold', 'pixel:3,2', 5.0, above=False, hysteresis=1.0)])
+    events = run(engine, [10, 4, 5.5, 6.5], fps=1.0)
+    assert events == [(1.0, 'cold', 'raised'), (3.0, 'cold', 'cleared')]
+
+
+def test_debounce_ignores_short_excursions():
+    engine = alarms.alarm_engine([alarms.rule(
+        'hot', 'threshold', 'frame:mean', 40.0, hysteresis=1.0,
+        debounce=2.0)])
+    values = [30, 45, 45, 30, 45, 45, 45, 45, 30, 45, 30, 30, 30]
+    events = run(engine, values, fps=1.0)
+    # raised two seconds after the excursion starting at 4, cleared two
+    # seconds after the value dropped for good at 10
+    assert events == [(6.0, 'hot', 'raised'), (12.0, 'hot', 'cleared')]
+
+
+def test_delta_from_baseline():
+    engine = alarms.alarm_engine([alarms.rule(
+        'warming', 'delta', 'frame:mean', 3.0, hysteresis=1.0, window=2.0)])
+    # baseline is the mean of the samples in the first two seconds, 21
+    values = [20, 21, 22, 23.5, 24.5, 23.2, 21.5, 25]
+    events = run(engine, values, fps=1.0)
+    assert events == [(4.0, 'warming', 'raised'), (6.0, 'warming', 'cleared'),
+                      (7.0, 'warming', 'raised')]
+    engine.reset()
+    assert engine.active == []
+    # a new baseline is taken after reset()
+    assert run(engine, [30, 30, 30, 32]) == []
+
+
+def test_rate_of_rise():
+    fps = 10.0
+    engine = alarms.alarm_engine([alarms.rule(
+        'rising', 'rate', 'frame:max', 1.0, hysteresis=0.5, window=2.0)],
+        fps=fps)
+    # flat, rising at 2 C/s for 4 s, then flat again
+    values = [20.0] * 30 + [20.0 + 0.2 * i for i in range(1, 41)] + [28.0] * 40
+    events = run(engine, values, fps)
+    assert [(rule, state) for _, rule, state in events] == \
+        [('rising', 'raised'), ('rising', 'cleared')]
+    raised, cleared = events[0][0], events[1][0]
+    # the slope over the last 2 s passes 1 C/s about 1 s into the rise and
+    # drops below 0.5 C/s about 1.5 s after it ended
+    assert 3.5 < raised < 4.5
+    assert 7.5 < cleared < 8.5
+
+
+def test_rate_matches_least_squares():
+    fps = 8.7
+    window = 3.0
+    engine = alarms.alarm_engine([alarms.rule(
+        'rate', 'rate', 'frame:mean', 1e9, window=window)], history=64,
+        fps=fps)
+    rng = np.random.default_rng(3)
+    values = 25.0 + np.cumsum(rng.normal(0.0, 0.3, 300))
+    times = np.arange(300) / fps
+    for i in range(300):
+        engine.update(frame(values[i]), times[i])
+        # the engine rebases its prefix sums every 64 frames
+        if i >= 40 and i % 13 == 0:
+            inside = times >= times[i] - window
+            inside[i + 1:] = False
+            sample = (np.round((values[inside] + radiometry.KELVIN_OFFSET) *
+                               100.0) * 0.01 - radiometry.KELVIN_OFFSET)
+            expected = np.polyfit(times[inside], sample, 1)[0]
+            metric = engine._alarm_engine__metric[0]
+            assert metric == pytest.approx(expected, rel=1e-6, abs=1e-6)
+
+
+def test_roi_targets_and_listener():
+    shape = (12, 16)
+    rois = roi.roi_set([roi.rect('left', 0, 0, 8, 12),
+                        roi.rect('right', 8, 0, 8, 12)], shape)
+    engine = alarms.alarm_engine([
+        alarms.rule('left', 'threshold', 'roi:left:max', 40.0),
+        alarms.rule('right', 'threshold', 'roi:right:max', 40.0)], rois)
+    received = []
+    engine.add_listener(received.append)
+    image = frame(30.0, shape)
+    image[5, 12] = frame(50.0, (1, 1))[0, 0]
+    events = engine.update(image, 0.0, rois.compute(image), number=7)
+    assert [event['rule'] for event in events] == ['right']
+    assert events[0]['frame'] == 7
+    assert events[0]['value'] == pytest.approx(50.0, abs=0.01)
+    assert received == events
+    assert engine.pop_events() == events
+    assert engine.pop_events() == []
+
+
+def test_unknown_region_is_rejected():
+    rois = roi.roi_set([roi.rect('a', 0, 0, 2, 2)], (12, 16))
+    with pytest.raises(ValueError):
+        alarms.alarm_engine([alarms.rule('x', 'threshold', 'roi:b:max', 1.0)],
+                            rois)
+
+
+def test_history_follows_rate_window():
+    rule = alarms.rule('slow', 'rate', 'frame:mean', 0.01, window=120.0)
+    # sized for the window by default
+    alarms.alarm_engine([rule], fps=8.7)
+    with pytest.raises(ValueError):
+        alarms.alarm_engine([rule], history=512, fps=8.7)
@@ -0,0 +1,61 @@
+import os
+import time
+import numpy as np
+import heat_data
+from capture_daemon import capture_daemon
+from simulated_uvc import simulated_backend, synthetic_frames
+
+SHAPE = (12, 16)
+
+
+def test_synthetic_frames_are_repeatable():
+    a, b = synthetic_frames(SHAPE, seed=3), synthetic_frames(SHAPE, seed=3)
+    for _ in range(3):
+        frame = a.next()
+        np.testing.assert_array_equal(frame, b.next())
+    # around 295 K with the hot spot above it
+    assert 29000 < np.median(frame) < 30000
+    assert frame.max() > 31000
+
+
+def wait_for_frames(daemon, serial, count):
+    deadline = time.monotonic() + 10
+    while daemon.sessions[serial].frames < count:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def recorded_frames(out_dir):
+    counts = {}
+    for name in sorted(os.listdir(out_dir)):
+        data = heat_data.heat_data(os.path.join(out_dir, name))
+        counts[name] = data.last_frame
+        data.close()
+    return counts
+
+
+def test_boards_are_reopened_into_new_files(tmp_path):
+    out_dir = str(tmp_path)
+    backend = simulated_backend(('SIM1', 'SIM2'), SHAPE, fps=200)
+    daemon = capture_daemon(backend, out_dir)
+    try:
+        daemon.rescan()
+        assert sorted(daemon.sessions) == ['SIM1', 'SIM2']
+        wait_for_frames(daemon, 'SIM2', 10)
+        backend.unplug('SIM2')
+        daemon.rescan()
+        assert sorted(daemon.sessions) == ['SIM1']
+        backend.plug('SIM2')
+        daemon.rescan()
+        wait_for_frames(daemon, 'SIM2', 10)
+        stats = daemon.stats()
+    finally:
+        daemon.close()
+    assert stats['SIM2']['reconnects'] == 1
+    assert stats['SIM1']['reconnects'] == 0
+    counts = recorded_frames(out_dir)
+    assert len(counts) == 3
+    assert sum(frames for name, frames in counts.items()
+               if name.startswith('SIM2')) == daemon.stats()['SIM2'][
+        'total_frames']
+    assert all(not entry['connected'] for entry in daemon.stats().values())
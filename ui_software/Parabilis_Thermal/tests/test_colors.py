@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+import colors
+import tone_map
+
+
+def test_colorize_matches_the_lut(frames):
+    frame = frames[0]
+    bgr = colors.colorize(frame, 'ironblack')
+    gray = colors.raw_to_8bit(frame)
+    assert gray.min() == 0 and gray.max() == 255
+    lut = colors.get_color_map('ironblack').reshape(256, 3)
+    np.testing.assert_array_equal(bgr, lut[gray])
+
+
+def test_scratch_is_reused(frames, monkeypatch):
+    scratches = []
+    stretch = tone_map.stretch
+    monkeypatch.setattr(colors.tone_map, 'stretch',
+                        lambda frame, low, high, out, scratch:
+                        scratches.append(scratch) or
+                        stretch(frame, low, high, out, scratch))
+    out = np.empty(frames.shape[1:] + (3,), np.uint8)
+    scratch = np.empty(frames.shape[1:], np.float64)
+    for frame in frames[:3]:
+        colors.colorize_into(out, frame, 'rainbow', scratch=scratch)
+        np.testing.assert_array_equal(out, colors.colorize(frame, 'rainbow'))
+    assert all(s is scratch for s in scratches[::2])
+
+
+def test_reverse_and_bands():
+    lut = colors.get_color_map('rainbow').reshape(256, 3)
+    np.testing.assert_array_equal(
+        colors.get_color_map('rainbow_r').reshape(256, 3), lut[::-1])
+    banded = colors.get_color_map('rainbow', bands=4).reshape(256, 3)
+    assert len(np.unique(banded, axis=0)) == 4
+    with pytest.raises(ValueError):
+        banded[0, 0] = 1
+
+
+def test_unknown_names_are_looked_up_once(monkeypatch):
+    lookups = []
+    monkeypatch.setattr(colors, '_sources', dict(colors._sources))
+    monkeypatch.setattr(colors, '_luts', {})
+    monkeypatch.setattr(colors, '_matplotlib_table',
+                        lambda name: lookups.append(name))
+    name = 'no such map'
+    for _ in range(3):
+        lut = colors.get_color_map(name)
+    assert lookups == [name]
+    np.testing.assert_array_equal(lut, colors.get_color_map('grayscale'))
+    # registering the name replaces the grayscale stand-in
+    colors.register_color_map(name, np.repeat(np.linspace(1.0, 0.0, 256), 3))
+    assert colors.get_color_map(name)[0, 0, 0] == 255
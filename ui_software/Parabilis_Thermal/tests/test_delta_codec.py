@@ -0,0 +1,122 @@
+import numpy as np
+import pytest
+import delta_codec
+from delta_codec import (decode, encode, delta_encoder, delta_frames,
+                         delta_reader, delta_writer)
+
+
+def round_trip(frames, keyframe_interval=delta_codec.KEYFRAME_INTERVAL):
+    encoder = delta_encoder(keyframe_interval)
+    payloads = [encoder.encode(frame) for frame in frames]
+    view = delta_frames(lambda i: payloads[i], len(frames),
+                        frames.shape[1:], keyframe_interval)
+    return payloads, view
+
+
+@pytest.mark.parametrize('value', [0, 1, 32767, 65534, 65535])
+def test_constant_frames(value):
+    frames = np.full((20, 12, 16), value, np.uint16)
+    _, view = round_trip(frames)
+    np.testing.assert_array_equal(view[:], frames)
+
+
+def test_extreme_jumps():
+    # the largest residuals there are: 0 <-> 65535 between neighbours and
+    # between consecutive frames
+    frames = np.zeros((6, 8, 8), np.uint16)
+    frames[:, ::2, 1::2] = 65535
+    frames[:, 1::2, ::2] = 65535
+    frames[1::2] ^= 65535
+    _, view = round_trip(frames)
+    np.testing.assert_array_equal(view[:], frames)
+
+
+def test_random_frames():
+    frames = np.random.default_rng(0).integers(
+        0, 65536, (40, 24, 32)).astype(np.uint16)
+    _, view = round_trip(frames, keyframe_interval=7)
+    np.testing.assert_array_equal(view[:], frames)
+
+
+@pytest.mark.parametrize('shape', [(1, 1), (1, 33), (7, 5), (31, 17),
+                                   (120, 160), (61, 80)])
+def test_odd_shapes(shape):
+    rng = np.random.default_rng(sum(shape))
+    frames = (30000 + np.cumsum(rng.integers(-40, 41, (10,) + shape),
+                                axis=0)).astype(np.uint16)
+    for i, frame in enumerate(frames):
+        previous = None if i == 0 else frames[i - 1].astype(np.int32)
+        payload = encode(frame, previous)
+        np.testing.assert_array_equal(decode(payload, shape, previous), frame)
+
+
+def test_interframe_needs_previous():
+    frames = np.full((2, 4, 4), 30000, np.uint16)
+    payload = encode(frames[1], frames[0].astype(np.int32))
+    with pytest.raises(ValueError):
+        decode(payload, (4, 4))
+
+
+def test_seeks_decode_from_the_keyframe(frames):
+    _, view = round_trip(frames, keyframe_interval=8)
+    for index in (59, 3, 16, 15, 0, 40, 41, -1):
+        np.testing.assert_array_equal(view[index], frames[index])
+    np.testing.assert_array_equal(view[5:50:7], frames[5:50:7])
+    with pytest.raises(IndexError):
+        view[len(frames)]
+
+
+def test_smaller_than_raw(frames):
+    payloads, _ = round_trip(frames)
+    assert sum(len(p) for p in payloads) < frames.nbytes / 2
+
+
+def test_container(tmp_path, frames):
+    path = str(tmp_path / ('recording' + delta_codec.EXTENSION))
+    writer = delta_writer(path, frames.shape[1:], {'serial': 'SIM00001'})
+    writer.append(frames[:25], np.arange(25), np.arange(25) / 8.7)
+    # a reader sees the frames written so far before the file is closed
+    partial = delta_reader(path)
+    assert not partial.complete
+    np.testing.assert_array_equal(partial.frames[:], frames[:25])
+    partial.close()
+    writer.append(frames[25:], np.arange(25, 60), np.arange(25, 60) / 8.7)
+    writer.close()
+
+    assert delta_codec.is_delta(path)
+    reader = delta_reader(path)
+    try:
+        assert reader.complete
+        assert reader.attrs['serial'] == 'SIM00001'
+        np.testing.assert_array_equal(reader.frames[:], frames)
+        np.testing.assert_array_equal(reader.per_frame('sequence'),
+                                      np.arange(60))
+    finally:
+        reader.close()
+
+
+@pytest.mark.parametrize('destination', ['packed.ptdelta', 'packed.HDF5'])
+def test_convert_keeps_events_and_regions(tmp_path, frames, destination):
+    import heat_data
+    import roi
+    from recorder import hdf5_recorder
+    source = str(tmp_path / 'source.HDF5')
+    writer = hdf5_recorder(source, frames.shape[1:])
+    writer.start()
+    for i, frame in enumerate(frames[:20]):
+        writer.submit(frame, i, i * 0.1)
+    writer.log_event({'time': 1.0, 'kind': 'trigger'})
+    writer.stop()
+    regions = [roi.rect('box', 10, 20, 30, 15)]
+    roi.save(source, regions)
+
+    destination = str(tmp_path / destination)
+    assert delta_codec.convert(source, destination) == 20
+    data = heat_data.heat_data(destination)
+    try:
+        np.testing.assert_array_equal(data.frames(1, 21), frames[:20])
+        assert data.events == [{'time': 1.0, 'kind': 'trigger'}]
+    finally:
+        data.close()
+    assert [item.to_dict() for item in roi.load(destination)] == \
+        [item.to_dict() for item in regions]
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from frame_probe import frame_probe
+from frame_ring import frame_ring
+
+
+@pytest.fixture
+def ring(frames):
+    return frame_ring(4, *frames.shape[1:])
+
+
+def test_queries_read_the_newest_frame(ring, frames):
+    probe = frame_probe(ring)
+    with pytest.raises(LookupError):
+        probe.point(0, 0)
+    ring.push(frames[0])
+    ring.push(frames[1])
+    assert probe.point(20, 10) == frames[1][10, 20]
+    assert probe.point(20, 10, 'C') == pytest.approx(
+        frames[1][10, 20] / 100.0 - 273.15, abs=1e-3)
+    np.testing.assert_array_equal(probe.profile((0, 5), (9, 5)),
+                                  frames[1][5, :10])
+    np.testing.assert_array_equal(probe.profile((3, 0), (3, 3)),
+                                  frames[1][:4, 3])
+    # queries do not consume frames
+    assert ring.pending == 2
+
+
+def test_region(ring, frames):
+    ring.push(frames[0])
+    probe = frame_probe(ring)
+    stats = probe.region(150, 100, 20, 40)
+    roi = frames[0][100:, 150:]
+    assert stats['min'] == roi.min() and stats['max'] == roi.max()
+    assert stats['mean'] == pytest.approx(roi.mean())
+    col, row = stats['max_loc']
+    assert frames[0][row, col] == roi.max() and col >= 150 and row >= 100
+    in_f = probe.region(150, 100, 20, 40, 'F')
+    assert in_f['std'] == pytest.approx(roi.std() * 0.018)
+    with pytest.raises(ValueError):
+        probe.region(200, 0, 10, 10)
+
+
+def test_to_sensor(ring):
+    probe = frame_probe(ring, display_size=(640, 480))
+    assert probe.to_sensor(0, 0) == (0, 0)
+    assert probe.to_sensor(320, 240) == (80, 60)
+    assert probe.to_sensor(700, -5) == (159, 0)
@@ -0,0 +1,163 @@
+import numpy as np
+import pytest
+import playback
+from playback import frame_prefetcher, playback_clock
+
+
+class fake_time(object):
+
+    def __init__(self, monkeypatch):
+        self.now = 1000.0
+        monkeypatch.setattr(playback.time, 'monotonic', lambda: self.now)
+
+
+def test_frame_times_from_timestamps():
+    timestamps = 50.0 + np.array([0.0, 0.1, 0.25, 0.2, 0.5])
+    clock = playback_clock(timestamps, 5)
+    # a clock stepping back while recording does not run time backwards
+    assert [clock.time_of(i) for i in range(1, 6)] == \
+        pytest.approx([0.0, 0.1, 0.25, 0.25, 0.5])
+    assert clock.duration == pytest.approx(0.5)
+    assert clock.fps == pytest.approx(8.0)
+    assert [clock.frame_at(t) for t in (-1.0, 0.0, 0.09, 0.11, 0.3, 9.0)] == \
+        [1, 1, 1, 2, 4, 5]
+
+
+@pytest.mark.parametrize('timestamps', [None, np.array([0.0, np.nan, 1.0])])
+def test_frame_times_without_timestamps(timestamps):
+    clock = playback_clock(timestamps, 3, fps=10.0)
+    assert clock.duration == pytest.approx(0.2)
+    assert clock.fps == pytest.approx(10.0)
+
+
+def test_plays_in_real_time(monkeypatch):
+    time = fake_time(monkeypatch)
+    clock = playback_clock(None, 100, fps=10.0)
+    clock.play()
+    assert clock.tick() == (1, 0)
+    assert clock.next_due() == pytest.approx(0.1)
+    for frame in range(2, 20):
+        time.now += 0.1
+        assert clock.tick() == (frame, 0)
+    assert clock.position == pytest.approx(1.8)
+    assert clock.dropped == 0
+
+
+def test_late_ticks_skip_frames(monkeypatch):
+    time = fake_time(monkeypatch)
+    clock = playback_clock(None, 100, fps=10.0)
+    clock.play()
+    clock.tick()
+    # a slow render: the next tick comes 0.35 s late
+    time.now += 0.45
+    assert clock.tick() == (5, 3)
+    # and playback is still on schedule afterwards
+    assert clock.next_due() == pytest.approx(0.05)
+    time.now += 0.05
+    assert clock.tick() == (6, 0)
+    assert clock.dropped == 3
+
+
+def test_ticks_do_not_lose_time(monkeypatch):
+    time = fake_time(monkeypatch)
+    clock = playback_clock(None, 1000, fps=10.0)
+    clock.play()
+    # timer latency on every tick does not add up
+    for _ in range(200):
+        time.now += clock.next_due() + 0.013
+        clock.tick()
+    assert clock.position == pytest.approx(time.now - 1000.0)
+    assert clock.tick()[0] == clock.frame_at(time.now - 1000.0)
+
+
+@pytest.mark.parametrize('speed', [0.25, 2.0, 4.0, 16.0])
+def test_speed(monkeypatch, speed):
+    time = fake_time(monkeypatch)
+    clock = playback_clock(None, 1000, fps=10.0)
+    clock.seek_frame(11)
+    clock.speed = speed
+    clock.play()
+    time.now += 2.0
+    assert clock.position == pytest.approx(1.0 + 2.0 * speed)
+    assert clock.tick()[0] == 11 + int(round(20 * speed))
+
+
+def test_speed_change_keeps_position(monkeypatch):
+    time = fake_time(monkeypatch)
+    clock = playback_clock(None, 1000, fps=10.0)
+    clock.play()
+    time.now += 1.0
+    clock.speed = 4.0
+    time.now += 1.0
+    assert clock.position == pytest.approx(5.0)
+    with pytest.raises(ValueError):
+        clock.speed = 100.0
+
+
+def test_pauses_at_stop_frame(monkeypatch):
+    time = fake_time(monkeypatch)
+    clock = playback_clock(None, 100, fps=10.0)
+    clock.seek_frame(5)
+    clock.play(stop_frame=10)
+    time.now += 10.0
+    assert clock.tick() == (10, 4)
+    assert not clock.playing
+    assert clock.position == pytest.approx(clock.time_of(10))
+    time.now += 10.0
+    assert clock.position == pytest.approx(clock.time_of(10))
+    assert clock.next_due() == 0.0
+
+
+def test_pause_and_seek(monkeypatch):
+    time = fake_time(monkeypatch)
+    clock = playback_clock(None, 100, fps=10.0)
+    clock.play()
+    time.now += 0.5
+    clock.pause()
+    time.now += 5.0
+    assert clock.position == pytest.approx(0.5)
+    clock.seek(-3.0)
+    assert clock.position == 0.0
+    clock.seek(1e6)
+    assert clock.position == pytest.approx(clock.duration)
+
+
+class fake_recording(object):
+    """heat_data's frames() over an array, counting the reads."""
+
+    def __init__(self, frames):
+        self.__frames = frames
+        self.last_frame = len(frames)
+        self.reads = 0
+
+    def frames(self, first, stop, step=1):
+        self.reads += 1
+        return self.__frames[first - 1:stop - 1:step]
+
+
+def test_prefetcher_returns_frames_in_order(frames):
+    data = fake_recording(frames)
+    prefetcher = frame_prefetcher(data, 'grayscale', ahead=8, batch=4)
+    try:
+        for number in (1, 2, 3, 10, 12, 14, 60, 1):
+            step = 2 if number in (12, 14) else 1
+            raw, rgb = prefetcher.get(number, step)
+            np.testing.assert_array_equal(raw, frames[number - 1])
+            np.testing.assert_array_equal(
+                rgb, playback.render_rgb(frames[number - 1], 'grayscale'))
+        assert prefetcher.hits + prefetcher.misses == 8
+    finally:
+        prefetcher.close()
+
+
+def test_prefetcher_drops_images_of_old_colormap(frames):
+    data = fake_recording(frames)
+    prefetcher = frame_prefetcher(data, 'grayscale')
+    try:
+        prefetcher.get(1)
+        prefetcher.colormap = 'ironblack'
+        _, rgb = prefetcher.get(2)
+        np.testing.assert_array_equal(
+            rgb, playback.render_rgb(frames[1], 'ironblack'))
+    finally:
+        prefetcher.close()
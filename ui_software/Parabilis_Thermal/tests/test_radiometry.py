@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+import radiometry
+
+
+def test_units():
+    raw = np.array([27315, 29815, 37315], np.uint16)
+    np.testing.assert_allclose(radiometry.convert(raw, 'K'),
+                               [273.15, 298.15, 373.15], rtol=1e-6)
+    np.testing.assert_allclose(radiometry.convert(raw, 'C'), [0, 25, 100],
+                               atol=1e-4)
+    np.testing.assert_allclose(radiometry.convert(raw, 'F'), [32, 77, 212],
+                               atol=1e-3)
+    for unit in radiometry.UNITS:
+        np.testing.assert_allclose(
+            radiometry.kelvin_from(radiometry.convert(raw, unit), unit) * 100,
+            raw, atol=0.1)
+    with pytest.raises(ValueError):
+        radiometry.convert(raw, 'R')
+
+
+def test_temperatures_match_convert(frames):
+    for unit in radiometry.UNITS:
+        out = np.empty(frames.shape[1:], np.float32)
+        result = radiometry.temperatures(frames[0], unit, out=out)
+        assert result is out
+        np.testing.assert_allclose(
+            out, radiometry.convert(frames[0], unit), rtol=1e-6)
+
+
+def test_calibration():
+    identity = radiometry.calibration()
+    assert identity.is_identity()
+    kelvin = np.array([280.0, 300.0, 350.0], np.float32)
+    assert identity.apply(kelvin) is kelvin
+    cal = radiometry.calibration(emissivity=0.9, reflected_k=290.0,
+                                 offset_k=0.5)
+    # a grey body hotter than its surroundings is hotter than it looks
+    corrected = cal.apply(kelvin)
+    assert np.all(corrected[1:] > kelvin[1:] + 0.5)
+    # and the forward model gives back what the camera saw
+    seen = (0.9 * (corrected - 0.5).astype(np.float64) ** 4
+            + 0.1 * 290.0 ** 4) ** 0.25
+    np.testing.assert_allclose(seen, kelvin, rtol=1e-5)
+    np.testing.assert_allclose(
+        radiometry.temperatures(np.uint16(30000), 'K', cal),
+        cal.apply(np.float32(300.0)), rtol=1e-6)
+    with pytest.raises(ValueError):
+        radiometry.calibration(emissivity=0.0)
+
+
+def test_format_temp():
+    assert radiometry.format_temp(29500, 'C') == '21.85 C'
+    assert radiometry.format_temp(29500, 'K') == '295.0 K'
+    assert radiometry.format_temp(29500, 'F', digits=0) == '71.0 F'
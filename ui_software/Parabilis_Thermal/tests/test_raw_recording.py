@@ -0,0 +1,31 @@
+import numpy as np
+import raw_recording
+
+
+def test_count_follows_flushes(tmp_path, frames):
+    path = str(tmp_path / ('frames' + raw_recording.EXTENSION))
+    writer = raw_recording.raw_writer(path, frames.shape[1:], {'fps': 8.7},
+                                      grow_frames=16, flush_seconds=3600)
+    writer.append(frames[:20], np.arange(20), np.arange(20) / 8.7)
+    # written but not flushed yet, so not counted
+    assert len(raw_recording.raw_reader(path).frames) == 0
+    writer.flush()
+    reader = raw_recording.raw_reader(path)
+    assert not reader.complete
+    np.testing.assert_array_equal(reader.frames, frames[:20])
+    writer.append(frames[20:], np.arange(20, 60), np.arange(20, 60) / 8.7)
+    writer.close()
+    reader = raw_recording.raw_reader(path)
+    assert reader.complete and reader.attrs == {'fps': 8.7}
+    np.testing.assert_array_equal(reader.frames, frames)
+    np.testing.assert_array_equal(reader.per_frame('sequence'),
+                                  np.arange(60))
+
+
+def test_periodic_flush(tmp_path, frames):
+    path = str(tmp_path / ('frames' + raw_recording.EXTENSION))
+    writer = raw_recording.raw_writer(path, frames.shape[1:], flush_seconds=0)
+    for i in range(3):
+        writer.append(frames[i:i + 1], [i], [i / 8.7])
+        assert len(raw_recording.raw_reader(path).frames) == i + 1
+    writer.close()
@@ -0,0 +1,141 @@
+import time
+import numpy as np
+import pytest
+import heat_data
+import recorder
+from recorder import hdf5_recorder, triggered_recorder
+
+
+def record(path, frames, **options):
+    writer = hdf5_recorder(path, frames.shape[1:], batch_size=8, **options)
+    writer.start()
+    for i, frame in enumerate(frames):
+        assert writer.submit(frame, 1000 + i, 100.0 + i / 8.7, i % 2)
+    writer.stop()
+    return writer
+
+
+@pytest.mark.parametrize('layout, compression', [
+    ('stacked', None),
+    ('stacked', 'gzip'),
+    ('stacked', 'lzf'),
+    ('stacked', 'delta'),
+    ('image', None),
+    ('image', 'gzip'),
+    ('raw', None),
+    ('delta', None),
+])
+def test_round_trip(tmp_path, frames, layout, compression):
+    path = str(tmp_path / ('recording' + recorder.file_extension(layout)))
+    writer = record(path, frames, layout=layout, compression=compression,
+                    attrs={'serial': 'SIM00001', 'fps': 8.7})
+    assert writer.stats()['written'] == len(frames)
+    assert writer.stats()['dropped'] == 0
+
+    data = heat_data.heat_data(path)
+    try:
+        assert data.layout == layout
+        assert data.last_frame == len(frames)
+        assert tuple(data.shape) == frames.shape[1:]
+        np.testing.assert_array_equal(data.frames(1, len(frames) + 1), frames)
+        # random access and the frame cache
+        for number in (len(frames), 1, 17):
+            np.testing.assert_array_equal(data.frame(number, 0, 0),
+                                          frames[number - 1])
+        if layout != 'image':
+            np.testing.assert_allclose(
+                data.timestamps, 100.0 + np.arange(len(frames)) / 8.7)
+            np.testing.assert_array_equal(data.per_frame('sequence'),
+                                          1000 + np.arange(len(frames)))
+            np.testing.assert_array_equal(data.per_frame('flags'),
+                                          np.arange(len(frames)) % 2)
+            assert data.metadata['serial'] == 'SIM00001'
+        with pytest.raises(IndexError):
+            data.frame(len(frames) + 1, 0, 0)
+    finally:
+        data.close()
+
+
+def test_events_are_stored(tmp_path, frames):
+    path = str(tmp_path / 'events.HDF5')
+    writer = hdf5_recorder(path, frames.shape[1:])
+    writer.start()
+    writer.submit(frames[0], 0, 1.0)
+    writer.log_event({'time': 1.0, 'kind': 'trigger'})
+    writer.stop()
+    data = heat_data.heat_data(path)
+    try:
+        assert data.events == [{'time': 1.0, 'kind': 'trigger'}]
+    finally:
+        data.close()
+
+
+def test_write_error_is_raised_by_submit(tmp_path, frames):
+    def fail(sequence, timestamps):
+        raise IOError('disk gone')
+
+    writer = hdf5_recorder(str(tmp_path / 'failing.HDF5'), frames.shape[1:],
+                           flush_interval=0.0, on_write=fail)
+    writer.start()
+    writer.submit(frames[0], 0, 0.0)
+    deadline = time.monotonic() + 5.0
+    while writer.error is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert 'disk gone' in writer.stats()['error']
+    with pytest.raises(IOError):
+        writer.submit(frames[1], 1, 0.1)
+    with pytest.raises(IOError):
+        writer.stop()
+
+
+def test_triggered_windows(tmp_path, frames):
+    paths = iter(str(tmp_path / 'trigger_{0}.HDF5'.format(i))
+                 for i in range(10))
+    trigger = triggered_recorder(lambda: next(paths), frames.shape[1:],
+                                 pre_seconds=2.0, post_seconds=3.0, fps=10.0)
+    trigger.start()
+    # frame i at t = i / 10 s, triggered at t = 2.0 s and again at 2.5 s
+    for i, frame in enumerate(frames):
+        t = i / 10.0
+        if i == 20:
+            trigger.trigger({'time': 2.0, 'kind': 'trigger'})
+        if i == 25:
+            trigger.trigger({'time': 2.5, 'kind': 'trigger'})
+        trigger.submit(frame, i, t)
+    trigger.stop()
+
+    assert len(trigger.saved) == 1
+    data = heat_data.heat_data(trigger.saved[0])
+    try:
+        numbers = data.per_frame('sequence')
+        # pre-trigger frames from t = 0.0, the buffer holds 2 s + 1 frame,
+        # until the first frame at or after 2.5 + 3.0 s
+        assert numbers[0] == 0
+        assert numbers[-1] == 55
+        np.testing.assert_array_equal(numbers, np.arange(56))
+        np.testing.assert_array_equal(data.frames(1, 57), frames[:56])
+        assert [event['time'] for event in data.events] == [2.0, 2.5]
+    finally:
+        data.close()
+    stats = trigger.stats()
+    assert stats['triggers'] == 2
+    assert stats['written'] == 56
+
+
+def test_triggered_pre_window_is_bounded(tmp_path, frames):
+    paths = iter(str(tmp_path / 'late_{0}.HDF5'.format(i)) for i in range(10))
+    trigger = triggered_recorder(lambda: next(paths), frames.shape[1:],
+                                 pre_seconds=1.0, post_seconds=0.5, fps=10.0)
+    trigger.start()
+    for i, frame in enumerate(frames[:50]):
+        if i == 40:
+            trigger.trigger({'time': 4.0, 'kind': 'trigger'})
+        trigger.submit(frame, i, i / 10.0)
+    trigger.stop()
+    data = heat_data.heat_data(trigger.saved[0])
+    try:
+        # 1 s before the trigger to the first frame 0.5 s after it
+        np.testing.assert_array_equal(data.per_frame('sequence'),
+                                      np.arange(30, 46))
+    finally:
+        data.close()
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+import heat_data
+import recording_index
+import recording_schema
+from recorder import hdf5_recorder
+
+
+def test_compute_matches_numpy(recording, frames):
+    stats, attrs = recording_index.compute(recording, batch=7)
+    flat = frames.reshape(len(frames), -1)
+    np.testing.assert_array_equal(stats['min'], flat.min(axis=1))
+    np.testing.assert_array_equal(stats['max'], flat.max(axis=1))
+    np.testing.assert_allclose(stats['mean'], flat.mean(axis=1), rtol=1e-6)
+    np.testing.assert_allclose(
+        stats['percentiles'],
+        np.percentile(flat, recording_index.PERCENTILES, axis=1).T,
+        rtol=1e-6)
+    for i, frame in enumerate(frames):
+        column, row = stats['max_loc'][i]
+        assert frame[row, column] == frame.max()
+        column, row = stats['min_loc'][i]
+        assert frame[row, column] == frame.min()
+    assert stats['thumbnails'].shape == (60, 15, 20)
+    np.testing.assert_array_equal(
+        stats['thumbnails'][:, 2, 3],
+        frames[:, 16:24, 24:32].mean(axis=(1, 2)).astype(np.uint16))
+    np.testing.assert_allclose(stats['timestamps'],
+                               1000.0 + np.arange(60) / 8.7)
+    assert list(attrs['percentile_levels']) == list(
+        recording_index.PERCENTILES)
+
+
+def test_events(tmp_path, frames):
+    path = str(tmp_path / 'events.HDF5')
+    writer = hdf5_recorder(path, frames.shape[1:], batch_size=8)
+    writer.start()
+    sequence = 0
+    for i, frame in enumerate(frames):
+        if i == 20:
+            # ten frames lost on the way from the camera
+            sequence += 10
+        if 40 <= i < 43:
+            frame = frame.copy()
+            frame[0, 0] = frames.max() + recording_index.PEAK_DELTA + 100
+        flags = recording_schema.FLAG_FFC if 10 <= i < 13 else 0
+        writer.submit(frame, sequence, 1000.0 + i / 8.7, flags)
+        sequence += 1
+    writer.stop()
+    data = heat_data.heat_data(path)
+    try:
+        stats, attrs = recording_index.compute(data)
+    finally:
+        data.close()
+    index = recording_index.frame_index(stats, attrs)
+    assert index.events() == [(11, 'ffc'), (21, 'gap'), (41, 'peak')]
+    assert index.events('gap') == [(21, 'gap')]
+    assert sorted(index.hottest(3)) == [41, 42, 43]
+
+
+@pytest.mark.parametrize('inside', [False, True])
+def test_build_and_load(recording, inside):
+    path = recording.fullpath
+    recording.close()
+    built = recording_index.build(path, inside)
+    assert len(built) == 60
+    index = recording_index.load(path, 60)
+    np.testing.assert_array_equal(index['max'], built['max'])
+    np.testing.assert_array_equal(index.percentile(50), built.percentile(50))
+    np.testing.assert_allclose(index.times()[[0, 59]], [0.0, 59 / 8.7])
+    # an index of a different length is stale
+    assert recording_index.load(path, 61) is None
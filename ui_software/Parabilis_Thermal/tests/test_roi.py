@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+import roi
+
+
+def regions():
+    inside = np.zeros((120, 160), bool)
+    inside[::7, ::5] = True
+    return [
+        roi.rect('box', 10, 20, 30, 15),
+        roi.rect('corner', -5, -5, 10, 10),
+        roi.polygon('triangle', [(80, 10), (150, 10), (115, 70)]),
+        roi.ellipse('ellipse', (60, 90), (25, 12), 30.0),
+        roi.mask('grid', inside),
+        # overlaps the box
+        roi.rect('overlap', 25, 25, 40, 40),
+    ]
+
+
+def expected(frame, shape, items):
+    result = {name: [] for name in ('min', 'max', 'mean', 'std')}
+    for item in items:
+        values = frame[item.mask(shape)].astype(np.float64)
+        result['min'].append(values.min())
+        result['max'].append(values.max())
+        result['mean'].append(values.mean())
+        result['std'].append(values.std())
+    return {name: np.array(values) for name, values in result.items()}
+
+
+def test_single_frame_matches_numpy(frames):
+    items = regions()
+    rois = roi.roi_set(items, frames.shape[1:])
+    assert rois.names == [item.name for item in items]
+    for frame in frames[::10]:
+        stats = rois.compute(frame)
+        reference = expected(frame, frames.shape[1:], items)
+        for name in ('min', 'max'):
+            np.testing.assert_array_equal(stats[name], reference[name])
+        for name in ('mean', 'std'):
+            np.testing.assert_allclose(stats[name], reference[name],
+                                       rtol=1e-9, atol=1e-6)
+
+
+def test_batch_matches_single_frames(frames):
+    rois = roi.roi_set(regions(), frames.shape[1:], percentiles=(5, 50, 95))
+    batch = rois.compute(frames)
+    assert batch['mean'].shape == (len(frames), len(rois))
+    assert batch['percentiles'].shape == (len(frames), len(rois), 3)
+    for i in (0, 31, 59):
+        single = rois.compute(frames[i])
+        for name, values in single.items():
+            np.testing.assert_allclose(batch[name][i], values)
+
+
+def test_percentiles_match_numpy(frames):
+    items = regions()
+    levels = (0, 1, 25, 50, 99.5, 100)
+    rois = roi.roi_set(items, frames.shape[1:], percentiles=levels)
+    stats = rois.compute(frames[7])
+    for i, item in enumerate(items):
+        values = frames[7][item.mask(frames.shape[1:])]
+        np.testing.assert_allclose(stats['percentiles'][i],
+                                   np.percentile(values, levels))
+
+
+def test_pixel_counts_and_labels():
+    shape = (120, 160)
+    rois = roi.roi_set([roi.rect('a', 0, 0, 4, 3), roi.rect('b', 2, 1, 4, 4),
+                        roi.rect('clipped', -2, -2, 4, 4)], shape)
+    np.testing.assert_array_equal(rois.counts, [12, 16, 4])
+    labels = rois.labels()
+    assert labels[0, 0] == 3
+    assert labels[2, 3] == 2
+    assert labels[0, 3] == 1
+    assert labels[50, 50] == 0
+
+
+def test_empty_region_is_rejected():
+    with pytest.raises(ValueError):
+        roi.roi_set([roi.rect('outside', 200, 200, 5, 5)], (120, 160))
+
+
+def test_definitions_round_trip(tmp_path):
+    items = regions()
+    path = str(tmp_path / 'rois.json')
+    roi.write_file(path, items)
+    loaded = roi.read_file(path)
+    assert [item.to_dict() for item in loaded] == \
+        [item.to_dict() for item in items]
+    for before, after in zip(items, loaded):
+        np.testing.assert_array_equal(before.mask((120, 160)),
+                                      after.mask((120, 160)))
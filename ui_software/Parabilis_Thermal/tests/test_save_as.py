@@ -0,0 +1,192 @@
+import json
+import os
+import cv2
+import numpy as np
+import pytest
+import tifffile
+import radiometry
+import save_as
+
+
+@pytest.fixture
+def pool_cpus(monkeypatch):
+    """Pretend there are four CPUs, so even short exports start a pool."""
+    monkeypatch.setattr(save_as.os, 'cpu_count', lambda: 4)
+    monkeypatch.setattr(save_as, 'MIN_POOL_FRAMES', 0)
+
+
+def read_csv(path):
+    return np.loadtxt(path, delimiter=',', ndmin=2)
+
+
+def test_pool_size(monkeypatch):
+    monkeypatch.setattr(save_as.os, 'cpu_count', lambda: 4)
+    many = save_as.frame_batches(1, 1001)
+    assert save_as.pool_size(None, many) == 4
+    assert save_as.pool_size(2, many) == 2
+    assert save_as.pool_size(16, many) == 4
+    # a pool does not pay off for a few frames
+    assert save_as.pool_size(None, save_as.frame_batches(1, 21)) == 1
+    assert save_as.pool_size(None, save_as.frame_batches(1, 81)) == 4
+    monkeypatch.setattr(save_as.os, 'cpu_count', lambda: 1)
+    assert save_as.pool_size(8, many) == 1
+
+
+@pytest.mark.parametrize('pool', [False, True])
+def test_csvs(tmp_path, recording, frames, request, pool):
+    if pool:
+        request.getfixturevalue('pool_cpus')
+    stem = str(tmp_path / 'out')
+    progress = []
+    summary = save_as.to_csvs(stem, recording, 1, 61,
+                              progress=lambda done, total:
+                              progress.append((done, total)))
+    assert summary['frames'] == 60 and summary['errors'] == []
+    assert progress[-1] == (60, 60)
+    for number in (1, 33, 60):
+        np.testing.assert_array_equal(
+            read_csv(stem + '_f' + str(number) + '.csv'), frames[number - 1])
+
+
+def test_csvs_in_a_unit_and_size(tmp_path, recording, frames):
+    stem = str(tmp_path / 'out')
+    save_as.to_csvs(stem, recording, 5, 7, width=80, height=60, unit='F')
+    written = sorted(name for name in os.listdir(str(tmp_path))
+                     if name.endswith('.csv'))
+    assert written == ['out_f5.csv', 'out_f6.csv']
+    values = read_csv(stem + '_f5.csv')
+    assert values.shape == (60, 80)
+    expected = radiometry.temperatures(recording.frame(5, 80, 60), 'F')
+    np.testing.assert_allclose(values, expected, atol=0.006)
+
+
+def test_csv_errors_are_reported(tmp_path, recording):
+    summary = save_as.to_csvs(str(tmp_path / 'missing' / 'out'), recording,
+                              1, 4)
+    assert summary['frames'] == 0
+    assert [number for number, _ in summary['errors']] == [1, 2, 3]
+
+
+@pytest.mark.parametrize('layout', ['long', 'wide'])
+def test_csv_table(tmp_path, recording, frames, layout):
+    path = str(tmp_path / 'table.csv')
+    summary = save_as.to_csv_table(path, recording, 3, 6, layout)
+    assert summary['frames'] == 3
+    table = np.loadtxt(path, delimiter=',', skiprows=1)
+    if layout == 'long':
+        height, width = frames.shape[1:]
+        assert table.shape == (3 * height * width, 4)
+        numbers, rows, cols, values = table.T.astype(np.int64)
+        np.testing.assert_array_equal(values, frames[numbers - 1, rows, cols])
+        assert sorted(set(numbers)) == [3, 4, 5]
+    else:
+        np.testing.assert_array_equal(table[:, 0], [3, 4, 5])
+        np.testing.assert_array_equal(table[:, 1:],
+                                      frames[2:5].reshape(3, -1))
+
+
+@pytest.mark.parametrize('raw', [False, True])
+def test_tiffs(tmp_path, recording, frames, raw):
+    path = str(tmp_path / 'frames.tiff')
+    summary = save_as.to_tiffs(path, recording, 'ironblack', 11, 31, raw,
+                               width=80, height=60)
+    assert summary['frames'] == 20 and summary['errors'] == []
+    with tifffile.TiffFile(path) as tif:
+        assert len(tif.pages) == 20
+        for i, page in enumerate(tif.pages):
+            number = 11 + i
+            description = json.loads(page.description)
+            assert description['frame'] == number
+            assert description['min'] == frames[number - 1].min()
+            assert description['max'] == frames[number - 1].max()
+            assert description['timestamp'] == pytest.approx(
+                1000.0 + (number - 1) / 8.7)
+            image = page.asarray()
+            if raw:
+                assert image.dtype == np.uint16
+                np.testing.assert_array_equal(image, frames[number - 1])
+            else:
+                assert image.shape == (60, 80, 3)
+                assert image.dtype == np.uint8
+
+
+def read_video(path):
+    capture = cv2.VideoCapture(path)
+    images = []
+    while True:
+        ok, image = capture.read()
+        if not ok:
+            break
+        images.append(image)
+    capture.release()
+    return images
+
+
+@pytest.mark.parametrize('pool', [False, True])
+def test_avi(tmp_path, recording, request, pool):
+    if pool:
+        request.getfixturevalue('pool_cpus')
+    path = str(tmp_path / 'frames.avi')
+    summary = save_as.to_avi(path, recording, 'ironblack', 1, 61,
+                             codec='MJPG', width=80, height=64)
+    assert summary['frames'] == 60 and summary['errors'] == []
+    images = read_video(path)
+    assert len(images) == 60
+    assert images[0].shape == (64, 80, 3)
+    # batches come back in order, each frame is closest to its own colorization
+    first, last = save_as._video_batch(recording, 1, 61, 'ironblack', 80, 64,
+                                       False, 'C', None)[[0, 59]]
+
+    def error(image, colorized):
+        return np.abs(image.astype(int) - colorized).mean()
+    assert error(images[0], first) < error(images[0], last)
+    assert error(images[59], last) < error(images[59], first)
+
+
+def test_avi_overlay_uses_the_unit(recording, monkeypatch):
+    units = []
+    format_temp = radiometry.format_temp
+    monkeypatch.setattr(save_as.radiometry, 'format_temp',
+                        lambda raw, unit: units.append(unit) or
+                        format_temp(raw, unit))
+    save_as._video_batch(recording, 1, 3, 'ironblack', 80, 64, True, 'F',
+                         recording.timestamps[0:2])
+    assert units == ['F', 'F']
+
+
+def test_avi_without_an_encoder(tmp_path, recording):
+    summary = save_as.to_avi(str(tmp_path / 'missing' / 'frames.avi'),
+                             recording, 'ironblack', 1, 61, codec='MJPG')
+    assert summary['frames'] == 0 and len(summary['errors']) == 1
+
+
+@pytest.mark.parametrize('ext', ['png', 'jpg'])
+def test_images(tmp_path, recording, ext):
+    stem = str(tmp_path / 'out')
+    summary = save_as.to_images(stem, recording, 'rainbow', 1, 21, ext,
+                                width=80, height=60)
+    assert summary['frames'] == 20 and summary['errors'] == []
+    for number in range(1, 21):
+        image = cv2.imread(stem + 'f_' + str(number) + '.' + ext)
+        assert image.shape == (60, 80, 3)
+
+
+def test_raw_pngs(tmp_path, recording, frames, pool_cpus):
+    stem = str(tmp_path / 'out')
+    summary = save_as.to_pngs(stem, recording, 'rainbow', 1, 61, level=9,
+                              raw=True)
+    assert summary['frames'] == 60 and summary['errors'] == []
+    for number in (1, 30, 60):
+        image = cv2.imread(stem + 'f_' + str(number) + '.png',
+                           cv2.IMREAD_UNCHANGED)
+        assert image.dtype == np.uint16
+        np.testing.assert_array_equal(image, frames[number - 1])
+
+
+def test_image_formats_are_checked(tmp_path, recording):
+    stem = str(tmp_path / 'out')
+    with pytest.raises(ValueError):
+        save_as.to_images(stem, recording, 'rainbow', 1, 3, 'gif')
+    with pytest.raises(ValueError):
+        save_as.to_images(stem, recording, 'rainbow', 1, 3, 'jpg', raw=True)
+    assert os.listdir(str(tmp_path)) == ['recording.HDF5']
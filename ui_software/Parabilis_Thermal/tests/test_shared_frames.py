@@ -0,0 +1,143 @@
+import os
+import subprocess
+import sys
+import numpy as np
+import pytest
+from frame_ring import frame_ring
+from shared_frames import frame_cursor, shared_frame_ring
+
+CAPACITY = 8
+HEIGHT, WIDTH = 6, 4
+PACKAGE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(params=['local', 'shared'])
+def ring(request):
+    if request.param == 'local':
+        yield frame_ring(CAPACITY, HEIGHT, WIDTH)
+        return
+    ring = shared_frame_ring(CAPACITY, HEIGHT, WIDTH)
+    yield ring
+    ring.close()
+    ring.unlink()
+
+
+def push(ring, first, stop):
+    for i in range(first, stop):
+        ring.push(np.full((HEIGHT, WIDTH), i, np.uint16), timestamp=i * 0.1,
+                  number=1000 + i)
+
+
+def test_reads_in_order_across_wraparound(ring):
+    cursor = frame_cursor(ring)
+    for first in range(0, 5 * CAPACITY, 3):
+        push(ring, first, first + 3)
+        for i in range(first, first + 3):
+            frame, number, timestamp = cursor.next(0)
+            assert frame[0, 0] == i and number == 1000 + i
+            assert timestamp == pytest.approx(i * 0.1)
+    assert cursor.next(0) is None
+    assert cursor.dropped == 0
+    assert cursor.position == ring.write_count == 5 * CAPACITY + 2
+
+
+def test_overrun_skips_to_oldest_stored_frame(ring):
+    cursor = frame_cursor(ring)
+    push(ring, 0, CAPACITY + 5)
+    assert cursor.pending == CAPACITY + 5
+    frame, number, _ = cursor.next(0)
+    # the first five were overwritten
+    assert frame[0, 0] == 5 and number == 1005
+    assert cursor.dropped == 5
+    for i in range(6, CAPACITY + 5):
+        assert cursor.next(0)[0][0, 0] == i
+    assert cursor.next(0) is None
+    assert cursor.dropped == 5
+
+
+def test_cursors_are_independent(ring):
+    early = frame_cursor(ring)
+    push(ring, 0, 3)
+    late = frame_cursor(ring)
+    old = frame_cursor(ring, from_start=True)
+    push(ring, 3, 5)
+    assert [early.next(0)[1] for _ in range(5)] == list(range(1000, 1005))
+    assert [late.next(0)[1] for _ in range(2)] == [1003, 1004]
+    assert old.next(0)[1] == 1000
+    assert late.next(0) is None
+
+
+def test_latest_counts_skipped_frames(ring):
+    cursor = frame_cursor(ring)
+    assert cursor.latest() is None
+    push(ring, 0, 4)
+    frame, number, _ = cursor.latest()
+    assert frame[0, 0] == 3 and number == 1003
+    assert cursor.dropped == 3
+    assert cursor.latest() is None
+    # further than the capacity behind
+    push(ring, 4, 4 + 3 * CAPACITY)
+    assert cursor.latest()[1] == 1003 + 3 * CAPACITY
+    assert cursor.dropped == 3 + 3 * CAPACITY - 1
+
+
+def test_still_valid_until_slot_is_reused(ring):
+    cursor = frame_cursor(ring)
+    assert not cursor.still_valid()
+    push(ring, 0, 1)
+    view, _, _ = cursor.next(0)
+    push(ring, 1, CAPACITY)
+    assert cursor.still_valid() and view[0, 0] == 0
+    push(ring, CAPACITY, CAPACITY + 1)
+    assert not cursor.still_valid()
+    assert view[0, 0] == CAPACITY
+
+
+def test_copy_out_survives_overwrite(ring):
+    cursor = frame_cursor(ring)
+    push(ring, 0, 1)
+    out = np.empty((HEIGHT, WIDTH), np.uint16)
+    frame, _, _ = cursor.next(0, out=out)
+    assert frame is out
+    push(ring, 1, 2 * CAPACITY)
+    assert out[0, 0] == 0
+
+
+def test_attached_ring_reads_owner_frames():
+    # attached from another process, as the recorder and GUI do
+    reader = """
+import sys
+from shared_frames import frame_cursor, shared_frame_ring
+ring = shared_frame_ring.attach(sys.argv[1])
+cursor = frame_cursor(ring, from_start=True)
+frame, number, _ = cursor.next(1.0)
+print(ring.capacity, ring.shape[0], ring.shape[1], number, frame[0, 0],
+      cursor.dropped)
+ring.close()
+"""
+    owner = shared_frame_ring(CAPACITY, HEIGHT, WIDTH)
+    try:
+        push(owner, 0, CAPACITY + 2)
+        result = subprocess.run(
+            [sys.executable, '-c', reader, owner.name], cwd=PACKAGE,
+            stdout=subprocess.PIPE, check=True, universal_newlines=True)
+        assert result.stdout.split() == [
+            str(CAPACITY), str(HEIGHT), str(WIDTH), '1002', '2', '2']
+    finally:
+        owner.close()
+        owner.unlink()
+    # unlinking again is harmless
+    owner.unlink()
+
+
+def test_ring_counts_drops_only_for_its_own_reader(ring):
+    cursor = frame_cursor(ring)
+    push(ring, 0, 3 * CAPACITY)
+    assert cursor.next(0)[0][0, 0] == 2 * CAPACITY
+    # nobody reads the ring itself, so no frame of it was missed
+    assert ring.dropped == 0
+    assert ring.next(0)[0][0, 0] == 2 * CAPACITY
+    # seven unread, three more overwrite the two oldest
+    push(ring, 3 * CAPACITY, 3 * CAPACITY + 3)
+    assert ring.dropped == 2
+    assert ring.pending == CAPACITY
@@ -0,0 +1,269 @@
+import collections
+import math
+import os
+import pytest
+import storage
+
+usage = collections.namedtuple('usage', 'total used free')
+
+
+class fake_recorder(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.file_bytes = 0
+
+    def stats(self):
+        return {'file_bytes': self.file_bytes}
+
+
+class fake_disk(object):
+    """Replaces the clock and free space seen by storage."""
+
+    def __init__(self, monkeypatch, free):
+        self.now = 100.0
+        self.free = free
+        monkeypatch.setattr(storage.time, 'monotonic', lambda: self.now)
+        monkeypatch.setattr(storage.shutil, 'disk_usage',
+                            lambda directory: usage(10 ** 12, 0, self.free))
+
+    def write(self, recorders, seconds, rate):
+        """Let each recorder grow by `rate` bytes per second."""
+        self.now += seconds
+        for recorder in recorders:
+            recorder.file_bytes += int(rate * seconds)
+            self.free -= int(rate * seconds)
+
+
+@pytest.fixture
+def recorder(tmp_path):
+    return fake_recorder(str(tmp_path / 'recording.hdf5'))
+
+
+def test_forecast_follows_measured_rate(monkeypatch, recorder, tmp_path):
+    disk = fake_disk(monkeypatch, 10 ** 9)
+    budget = storage.storage_budget(time_constant=10.0)
+    budget.watch('cam', recorder, expected_rate=1e6)
+    assert budget.names == ['cam']
+    assert budget.forecast('cam') is None
+    budget.update()
+    forecast = budget.forecast('cam')
+    assert set(forecast) == {'directory', 'free_bytes', 'disk_bytes',
+                             'file_bytes', 'bytes_per_second',
+                             'filesystem_bytes_per_second', 'seconds_left',
+                             'deleted'}
+    assert forecast['directory'] == str(tmp_path)
+    assert forecast['bytes_per_second'] == pytest.approx(1e6)
+    assert forecast['seconds_left'] == pytest.approx(1000.0)
+    for _ in range(30):
+        disk.write([recorder], 1.0, 2e5)
+        budget.update()
+    forecast = budget.forecast('cam')
+    # 30 s at a 10 s time constant: 95 % of the way from 1e6 to 2e5
+    assert forecast['bytes_per_second'] == pytest.approx(
+        2e5 + 8e5 * math.exp(-3.0), rel=1e-6)
+    assert forecast['file_bytes'] == recorder.file_bytes == 6 * 10 ** 6
+    assert forecast['free_bytes'] == disk.free
+    assert forecast['disk_bytes'] == 10 ** 12
+    assert forecast['seconds_left'] == pytest.approx(
+        disk.free / forecast['bytes_per_second'])
+    # a copy, not the budget's own state
+    forecast['seconds_left'] = 0
+    assert budget.forecast()['cam']['seconds_left'] > 0
+
+
+def test_recorders_share_free_space(monkeypatch, tmp_path):
+    disk = fake_disk(monkeypatch, 10 ** 9)
+    first = fake_recorder(str(tmp_path / 'a.hdf5'))
+    second = fake_recorder(str(tmp_path / 'b.hdf5'))
+    budget = storage.storage_budget()
+    budget.watch('a', first, expected_rate=1e5)
+    budget.watch('b', second, expected_rate=3e5)
+    budget.update()
+    forecasts = budget.forecast()
+    for name in ('a', 'b'):
+        assert forecasts[name]['filesystem_bytes_per_second'] == \
+            pytest.approx(4e5)
+        assert forecasts[name]['seconds_left'] == pytest.approx(2500.0)
+    budget.unwatch('b')
+    assert budget.names == ['a']
+    assert set(budget.forecast()) == {'a'}
+    disk.write([first], 0.0, 0)
+    budget.update()
+    assert budget.forecast('a')['seconds_left'] == pytest.approx(1e4)
+
+
+def test_actions_in_order_and_once(monkeypatch, recorder):
+    rate = 1e6
+    # an hour of recording left
+    disk = fake_disk(monkeypatch, int(3600 * rate))
+    budget = storage.storage_budget(compress_seconds=1800, rotate_seconds=300,
+                                    stop_seconds=60)
+    budget.watch('cam', recorder, expected_rate=rate)
+    actions = []
+    while disk.free > 0:
+        actions.extend((action, budget.forecast('cam')['seconds_left'])
+                       for _, action in budget.update())
+        disk.write([recorder], 10.0, rate)
+    assert [action for action, _ in actions] == ['compress', 'rotate', 'stop']
+    assert 1790 <= actions[0][1] < 1800
+    assert 290 <= actions[1][1] < 300
+    assert 50 <= actions[2][1] < 60
+
+
+def test_only_last_crossed_action_is_returned(monkeypatch, recorder):
+    disk = fake_disk(monkeypatch, 10 ** 9)
+    budget = storage.storage_budget(compress_seconds=1800, rotate_seconds=300,
+                                    stop_seconds=None)
+    budget.watch('cam', recorder, expected_rate=1e6)
+    # 1000 s left is below the compress threshold only
+    assert budget.update() == [('cam', 'compress')]
+    # falling below rotate and stop (disabled) at once
+    disk.free = 10 ** 7
+    assert budget.update() == [('cam', 'rotate')]
+    disk.free = 0
+    assert budget.update() == []
+
+
+def test_rotation_keeps_rate_and_actions(monkeypatch, recorder, tmp_path):
+    disk = fake_disk(monkeypatch, 10 ** 9)
+    budget = storage.storage_budget(compress_seconds=1800)
+    budget.watch('cam', recorder, expected_rate=1e6)
+    assert budget.update() == [('cam', 'compress')]
+    disk.write([recorder], 5.0, 1e6)
+    budget.update()
+    rate = budget.forecast('cam')['bytes_per_second']
+    rotated = fake_recorder(str(tmp_path / 'recording_2.hdf5'))
+    budget.watch('cam', rotated)
+    disk.write([rotated], 5.0, 1e6)
+    assert budget.update() == []
+    assert budget.forecast('cam')['bytes_per_second'] == pytest.approx(rate)
+    assert budget.forecast('cam')['file_bytes'] == rotated.file_bytes
+
+
+def test_seconds_left(monkeypatch):
+    fake_disk(monkeypatch, 10 ** 6)
+    assert storage.seconds_left('.', 1000.0) == pytest.approx(1000.0)
+    assert storage.seconds_left('.', 0) == math.inf
+
+
+def test_compressed_layout():
+    assert storage.compressed_layout('raw', None) == ('delta', None)
+    assert storage.compressed_layout('delta', None) == ('delta', None)
+    assert storage.compressed_layout('stacked', 'gzip') == ('stacked', 'delta')
+    assert storage.compressed_layout('image', None) == ('stacked', 'delta')
+
+
+class file_recorder(object):
+    """Writes real bytes, so deleting its file frees them."""
+
+    def __init__(self, path):
+        self.path = path
+        self.closed = False
+        open(path, 'wb').close()
+
+    def write(self, nbytes):
+        with open(self.path, 'ab') as f:
+            f.write(b'\xff' * nbytes)
+
+    def stats(self):
+        return {'file_bytes': storage.file_bytes(self.path)}
+
+
+class directory_disk(object):
+    """A disk of `capacity` bytes holding only the files in `directory`."""
+
+    def __init__(self, monkeypatch, directory, capacity):
+        self.now = 100.0
+        monkeypatch.setattr(storage.time, 'monotonic', lambda: self.now)
+        monkeypatch.setattr(storage.shutil, 'disk_usage', lambda path: usage(
+            capacity, self.used(directory), capacity - self.used(directory)))
+
+    @staticmethod
+    def used(directory):
+        return sum(storage.file_bytes(os.path.join(directory, name))
+                   for name in os.listdir(directory))
+
+
+def test_rotation_deletes_oldest_closed_recordings(monkeypatch, tmp_path):
+    rate = 1000
+    directory = str(tmp_path)
+    disk = directory_disk(monkeypatch, directory, 400 * rate)
+    budget = storage.storage_budget(compress_seconds=0, rotate_seconds=100,
+                                    stop_seconds=20)
+    files = iter(os.path.join(directory, 'part_{0:02d}.HDF5'.format(i))
+                 for i in range(100))
+    recorder = file_recorder(next(files))
+    # a sidecar of the recording goes with it
+    open(recorder.path + '.rois.json', 'w').close()
+    budget.watch('cam', recorder, expected_rate=rate)
+    rotations = 0
+    deleted = []
+    for _ in range(300):
+        actions = budget.update()
+        deleted.extend(budget.forecast('cam')['deleted'])
+        assert ('cam', 'stop') not in actions
+        if ('cam', 'rotate') in actions:
+            rotations += 1
+            recorder.closed = True
+            recorder = file_recorder(next(files))
+            budget.watch('cam', recorder)
+        recorder.write(10 * rate)
+        disk.now += 10.0
+    # recorded 3000 s on a disk holding 400 s, deleting the oldest parts
+    # each rotation makes room by deleting the file before, oldest first
+    assert rotations >= 5
+    assert [os.path.basename(path) for path in deleted] == \
+        ['part_{0:02d}.HDF5'.format(i) for i in range(rotations)]
+    assert not os.path.exists(deleted[0] + '.rois.json')
+    assert os.path.exists(recorder.path)
+
+
+def test_rotation_waits_until_file_is_closed(monkeypatch, tmp_path):
+    directory = str(tmp_path)
+    disk = directory_disk(monkeypatch, directory, 10 ** 6)
+    budget = storage.storage_budget(compress_seconds=0, rotate_seconds=100,
+                                    stop_seconds=0)
+    first = file_recorder(os.path.join(directory, 'first.HDF5'))
+    first.write(95 * 10 ** 4)
+    budget.watch('cam', first, expected_rate=1000)
+    assert budget.update() == [('cam', 'rotate')]
+    second = file_recorder(os.path.join(directory, 'second.HDF5'))
+    budget.watch('cam', second)
+    disk.now += 1.0
+    budget.update()
+    # still being closed
+    assert os.path.exists(first.path)
+    first.closed = True
+    disk.now += 1.0
+    budget.update()
+    assert budget.forecast('cam')['deleted'] == [first.path]
+    assert not os.path.exists(first.path)
+
+
+def test_rotation_without_closed_files_goes_on_to_stop(monkeypatch,
+                                                       tmp_path):
+    directory = str(tmp_path)
+    disk = directory_disk(monkeypatch, directory, 10 ** 5)
+    budget = storage.storage_budget(compress_seconds=0, rotate_seconds=50,
+                                    stop_seconds=10)
+    recorder = file_recorder(os.path.join(directory, 'only.HDF5'))
+    budget.watch('cam', recorder, expected_rate=1000)
+    actions = []
+    for _ in range(100):
+        actions.extend(action for _, action in budget.update())
+        recorder.write(1000)
+        disk.now += 1.0
+    assert actions == ['rotate', 'stop']
+    assert os.path.exists(recorder.path)
+
+
+def test_expected_rate():
+    raw = 160 * 120 * 2 * 8.7
+    assert storage.expected_rate((120, 160), 8.7) == pytest.approx(raw)
+    assert storage.expected_rate((120, 160), 8.7, 'raw', 'gzip') == \
+        pytest.approx(raw)
+    assert storage.expected_rate((120, 160), 8.7, 'delta') == \
+        pytest.approx(raw / storage.COMPRESSION_RATIOS['delta'])
+    assert storage.expected_rate((60, 80), 9.0, 'stacked', 'gzip') == \
+        pytest.approx(80 * 60 * 2 * 9.0 / storage.COMPRESSION_RATIOS['gzip'])
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+import tone_map
+
+
+def test_stretch_levels():
+    frame = np.array([[100, 200], [300, 400]], np.uint16)
+    before = frame.copy()
+    out = tone_map.stretch(frame, 100, 400)
+    np.testing.assert_array_equal(out, [[0, 85], [170, 255]])
+    np.testing.assert_array_equal(frame, before)
+    # values outside the window are clipped, a flat window does not divide
+    # by zero
+    np.testing.assert_array_equal(tone_map.stretch(frame, 200, 300),
+                                  [[0, 0], [255, 255]])
+    assert tone_map.stretch(frame, 400, 400).max() == 0
+
+
+def test_buffers_are_reused(frames):
+    mapper = tone_map.tone_mapper()
+    first = mapper(frames[0])
+    assert mapper(frames[1]) is first
+    out = np.empty(frames.shape[1:], np.uint8)
+    assert mapper(frames[2], out) is out
+
+
+def test_modes(frames):
+    frame = frames[0]
+    np.testing.assert_array_equal(
+        tone_map.tone_mapper('minmax')(frame),
+        tone_map.stretch(frame, frame.min(), frame.max()))
+    fixed = tone_map.tone_mapper('fixed', window_k=(280.0, 320.0))
+    fixed(frame)
+    assert fixed.window == (28000.0, 32000.0)
+    percentile = tone_map.tone_mapper('percentile', percentiles=(5, 95))
+    percentile(frame)
+    low, high = np.percentile(frame, (5, 95), method='nearest')
+    assert percentile.window == pytest.approx((low, high), abs=1)
+    equalized = tone_map.tone_mapper('equalize')(frame)
+    assert equalized.max() == 255
+    with pytest.raises(ValueError):
+        tone_map.tone_mapper('gamma')
+
+
+def test_smoothing_follows_gradually(frames):
+    mapper = tone_map.tone_mapper(smoothing=0.5)
+    cold = np.full(frames.shape[1:], 29000, np.uint16)
+    cold[0, 0] = 30000
+    mapper(cold)
+    assert mapper.window == (29000.0, 30000.0)
+    mapper(cold + 1000)
+    assert mapper.window == (29500.0, 30500.0)
+    mapper.reset()
+    mapper(cold + 1000)
+    assert mapper.window == (30000.0, 31000.0)
@@ -154,6 +154,14 @@ class uvc_device_handle(Structure):
               ("streams", c_void_p),
               ("is_isight", c_ubyte)]
 
+class uvc_device_descriptor(Structure):
+  _fields_ = [("idVendor", c_uint16),
+              ("idProduct", c_uint16),
+              ("bcdUVC", c_uint16),
+              ("serialNumber", c_char_p),
+              ("manufacturer", c_char_p),
+              ("product", c_char_p)]
+
 class lep_oem_sw_version(Structure):
   _fields_ = [("gpp_major", c_ubyte),
               ("gpp_minor", c_ubyte),
@@ -294,6 +302,22 @@ def print_device_info(devh):
   call_extension_unit(devh, SYS_UNIT_ID, 3, flir_sn, 8)
   print("FLIR serial #: {0}".format(repr(flir_sn.raw)))
 
+def lepton_info(devh):
+  # firmware version, part and serial number of the Lepton as a dict
+  vers = lep_oem_sw_version()
+  call_extension_unit(devh, OEM_UNIT_ID, 9, byref(vers), 8)
+  flir_pn = create_string_buffer(32)
+  call_extension_unit(devh, OEM_UNIT_ID, 8, flir_pn, 32)
+  flir_sn = create_string_buffer(8)
+  call_extension_unit(devh, SYS_UNIT_ID, 3, flir_sn, 8)
+  return {
+    "firmware": "{0}.{1}.{2}/{3}.{4}.{5}".format(
+      vers.gpp_major, vers.gpp_minor, vers.gpp_build,
+      vers.dsp_major, vers.dsp_minor, vers.dsp_build),
+    "part_number": flir_pn.value.decode(errors="replace").strip(),
+    "serial": str(int.from_bytes(flir_sn.raw, "little")),
+  }
+
 def uvc_iter_formats(devh):
   p_format_desc = libuvc.uvc_get_format_descs(devh)
   while p_format_desc:
@@ -318,6 +342,26 @@ def uvc_get_frame_formats_by_guid(devh, vs_fmt_guid):
       return [fmt for fmt in uvc_iter_frames_for_format(devh, format_desc)]
   return []
 
+def uvc_list_serial_numbers(ctx, vid=PT_USB_VID, pid=PT_USB_PID):
+  # serial numbers of every attached device matching vid/pid
+  serials = []
+  dev_list = POINTER(POINTER(uvc_device))()
+  if libuvc.uvc_get_device_list(ctx, byref(dev_list)) < 0:
+    return serials
+  try:
+    i = 0
+    while dev_list[i]:
+      desc = POINTER(uvc_device_descriptor)()
+      if libuvc.uvc_get_device_descriptor(dev_list[i], byref(desc)) == 0:
+        if desc.contents.idVendor == vid and desc.contents.idProduct == pid:
+          serial = desc.contents.serialNumber
+          serials.append(serial.decode() if serial else "")
+        libuvc.uvc_free_device_descriptor(desc)
+      i += 1
+  finally:
+    libuvc.uvc_free_device_list(dev_list, 1)
+  return serials
+
 def set_manual_ffc(devh):
     sizeData = 32
     shutter_mode = (c_uint16)(0)